@@ -1,3 +1,5 @@
 """Модуль, осуществляющий работу с функционалом платёжных систем.
 
 Содержит модули для взаимодействия с API систем и сопроводительную логику для интеграции с ботом."""
+
+default_app_config = 'billing.apps.BillingConfig'
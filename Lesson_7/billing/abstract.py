@@ -1,6 +1,8 @@
-from typing import Dict, Any, TYPE_CHECKING
+from typing import Dict, Any, Optional, Tuple, TYPE_CHECKING
 from abc import ABC, abstractmethod
 
+from common.allowlist import IpAllowlist, client_ip
+
 if TYPE_CHECKING:
     from django.http import HttpRequest
 
@@ -8,6 +10,20 @@ if TYPE_CHECKING:
 class PaymentSystemClient(ABC):
     """Абстрактный интерфейс, описывающий поведение платёжной системы."""
 
+    # сети отправителей вебхуков (None - адрес не проверяется) и обязательные заголовки подписи
+    ip_allowlist: Optional[IpAllowlist] = None
+    signature_headers: Tuple[str, ...] = ()
+
+    @classmethod
+    def verify_request(cls, request: 'HttpRequest') -> bool:
+        """Быстрая проверка вебхука до чтения тела: адрес отправителя и наличие заголовков подписи.
+
+        Саму подпись проверяет verify."""
+
+        if cls.ip_allowlist is not None and client_ip(request) not in cls.ip_allowlist:
+            return False
+        return all(request.headers.get(header) for header in cls.signature_headers)
+
     @abstractmethod
     def check_out(self, order_id: int, product_id: int) -> str:
         pass
@@ -1,5 +1,18 @@
+import logging
+
 from django.apps import AppConfig
 
 
+logger = logging.getLogger('root')
+
+
 class BillingConfig(AppConfig):
     name = 'billing'
+
+    def ready(self) -> None:
+        from .constants import PAYPAL_API_URL, PAYPAL_CERT_CA_FILE, PAYPAL_WEBHOOK_SIMULATOR
+        if PAYPAL_WEBHOOK_SIMULATOR:
+            logger.warning(f'PayPal webhook signatures are checked against PAYPAL_CERT_CA_FILE={PAYPAL_CERT_CA_FILE} '
+                           f'with certificates from PAYPAL_API_URL={PAYPAL_API_URL}, not the PayPal certificate chain')
+        elif PAYPAL_CERT_CA_FILE:
+            logger.warning('PAYPAL_CERT_CA_FILE is ignored because PAYPAL_WEBHOOK_SIMULATOR is off')
@@ -13,6 +13,19 @@ STRIPE_PUBLIC_KEY = os.getenv("STRIPE_PUBLIC_KEY")
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_WHSEC_KEY = os.getenv("STRIPE_WHSEC_KEY")
 
+# сети, с которых платёжные системы присылают вебхуки; пустое значение отключает проверку адреса
+PAYPAL_IP_POOL = os.getenv("PAYPAL_IP_POOL", "")
+STRIPE_IP_POOL = os.getenv("STRIPE_IP_POOL", "")
+
+# адреса АПИ платёжных систем; пустое значение - sandbox PayPal и АПИ Stripe, для util/payment_simulator.py - симулятор
+PAYPAL_API_URL = os.getenv("PAYPAL_API_URL", "")
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "")
+# сертификат УЦ, которому доверяет проверка подписи вебхуков PayPal вместо цепочки PayPal (симулятор)
+PAYPAL_CERT_CA_FILE = os.getenv("PAYPAL_CERT_CA_FILE", "")
+# 1 - вебхуки PayPal присылает util/payment_simulator.py: подпись проверяется УЦ из PAYPAL_CERT_CA_FILE,
+# а сертификат подписи загружается только с PAYPAL_API_URL; в рабочем окружении не задаётся
+PAYPAL_WEBHOOK_SIMULATOR = os.getenv("PAYPAL_WEBHOOK_SIMULATOR", "0") == "1"
+
 
 class PaypalOrderStatus(Enum):
     CREATED = 'CREATED'
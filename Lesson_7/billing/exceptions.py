@@ -9,3 +9,10 @@ class UpdateCompletedCheckoutError(Exception):
             f'Trying to update a completed checkout #{pk} from: {system}, id: {tracking_id}\n'
             f' with status "{new_status}"'
         )
+
+
+class CheckoutNotFoundError(Exception):
+    """Возникает, когда платёжная система сообщает о захвате средств, идентификатор которого ещё не сохранён."""
+
+    def __init__(self, system: str, capture_id: str) -> None:
+        super().__init__(f'No checkout with capture id {capture_id} from: {system}')
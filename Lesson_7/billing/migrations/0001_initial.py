@@ -0,0 +1,34 @@
+# Generated by Django 3.1.2 on 2026-10-18 11:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('shop', '0002_category_path'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Checkout',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('system', models.IntegerField(choices=[(0, 'Paypal'), (1, 'Stripe'), (2, 'Click'), (3, 'Paymo')], verbose_name='Billing system')),
+                ('tracking_id', models.CharField(max_length=255, verbose_name='Tracking id')),
+                ('capture_id', models.CharField(blank=True, max_length=255, null=True, verbose_name='Capture id')),
+                ('status', models.CharField(blank=True, max_length=200, null=True, verbose_name='Status')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='shop.order', verbose_name='Order')),
+            ],
+            options={
+                'verbose_name': 'Checkout',
+                'verbose_name_plural': 'Checkouts',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -4,7 +4,7 @@ from typing import Dict, Any
 
 from django.http import HttpRequest
 
-from paypalcheckoutsdk.core import PayPalHttpClient, SandboxEnvironment
+from paypalcheckoutsdk.core import PayPalEnvironment, PayPalHttpClient, SandboxEnvironment
 from paypalcheckoutsdk.orders import OrdersCreateRequest
 from paypalcheckoutsdk.orders import OrdersCaptureRequest
 from paypalhttp import HttpError
@@ -13,11 +13,15 @@ from paypalrestsdk.notifications import WebhookEvent
 from bot.notify import send_payment_completed
 from shop.models import Product
 from billing.constants import Currency, PaypalIntent, PaypalShippingPreference, PaypalUserAction, PaypalGoodsCategory, \
-    PaypalOrderStatus, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_WEBHOOK_ID
+    PaypalOrderStatus, PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_WEBHOOK_ID, PAYPAL_IP_POOL, PAYPAL_API_URL, \
+    PAYPAL_WEBHOOK_SIMULATOR
+from common.allowlist import IpAllowlist
 from common.constants import PaymentSystem
+from common.serializers import SerializerRegistry
 from .paypal_entities import PaypalCheckout
+from .signature import CertificateVerifier, cert_url_allowed
 from billing.abstract import PaymentSystemClient
-from billing.exceptions import UpdateCompletedCheckoutError
+from billing.exceptions import CheckoutNotFoundError, UpdateCompletedCheckoutError
 from billing.models import Checkout
 from common.strings import PayPalStrings
 
@@ -31,12 +35,18 @@ class PaypalClient(PaymentSystemClient):
     Содержит методы для инициализации сессии и обработки платежей в виде PayPal Checkout -
     выписки, захвата, верификации и завершения Checkout."""
     _link_pattern = PayPalStrings.LINK_PATTERN.value
+    ip_allowlist = IpAllowlist.parse(PAYPAL_IP_POOL) if PAYPAL_IP_POOL.strip() else None
+    signature_headers = ('Paypal-Transmission-Id', 'Paypal-Transmission-Time', 'Paypal-Transmission-Sig',
+                         'Paypal-Cert-Url', 'Paypal-Auth-Algo')
 
     def __init__(self) -> None:
         """Инициализирует сессию работы с системой PayPal."""
 
         # Creating an environment
-        environment = SandboxEnvironment(client_id=PAYPAL_CLIENT_ID, client_secret=PAYPAL_CLIENT_SECRET)
+        if PAYPAL_API_URL:
+            environment = PayPalEnvironment(PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET, PAYPAL_API_URL, PAYPAL_API_URL)
+        else:
+            environment = SandboxEnvironment(client_id=PAYPAL_CLIENT_ID, client_secret=PAYPAL_CLIENT_SECRET)
         self.client = PayPalHttpClient(environment)
         self.process_notification = {  # todo should this be here?
             PayPalStrings.WEBHOOK_APPROVED.value: self.capture,
@@ -44,11 +54,16 @@ class PaypalClient(PaymentSystemClient):
         }
 
     def fulfill(self, wh_data: Dict[str, Any]) -> None:
-        """Завершает заказ, уведомляет клиента."""
+        """Завершает заказ, уведомляет клиента.
+
+        Вебхук о захвате может прийти раньше, чем capture() сохранит его идентификатор, - тогда возникает
+        CheckoutNotFoundError, и вебхук отклоняется, чтобы PayPal прислал его повторно."""
 
         capture_id = wh_data['resource']['id']
         try:
             checkout = Checkout.objects.fulfill_checkout(capture_id)
+            if checkout is None:
+                raise CheckoutNotFoundError(PaymentSystem.PAYPAL.value, capture_id)
             send_payment_completed(checkout)
         except UpdateCompletedCheckoutError as e:
             print(e)
@@ -67,6 +82,15 @@ class PaypalClient(PaymentSystemClient):
         webhook_id = PAYPAL_WEBHOOK_ID
         cert_url = h['Paypal-Cert-Url']
         auth_algo = h['PayPal-Auth-Algo']
+        if PAYPAL_WEBHOOK_SIMULATOR:
+            # сертификат выпущен не PayPal, а УЦ из PAYPAL_CERT_CA_FILE (симулятор util/payment_simulator.py)
+            # и загружается только с PAYPAL_API_URL
+            return CertificateVerifier().verify(transmission_id, timestamp, webhook_id or '', request.body, cert_url,
+                                                actual_sig, auth_algo)
+        if not cert_url_allowed(cert_url):
+            # SDK загружает сертификат по адресу из заголовка без проверки хоста
+            logger.error(f'PayPal certificate URL is not allowed: {cert_url}')
+            return False
         if WebhookEvent.verify(
                 transmission_id,
                 timestamp,
@@ -121,11 +145,11 @@ class PaypalClient(PaymentSystemClient):
     def _initiate_payment_system_checkout(self, checkout_data: Dict[str, Any]) -> str:
         """Создаёт чекаут в системе PayPal, возвращает его id."""
 
-        pp_capture = PaypalCheckout.Schema().load(checkout_data)
+        pp_capture = SerializerRegistry().load(PaypalCheckout, checkout_data)
 
         request = OrdersCreateRequest()
         request.prefer('return=representation')
-        request.request_body(pp_capture.Schema().dump(pp_capture))
+        request.request_body(SerializerRegistry().dump(pp_capture))
 
         tracking_id: str = ''
         try:
@@ -0,0 +1,126 @@
+"""Модуль проверки подписи вебхуков PayPal сертификатом, выпущенным заданным УЦ.
+
+Повторяет проверку paypalrestsdk.notifications.WebhookEvent.verify, но доверяет сертификату УЦ
+из PAYPAL_CERT_CA_FILE вместо цепочки DigiCert, которую поставляет SDK. Так вебхуки симулятора
+util/payment_simulator.py проходят ту же проверку подписи, что и вебхуки PayPal: сертификат
+подписан УЦ, выдан на имя в домене paypal.com и действителен, а подпись RSA-SHA256 строки
+transmission_id|timestamp|webhook_id|crc32(тела) совпадает. Загруженные сертификаты кэшируются по адресу.
+
+Адрес сертификата приходит в заголовке вебхука, поэтому загружается он только с хостов PayPal
+или с адреса симулятора (cert_url_allowed)."""
+
+import binascii
+import logging
+from base64 import b64decode
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlsplit
+
+import requests
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+from billing.constants import PAYPAL_API_URL, PAYPAL_CERT_CA_FILE
+from common.cache import LRUCache
+from patterns.singleton import Singleton
+
+
+logger = logging.getLogger('root')
+
+AUTH_ALGORITHMS = {'SHA256withRSA': hashes.SHA256, 'sha256': hashes.SHA256}
+PAYPAL_CERT_DOMAIN = '.paypal.com'
+# PayPal подписывает вебхуки несколькими сертификатами, а ротирует их редко
+CERT_CACHE_SIZE = 32
+
+
+def cert_url_allowed(cert_url: str, origin: str = '') -> bool:
+    """Проверяет, что сертификат подписи загружается с хоста PayPal по HTTPS.
+
+    Если задан origin (адрес симулятора), допускается только он: схема, хост и порт должны совпасть."""
+
+    try:
+        url = urlsplit(cert_url)
+        if origin:
+            expected = urlsplit(origin)
+            return (url.scheme, url.hostname, url.port) == (expected.scheme, expected.hostname, expected.port)
+        return url.scheme == 'https' and url.port in (None, 443) and \
+            (url.hostname or '').endswith(PAYPAL_CERT_DOMAIN)
+    except ValueError:
+        return False
+
+
+def expected_message(transmission_id: str, timestamp: str, webhook_id: str, body: bytes) -> bytes:
+    """Строка, которую PayPal подписывает для вебхука."""
+
+    return f'{transmission_id}|{timestamp}|{webhook_id}|{binascii.crc32(body) & 0xffffffff}'.encode('utf-8')
+
+
+def valid_now(cert: x509.Certificate) -> bool:
+    # cryptography 42+ отдаёт время с часовым поясом в not_valid_*_utc, прежние версии - только наивное время UTC
+    if hasattr(cert, 'not_valid_after_utc'):
+        return bool(cert.not_valid_before_utc <= datetime.now(timezone.utc) <= cert.not_valid_after_utc)
+    return bool(cert.not_valid_before <= datetime.utcnow() <= cert.not_valid_after)
+
+
+class CertificateVerifier(metaclass=Singleton):
+    """Проверяет подписи вебхуков сертификатами, выпущенными одним УЦ и загруженными с адреса origin."""
+
+    def __init__(self, ca_file: str = PAYPAL_CERT_CA_FILE, origin: str = PAYPAL_API_URL) -> None:
+        with open(ca_file, 'rb') as f:
+            self.ca = x509.load_pem_x509_certificate(f.read(), default_backend())
+        ca_key = self.ca.public_key()
+        if not isinstance(ca_key, rsa.RSAPublicKey):
+            raise ValueError(f'RSA certificate expected in {ca_file}')
+        self._ca_key = ca_key
+        self.origin = origin
+        self._certificates: LRUCache[str, x509.Certificate] = LRUCache(CERT_CACHE_SIZE)
+
+    def certificate(self, cert_url: str) -> Optional[x509.Certificate]:
+        """Загружает сертификат по адресу из заголовка Paypal-Cert-Url и проверяет, что его выпустил УЦ."""
+
+        if not self.origin or not cert_url_allowed(cert_url, self.origin):
+            logger.error(f'PayPal certificate URL is not allowed: {cert_url}')
+            return None
+        cached = self._certificates.get(cert_url)
+        if cached is not None:
+            return cached
+        try:
+            response = requests.get(cert_url, timeout=5)
+            response.raise_for_status()
+            cert = x509.load_pem_x509_certificate(response.content, default_backend())
+            if cert.signature_hash_algorithm is None:
+                raise ValueError('unsupported signature algorithm')
+            self._ca_key.verify(cert.signature, cert.tbs_certificate_bytes, padding.PKCS1v15(),
+                                cert.signature_hash_algorithm)
+        except (requests.RequestException, ValueError, InvalidSignature) as e:
+            logger.error(f'PayPal certificate rejected: {cert_url} -> {e!r}')
+            return None
+        names = cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+        if not names or not str(names[0].value).lower().endswith('.paypal.com'):
+            logger.error(f'PayPal certificate has unexpected common name: {cert_url}')
+            return None
+        self._certificates.set(cert_url, cert)
+        return cert
+
+    def verify(self, transmission_id: str, timestamp: str, webhook_id: str, body: bytes, cert_url: str,
+               signature: str, auth_algo: str) -> bool:
+        algorithm = AUTH_ALGORITHMS.get(auth_algo)
+        cert = self.certificate(cert_url)
+        if algorithm is None or cert is None:
+            return False
+        key = cert.public_key()
+        if not isinstance(key, rsa.RSAPublicKey):
+            return False
+        if not valid_now(cert):
+            logger.error(f'PayPal certificate expired: {cert_url}')
+            return False
+        message = expected_message(transmission_id, timestamp, webhook_id, body)
+        try:
+            key.verify(b64decode(signature), message, padding.PKCS1v15(), algorithm())
+        except (InvalidSignature, ValueError):
+            return False
+        return True
@@ -9,8 +9,10 @@ from billing.stripe.stripe_entities import StripeCheckout
 from bot.notify import send_payment_completed
 from shop.models import Product
 from billing.constants import StripePaymentMethod, StripeCurrency, StripeMode, STRIPE_SECRET_KEY, STRIPE_WHSEC_KEY, \
-    SITE_HTTPS_URL
+    SITE_HTTPS_URL, STRIPE_IP_POOL, STRIPE_API_BASE
+from common.allowlist import IpAllowlist
 from common.constants import PaymentSystem
+from common.serializers import SerializerRegistry
 from billing.abstract import PaymentSystemClient
 from common.strings import StripeStrings
 
@@ -25,11 +27,15 @@ class StripeClient(PaymentSystemClient):
     выписки, захвата, верификации и завершения."""
 
     _link_pattern: str = StripeStrings.LINK_PATTERN.value
+    ip_allowlist = IpAllowlist.parse(STRIPE_IP_POOL) if STRIPE_IP_POOL.strip() else None
+    signature_headers = ('Stripe-Signature',)
 
     def __init__(self) -> None:
         """Инициирует сессию с системой Stripe."""
         self.client = stripe
         self.client.api_key = STRIPE_SECRET_KEY
+        if STRIPE_API_BASE:
+            self.client.api_base = STRIPE_API_BASE
 
     def check_out(self, order_id: int, product_id: int) -> str:
         """Создаёт Payment по параметрам заказа, возвращает соответствующий checkout_session.id"""
@@ -54,8 +60,8 @@ class StripeClient(PaymentSystemClient):
             'success_url': StripeStrings.LINK_SUCCESS.value.format(site=SITE_HTTPS_URL, order_id=order_id),
             'cancel_url': StripeStrings.LINK_CANCEL.value.format(site=SITE_HTTPS_URL, order_id=order_id),
         }
-        stripe_checkout = StripeCheckout.Schema().load(checkout_data)
-        checkout_session = self.client.checkout.Session.create(**stripe_checkout.Schema().dump(stripe_checkout))
+        stripe_checkout = SerializerRegistry().load(StripeCheckout, checkout_data)
+        checkout_session = self.client.checkout.Session.create(**SerializerRegistry().dump(stripe_checkout))
         Checkout.objects.make_checkout(PaymentSystem.STRIPE, checkout_session.id, order_id)
 
         approve_link = self._link_pattern.format(site=SITE_HTTPS_URL, session=checkout_session.id)
@@ -10,6 +10,7 @@ from django.views.decorators.csrf import csrf_exempt
 
 from billing.stripe.client import StripeClient
 from billing.paypal.client import PaypalClient
+from billing.exceptions import CheckoutNotFoundError
 from shop.models import Order
 from .constants import STRIPE_PUBLIC_KEY
 from common.strings import StripeStrings
@@ -22,14 +23,19 @@ logger = logging.getLogger('root')
 def paypal_webhook(request: HttpRequest) -> HttpResponse:
     """Обрабатывает входящие вебхуки со стороны PayPal и возвращает 200 ОК.
 
-    Проводит верификацию и передаёт клиенту paypal на дальнейшую обработку."""
+    Проводит верификацию и передаёт клиенту paypal на дальнейшую обработку. Если захват средств
+    ещё не сохранён, возвращает 404: PayPal повторяет вебхуки, на которые получил не 2xx."""
 
     pp_client = PaypalClient()
     obj = json.loads(request.body)
     logger.debug(f'Incoming paypal webhook: {obj}')
     if pp_client.verify(request):
         logger.debug(f'Verified a paypal webhook: {obj}')
-        pp_client.process_notification[obj['event_type']](obj)
+        try:
+            pp_client.process_notification[obj['event_type']](obj)
+        except CheckoutNotFoundError as e:
+            logger.warning(f'{e}, waiting for a retry')
+            return HttpResponse(status=404)
 
     return HttpResponse('OK')
 
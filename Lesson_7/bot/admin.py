@@ -1,6 +1,12 @@
+from typing import Tuple
+
 from django.contrib import admin
+from django.db.models.query import QuerySet
+from django.http import HttpRequest
 
-from .models import (Bot, BotUser, Chat, Message)
+from .constants import SEARCH_ADMIN_LIMIT
+from .models import (Bot, BotUser, Chat, Message, OutboxMessage)
+from .search import rank_messages
 
 
 @admin.register(Bot)
@@ -41,7 +47,9 @@ class BotUserAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
-    """Класс с настройками для работы с моделью Message в админке Django."""
+    """Класс с настройками для работы с моделью Message в админке Django.
+
+    Поиск по числу ищет по id сообщения, чата и пользователя, поиск по словам - по полнотекстовому индексу."""
 
     readonly_fields = (
         'created_at',
@@ -63,3 +71,19 @@ class MessageAdmin(admin.ModelAdmin):
         'chat_id__exact',
         'bot_user_id__exact',
     )
+
+    def get_search_results(self, request: HttpRequest, queryset: 'QuerySet[Message]',
+                           search_term: str) -> Tuple['QuerySet[Message]', bool]:
+        if not search_term or search_term.strip().isdigit():
+            return super().get_search_results(request, queryset, search_term)
+        rows = rank_messages(search_term, 0, SEARCH_ADMIN_LIMIT)
+        return queryset.filter(pk__in=[pk for pk, _, _ in rows]), False
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    """Класс с настройками для просмотра очереди исходящих сообщений в админке Django."""
+
+    readonly_fields = ('message', 'bot', 'payload', 'claimed_by', 'claimed_until', 'created_at')
+    list_display = ('message', 'bot', 'claimed_by', 'claimed_until', 'created_at')
+    list_filter = ('bot',)
@@ -1,5 +1,6 @@
 import logging
 from django.apps import AppConfig
+from django.conf import settings
 from apscheduler.schedulers.background import BackgroundScheduler
 from pathlib import Path
 from dotenv import load_dotenv
@@ -30,10 +31,14 @@ class BotConfig(AppConfig):
 
     def ready(self) -> None:
         logger.info('Executing botconfig ready()')
+        from . import signals  # noqa: F401
+        from common.serializers import SerializerRegistry
         project_folder = Path(__file__).parent.parent.absolute()
         load_dotenv(project_folder.parent.joinpath('.env'))
         logger.info('Environment ready')
-        scheduler = BackgroundScheduler()
+        SerializerRegistry().warm_up()
+        # часовой пояс из настроек: локальный пояс системы APScheduler 3.6 принимает только в виде pytz
+        scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
         SingletonAPS().set_aps(scheduler)
         if not scheduler.running:
             scheduler.start()
@@ -0,0 +1,176 @@
+"""Модуль архива сообщений.
+
+Сообщения старше ARCHIVE_AFTER_DAYS дней переносятся из таблицы bot_message в сжатые файлы-сегменты.
+Сегмент пишется один раз и больше не изменяется: каждый запуск переноса создаёт новые сегменты.
+Внутри сегмента сообщения каждого чата сжаты отдельным gzip-потоком (блоком), положение блока хранится
+в таблице ArchivedChatBlock - это небольшой индекс по чатам, по которому история чата читается
+без распаковки чужих блоков. Файл сегмента записывается и синхронизируется на диск до удаления
+сообщений из таблицы, поэтому при сбое сообщения остаются в таблице, а не теряются.
+Архивные сообщения не индексируются для поиска: удаление строк убирает их и из индекса bot/search.py."""
+
+import gzip
+import itertools
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from common.cache import LRUCache
+from patterns.singleton import Singleton
+from .constants import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_CACHE_SIZE, ARCHIVE_DIR
+from .models import ArchivedChatBlock, Message
+from .pagination import Cursor
+
+
+logger = logging.getLogger('root')
+
+ARCHIVE_FIELDS = (
+    'id', 'bot_id', 'bot_user_id', 'chat_id', 'status', 'direction', 'content_type', 'id_in_messenger',
+    'reply_id_in_messenger', 'ts_in_messenger', 'text', 'image_url', 'file_url', 'video_url', 'language',
+    'created_at', 'updated_at',
+)
+DATETIME_FIELDS = ('ts_in_messenger', 'created_at', 'updated_at')
+
+
+class ArchiveConflictError(Exception):
+    """Часть сообщений пачки уже удалена другим процессом - пачка не переносится."""
+
+
+class ArchiveEncoder(DjangoJSONEncoder):
+    """Кодировщик строк сегмента: дата и время пишутся с микросекундами.
+
+    DjangoJSONEncoder оставляет только миллисекунды, а по (created_at, id) строятся курсоры истории чата."""
+
+    def default(self, o: Any) -> Any:
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class MessageArchive(metaclass=Singleton):
+    """Перенос сообщений в архив и чтение архивной истории чатов."""
+
+    def __init__(self, directory: str = ARCHIVE_DIR, cache_size: int = ARCHIVE_CACHE_SIZE) -> None:
+        self.directory = Path(directory)
+        self._blocks: LRUCache[int, List[Message]] = LRUCache(cache_size)
+        self._counters: Dict[str, int] = {'archived': 0, 'segments': 0, 'conflicts': 0, 'blocks_read': 0}
+
+    def archive(self, after_days: float = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+        """Переносит в архив сообщения старше after_days дней и возвращает их количество.
+
+        Сообщения, ожидающие отправки в OutboxMessage, и сообщения без чата остаются в таблице."""
+
+        cutoff = timezone.now() - timedelta(days=after_days)
+        total = 0
+        while True:
+            rows = list(
+                Message.objects.filter(created_at__lt=cutoff, chat__isnull=False, outbox__isnull=True)
+                .order_by('chat_id', 'created_at', 'pk')
+                .values(*ARCHIVE_FIELDS)[:batch_size]
+            )
+            if not rows:
+                break
+            try:
+                total += self._archive_batch(rows)
+            except ArchiveConflictError:
+                # сообщения переносит другой процесс
+                self._counters['conflicts'] += 1
+                logger.warning('Message archive batch conflicts with another archiver, stopping')
+                break
+            if len(rows) < batch_size:
+                break
+        logger.info(f'Messages archived: {total}')
+        return total
+
+    def _archive_batch(self, rows: List[Dict[str, Any]]) -> int:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f'messages-{timezone.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}.jsonl.gz'
+        path = self.directory / name
+        blocks: List[ArchivedChatBlock] = []
+        temporary = path.with_suffix('.tmp')
+        with open(temporary, 'wb') as segment:
+            for chat_id, group in itertools.groupby(rows, key=itemgetter('chat_id')):
+                messages = list(group)
+                lines = ''.join(json.dumps(row, cls=ArchiveEncoder, ensure_ascii=False) + '\n' for row in messages)
+                data = gzip.compress(lines.encode('utf-8'))
+                blocks.append(ArchivedChatBlock(
+                    chat_id=chat_id,
+                    segment=name,
+                    offset=segment.tell(),
+                    length=len(data),
+                    count=len(messages),
+                    first_created_at=messages[0]['created_at'],
+                    last_created_at=messages[-1]['created_at'],
+                ))
+                segment.write(data)
+            segment.flush()
+            os.fsync(segment.fileno())
+        os.replace(temporary, path)
+
+        ids = [row['id'] for row in rows]
+        try:
+            with transaction.atomic():
+                _, deleted = Message.objects.filter(pk__in=ids).delete()
+                if deleted.get(Message._meta.label, 0) != len(ids):
+                    raise ArchiveConflictError(name)
+                ArchivedChatBlock.objects.bulk_create(blocks)
+        except Exception:
+            # на сегмент не ссылается ни один блок, сообщения остались в таблице
+            path.unlink()
+            raise
+        self._counters['archived'] += len(ids)
+        self._counters['segments'] += 1
+        return len(ids)
+
+    def _read_rows(self, block: ArchivedChatBlock) -> List[Dict[str, Any]]:
+        with open(self.directory / block.segment, 'rb') as segment:
+            segment.seek(block.offset)
+            data = gzip.decompress(segment.read(block.length))
+        rows = [json.loads(line) for line in data.decode('utf-8').splitlines()]
+        for row in rows:
+            for field in DATETIME_FIELDS:
+                if row[field] is not None:
+                    row[field] = parse_datetime(row[field])
+        self._counters['blocks_read'] += 1
+        return rows
+
+    def _read_block(self, block: ArchivedChatBlock) -> List[Message]:
+        messages = self._blocks.get(block.pk)
+        if messages is None:
+            messages = [Message(**row) for row in self._read_rows(block)]
+            self._blocks.set(block.pk, messages)
+        return messages
+
+    def iter_rows(self, blocks: Iterable[ArchivedChatBlock]) -> Iterator[Dict[str, Any]]:
+        """Отдаёт поля архивных сообщений блоков по одному блоку, минуя кэш: в памяти не больше одного блока."""
+
+        for block in blocks:
+            yield from self._read_rows(block)
+
+    def chat_messages(self, chat_id: int, before: Optional[Cursor] = None,
+                      limit: Optional[int] = None) -> List[Message]:
+        """Возвращает архивные сообщения чата раньше курсора before от новых к старым, не больше limit.
+
+        Блоки читаются от новых к старым, пока набранных сообщений хватает на limit."""
+
+        found: List[Message] = []
+        for block in ArchivedChatBlock.objects.for_chat(chat_id, before):
+            if limit is not None and len(found) >= limit and block.last_created_at < found[limit - 1].created_at:
+                break
+            for message in self._read_block(block):
+                if before is None or (message.created_at, message.pk) < before:
+                    found.append(message)
+            found.sort(key=lambda message: (message.created_at, message.pk), reverse=True)
+        return found[:limit] if limit is not None else found
+
+    def stats(self) -> Dict[str, Any]:
+        return {'directory': str(self.directory), 'cache': self._blocks.stats(), **self._counters}
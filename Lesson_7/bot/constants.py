@@ -0,0 +1,78 @@
+"""Модуль с набором констант и параметров окружения, относящихся к работе бота."""
+
+import os
+from enum import Enum
+
+
+class IngestionMode(Enum):
+    """Режим обработки входящих вебхуков: синхронно во вью или через очередь воркеров."""
+
+    SYNC = 'sync'
+    QUEUE = 'queue'
+
+
+class ExportFormat(Enum):
+    """Формат выгрузки сообщений: JSON Lines или CSV."""
+
+    JSONL = 'jsonl'
+    CSV = 'csv'
+
+
+INGESTION_MODE = IngestionMode(os.getenv('BOT_INGESTION_MODE', IngestionMode.SYNC.value))
+INGESTION_WORKERS = int(os.getenv('BOT_INGESTION_WORKERS', '4'))
+INGESTION_QUEUE_SIZE = int(os.getenv('BOT_INGESTION_QUEUE_SIZE', '1000'))
+
+IDENTITY_CACHE_SIZE = int(os.getenv('BOT_IDENTITY_CACHE_SIZE', '10000'))
+IDENTITY_CACHE_TTL = float(os.getenv('BOT_IDENTITY_CACHE_TTL', '600'))
+
+# запускать ли в процессе веб-сервера (ecom_chatbot/wsgi.py) поток, отправляющий сообщения из OutboxMessage;
+# при 0 отправкой занимается отдельный процесс manage.py run_outbox
+OUTBOX_DRAINER = os.getenv('BOT_OUTBOX_DRAINER', '1') == '1'
+OUTBOX_BATCH_SIZE = int(os.getenv('BOT_OUTBOX_BATCH_SIZE', '100'))
+# как часто (секунды) таблица проверяется без явного сигнала о новых сообщениях
+OUTBOX_POLL_INTERVAL = float(os.getenv('BOT_OUTBOX_POLL_INTERVAL', '5'))
+# на сколько секунд процесс захватывает строки; захват продлевается при каждом проходе
+OUTBOX_LEASE = float(os.getenv('BOT_OUTBOX_LEASE', '60'))
+
+# сессии диалога: горячий слой в памяти процесса и срок жизни строки DialogSession в БД (секунды)
+SESSION_CACHE_SIZE = int(os.getenv('BOT_SESSION_CACHE_SIZE', '10000'))
+SESSION_CACHE_TTL = float(os.getenv('BOT_SESSION_CACHE_TTL', '60'))
+SESSION_TTL = float(os.getenv('BOT_SESSION_TTL', '86400'))
+# как часто (секунды) удаляются истёкшие строки DialogSession
+SESSION_PURGE_INTERVAL = float(os.getenv('BOT_SESSION_PURGE_INTERVAL', '3600'))
+
+# защита от повторной доставки вебхуков: ёмкость фильтра Блума одного поколения, доля ложных срабатываний
+# и срок хранения квитанций о принятых сообщениях (секунды)
+DEDUP_BLOOM_CAPACITY = int(os.getenv('BOT_DEDUP_BLOOM_CAPACITY', '100000'))
+DEDUP_BLOOM_ERROR_RATE = float(os.getenv('BOT_DEDUP_BLOOM_ERROR_RATE', '0.001'))
+DEDUP_RECEIPT_TTL = float(os.getenv('BOT_DEDUP_RECEIPT_TTL', '604800'))
+
+# размер страницы списка чатов и сообщений чата в операторском интерфейсе и JSON API, наибольший размер страницы
+CHAT_PAGE_SIZE = int(os.getenv('BOT_CHAT_PAGE_SIZE', '50'))
+MESSAGE_PAGE_SIZE = int(os.getenv('BOT_MESSAGE_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('BOT_MAX_PAGE_SIZE', '200'))
+
+# поток обновлений страницы чатов: период проверки новых сообщений других процессов и keep-alive (секунды),
+# время жизни одного соединения (секунды) и наибольшее количество сообщений в одном чтении
+LIVE_POLL_INTERVAL = float(os.getenv('BOT_LIVE_POLL_INTERVAL', '15'))
+LIVE_STREAM_TTL = float(os.getenv('BOT_LIVE_STREAM_TTL', '60'))
+LIVE_BATCH_SIZE = int(os.getenv('BOT_LIVE_BATCH_SIZE', '100'))
+# сколько id ниже курсора поток перечитывает: транзакции фиксируются не в порядке id, и сообщение
+# с меньшим id может появиться после уже отправленного
+LIVE_RECHECK_WINDOW = int(os.getenv('BOT_LIVE_RECHECK_WINDOW', '100'))
+
+# полнотекстовый поиск по сообщениям: размер страницы результатов и сколько лучших совпадений
+# отбирается для списка сообщений в админке
+SEARCH_PAGE_SIZE = int(os.getenv('BOT_SEARCH_PAGE_SIZE', '20'))
+SEARCH_ADMIN_LIMIT = int(os.getenv('BOT_SEARCH_ADMIN_LIMIT', '1000'))
+
+# архив сообщений: каталог файлов-сегментов, возраст переносимых сообщений (дни),
+# количество сообщений в одном сегменте и кэш прочитанных блоков
+ARCHIVE_DIR = os.getenv('BOT_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'archive'))
+ARCHIVE_AFTER_DAYS = float(os.getenv('BOT_ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('BOT_ARCHIVE_BATCH_SIZE', '900'))
+ARCHIVE_CACHE_SIZE = int(os.getenv('BOT_ARCHIVE_CACHE_SIZE', '100'))
+
+# выгрузка сообщений: сколько строк читается из БД за один запрос курсора и размер отдаваемых кусков (байты)
+EXPORT_CHUNK_SIZE = int(os.getenv('BOT_EXPORT_CHUNK_SIZE', '2000'))
+EXPORT_BUFFER_SIZE = int(os.getenv('BOT_EXPORT_BUFFER_SIZE', '65536'))
@@ -0,0 +1,118 @@
+"""Модуль защиты от повторной обработки входящих вебхуков.
+
+Платформы повторяют доставку вебхука, если не получили ответ вовремя, поэтому одно и то же сообщение
+может прийти несколько раз, в том числе в разные воркеры. Окончательное решение принимает уникальный
+индекс WebhookReceipt (bot, id_in_messenger), а фильтр Блума в памяти процесса позволяет не обращаться
+к БД для заведомо новых сообщений. Фильтр состоит из двух поколений: когда текущее заполняется,
+оно становится предыдущим, а предыдущее отбрасывается."""
+
+import logging
+import threading
+import time
+from typing import Any, Dict
+
+from common.bloom import BloomFilter
+from patterns.singleton import Singleton
+from .constants import DEDUP_BLOOM_CAPACITY, DEDUP_BLOOM_ERROR_RATE, DEDUP_RECEIPT_TTL
+from .models import WebhookReceipt
+
+
+logger = logging.getLogger('root')
+
+
+class DuplicateWebhookError(Exception):
+    """Сообщение с таким id уже было принято ботом."""
+
+
+class WebhookDeduplicator(metaclass=Singleton):
+    """Проверяет и запоминает пары (bot_id, message_id_in_messenger) принятых сообщений."""
+
+    def __init__(self,
+                 capacity: int = DEDUP_BLOOM_CAPACITY,
+                 error_rate: float = DEDUP_BLOOM_ERROR_RATE,
+                 receipt_ttl: float = DEDUP_RECEIPT_TTL) -> None:
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._receipt_ttl = receipt_ttl
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+        self._last_purge = time.monotonic()
+        self._counters: Dict[str, int] = {
+            'checked': 0,
+            'bloom_positives': 0,
+            'false_positives': 0,
+            'dropped_precheck': 0,
+            'dropped_index': 0,
+            'recorded': 0,
+            'rotations': 0,
+        }
+
+    @staticmethod
+    def _key(bot_id: int, message_id_in_messenger: str) -> str:
+        return f'{bot_id}:{message_id_in_messenger}'
+
+    def _seen(self, key: str) -> bool:
+        return key in self._current or key in self._previous
+
+    def is_duplicate(self, bot_id: int, message_id_in_messenger: str) -> bool:
+        """Быстрая проверка до начала обработки.
+
+        Если фильтр Блума не знает сообщение, запроса к БД нет; иначе выполняется один запрос
+        по уникальному индексу, чтобы отличить повтор от ложного срабатывания фильтра."""
+
+        key = self._key(bot_id, message_id_in_messenger)
+        self._counters['checked'] += 1
+        if not self._seen(key):
+            return False
+        self._counters['bloom_positives'] += 1
+        if WebhookReceipt.objects.is_recorded(bot_id, message_id_in_messenger):
+            self._counters['dropped_precheck'] += 1
+            return True
+        self._counters['false_positives'] += 1
+        return False
+
+    def record(self, bot_id: int, message_id_in_messenger: str) -> None:
+        """Сохраняет квитанцию о сообщении. Выбрасывает DuplicateWebhookError, если квитанция уже есть,
+        например, повтор одновременно принял другой воркер."""
+
+        key = self._key(bot_id, message_id_in_messenger)
+        recorded = WebhookReceipt.objects.record(bot_id, message_id_in_messenger)
+        self._remember(key)
+        if not recorded:
+            self._counters['dropped_index'] += 1
+            raise DuplicateWebhookError(key)
+        self._counters['recorded'] += 1
+        self._purge_expired()
+
+    def _remember(self, key: str) -> None:
+        with self._lock:
+            if self._current.is_full:
+                self._previous = self._current
+                self._current = BloomFilter(self._capacity, self._error_rate)
+                self._counters['rotations'] += 1
+        self._current.add(key)
+
+    def _purge_expired(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._last_purge < self._receipt_ttl / 100:
+                return
+            self._last_purge = time.monotonic()
+        deleted = WebhookReceipt.objects.delete_older_than(self._receipt_ttl)
+        logger.info(f'Expired webhook receipts deleted: {deleted}')
+
+    def clear(self) -> None:
+        """Очищает фильтр Блума. Квитанции в БД остаются."""
+
+        with self._lock:
+            self._current = BloomFilter(self._capacity, self._error_rate)
+            self._previous = BloomFilter(self._capacity, self._error_rate)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'bloom_size': self._current.count + self._previous.count,
+            'bloom_capacity': self._capacity,
+            'bloom_error_rate': self._error_rate,
+            'receipt_ttl': self._receipt_ttl,
+            **self._counters,
+        }
@@ -4,11 +4,16 @@ import logging
 
 from billing.common import PaymentClientFactory
 from common.builders import MessageDirector
-from common.constants import CallbackType
+from common.constants import CallbackType, DialogStates
 from common.entities import EventCommandReceived, Callback, EventCommandToSend
+from common.keyboards import KeyboardCache
+from common.serializers import SerializerRegistry
 from common.strings import DialogButtons, DialogPhrases
 
-from shop.models import Category, Product, Order
+from shop.catalog import Catalog
+from shop.models import Order
+from .models import Chat
+from .sessions import SessionData, SessionStore
 
 
 logger = logging.getLogger('root')
@@ -18,12 +23,24 @@ class Dialog:
     """Содержит логику взаимодействия бота с пользователем.
 
     Осуществляет диалог из нескольких этапов, предлагая выбрать категорию, товар, систему оплаты.
-    По итогу инициирует выставление счёта в соответствующей системе."""
+    По итогу инициирует выставление счёта в соответствующей системе.
+    Шаги меню строятся по снимку каталога и не обращаются к БД. Каждый шаг записывает в сессию чата
+    (SessionData) текущее состояние и выбранные категорию, товар или заказ."""
 
     callback: Callback
 
-    def reply(self, event: EventCommandReceived) -> Optional[EventCommandToSend]:
-        """Основной метод класса, формирует словарь-ответ на базе типа и параметров запроса в формате ECR."""
+    def __init__(self) -> None:
+        self.session = SessionData()
+
+    def reply(self, event: EventCommandReceived, session: Optional[SessionData] = None) -> Optional[EventCommandToSend]:
+        """Основной метод класса, формирует словарь-ответ на базе типа и параметров запроса в формате ECR.
+
+        Переданная сессия изменяется на месте, сохраняет её вызывающий код. Без сессии используется копия
+        из горячего слоя SessionStore."""
+
+        self.session = session if session is not None else SessionStore().cached(
+            event.bot_id, event.chat_id_in_messenger
+        )
 
         variants: Dict[CallbackType, Callable[[EventCommandReceived], EventCommandToSend]] = {
             CallbackType.GREETING: self.form_category_list,
@@ -38,7 +55,7 @@ class Dialog:
         if event.payload.command is not None:
             command: str = event.payload.command
             try:
-                self.callback = Callback.Schema().loads(command)
+                self.callback = SerializerRegistry().loads(Callback, command)
                 result = variants[self.callback.type](event)
             except JSONDecodeError as err:
                 logger.error(f'Dialog GREETING formed: {err.args}')
@@ -55,6 +72,7 @@ class Dialog:
     def _form_greeting(self, event: EventCommandReceived) -> EventCommandToSend:
         """Формирует приветствие пользователя при написании произвольного сообщения."""
 
+        self._enter(DialogStates.INITIAL)
         button_data: List[Dict[str, Any]] = [
             {
                 'title': DialogButtons.START_SESSION.value,
@@ -80,18 +98,21 @@ class Dialog:
     def form_category_list(self, event: EventCommandReceived) -> EventCommandToSend:
         """Собирает список категорий в виде данных для сообщения с соответствующими кнопками."""
 
+        self._enter(DialogStates.CATEGORY)
+        catalog = Catalog().get()
         button_data: List[Dict[str, Any]] = [
             {
-                'title': category['name'],
-                'id': category['id'],
+                'title': category.name,
+                'id': category.id,
                 'type': CallbackType.CATEGORY,
-            } for category in Category.objects.get_categories()][:10]
+            } for category in catalog.root_categories()[:10]]
 
         msg = MessageDirector().create_ects(
             bot_id=event.bot_id,
             chat_id_in_messenger=event.chat_id_in_messenger,
             text=DialogPhrases.CHOOSE_CATEGORY.value,
             button_data=button_data,
+            keyboard_key=KeyboardCache.make_key('categories', 0, event.lang_code, catalog.digest),
         )
 
         logger.debug(f'"BUTTONS: {button_data}"')
@@ -99,23 +120,54 @@ class Dialog:
         return msg
 
     def form_product_list(self, event: EventCommandReceived) -> EventCommandToSend:
-        """Собирает список продуктов категории в виде данных для сообщения с соответствующими кнопками."""
+        """Собирает список продуктов категории в виде данных для сообщения с соответствующими кнопками.
+
+        Если в категории нет собственных товаров, но есть подкатегории, предлагает выбрать подкатегорию."""
+
+        catalog = Catalog().get()
+        category = catalog.categories[self.callback.id]
+        self._enter(DialogStates.CATEGORY, category_id=category.id)
+        if not category.product_ids and category.child_ids:
+            return self.form_subcategory_list(event)
 
-        category = Category.objects.get_category_by_id(self.callback.id)
         button_data: List[Dict[str, Any]] = [
              {
-                 'title': product['name'],
-                 'id': product['id'],
+                 'title': product.name,
+                 'id': product.id,
                  'type': CallbackType.PRODUCT,
-             } for product in Product.objects.get_products(self.callback.id)][:10]
+             } for product in catalog.category_products(category.id)[:10]]
 
         msg = MessageDirector().create_ects(
             bot_id=event.bot_id,
             chat_id_in_messenger=event.chat_id_in_messenger,
             text=DialogPhrases.CHOOSE_PRODUCT.value.format(
-                category=category['name']
+                category=category.name
             ),
             button_data=button_data,
+            keyboard_key=KeyboardCache.make_key('products', category.id, event.lang_code, catalog.digest),
+        )
+
+        logger.debug(f'"BUTTONS: {button_data}"')
+
+        return msg
+
+    def form_subcategory_list(self, event: EventCommandReceived) -> EventCommandToSend:
+        """Собирает список подкатегорий выбранной категории в виде данных для сообщения с кнопками."""
+
+        catalog = Catalog().get()
+        button_data: List[Dict[str, Any]] = [
+            {
+                'title': category.name,
+                'id': category.id,
+                'type': CallbackType.CATEGORY,
+            } for category in catalog.child_categories(self.callback.id)[:10]]
+
+        msg = MessageDirector().create_ects(
+            bot_id=event.bot_id,
+            chat_id_in_messenger=event.chat_id_in_messenger,
+            text=DialogPhrases.CHOOSE_CATEGORY.value,
+            button_data=button_data,
+            keyboard_key=KeyboardCache.make_key('subcategories', self.callback.id, event.lang_code, catalog.digest),
         )
 
         logger.debug(f'"BUTTONS: {button_data}"')
@@ -125,11 +177,13 @@ class Dialog:
     def form_product_desc(self, event: EventCommandReceived) -> EventCommandToSend:
         """Формирует данные для описания выбранного товара с кнопкой 'Заказать'."""
 
-        product = Product.objects.get_product_by_id(self.callback.id)
+        catalog = Catalog().get()
+        product = catalog.products[self.callback.id]
+        self._enter(DialogStates.PRODUCT, category_id=self.session.category_id, product_id=product.id)
         text = DialogPhrases.ORDER_PRODUCT.value.format(
-            name=product['name'],
-            desc=product['description'][:400],
-            price=product['price'],
+            name=product.name,
+            desc=product.short_description,
+            price=product.price_text,
         )
         button_data: List[Dict[str, Any]] = [
             {
@@ -143,6 +197,7 @@ class Dialog:
             chat_id_in_messenger=event.chat_id_in_messenger,
             text=text,
             button_data=button_data,
+            keyboard_key=KeyboardCache.make_key('product', product.id, event.lang_code, catalog.digest),
         )
 
         logger.debug(f'"BUTTONS: {button_data}"')
@@ -152,9 +207,11 @@ class Dialog:
     def form_order_confirmation(self, event: EventCommandReceived) -> EventCommandToSend:
         """Формирует данные для сообщения с предложением выбрать платёжную систему для оплаты."""
 
-        product = Product.objects.get_product_by_id(self.callback.id)
+        catalog = Catalog().get()
+        product = catalog.products[self.callback.id]
+        self._enter(DialogStates.ORDER, category_id=self.session.category_id, product_id=product.id)
         text = DialogPhrases.ORDER_CONFIRM.value.format(
-                name=product["name"], price=product["price"]
+                name=product.name, price=product.price_text
                 )
         # todo где-то нужна метаинформация по списку систем
         button_data: List[Dict[str, Any]] = [
@@ -175,6 +232,7 @@ class Dialog:
             chat_id_in_messenger=event.chat_id_in_messenger,
             text=text,
             button_data=button_data,
+            keyboard_key=KeyboardCache.make_key('order', product.id, event.lang_code, catalog.digest),
         )
 
         logger.debug(f'"BUTTONS: {button_data}"')
@@ -182,12 +240,23 @@ class Dialog:
         return msg
 
     def make_order(self, event: EventCommandReceived) -> EventCommandToSend:
-        """Формирует заказ и готовит данные для сообщения со ссылкой для произведения оплаты пользователем."""
-
-        order = Order.objects.make_order(
-            event.chat_id_in_messenger,
-            event.bot_id,
-            self.callback.id,
+        """Формирует заказ и готовит данные для сообщения со ссылкой для произведения оплаты пользователем.
+
+        Чат берётся из сессии, цена - из строки товара в БД. Без сохранённого чата заказ не создаётся."""
+
+        if self.session.chat_id is None:
+            self.session.chat_id = Chat.objects.filter(
+                bot_id=event.bot_id, id_in_messenger=event.chat_id_in_messenger
+            ).values_list('pk', flat=True).first()
+        if self.session.chat_id is None:
+            raise Chat.DoesNotExist(f'Chat {event.bot_id}:{event.chat_id_in_messenger} is not stored')
+        product_id = self.callback.id
+        order = Order.objects.create_order(self.session.chat_id, product_id)
+        self._enter(
+            DialogStates[self.callback.type.name],
+            category_id=self.session.category_id,
+            product_id=product_id,
+            order_id=order.pk,
         )
         payment_client = PaymentClientFactory.create(self.callback.type.value)
         approve_link = payment_client.check_out(order.pk, self.callback.id)
@@ -201,3 +270,16 @@ class Dialog:
         )
 
         return msg
+
+    def _enter(self,
+               state: DialogStates,
+               category_id: Optional[int] = None,
+               product_id: Optional[int] = None,
+               order_id: Optional[int] = None) -> None:
+        """Переводит сессию в состояние state. Заказ, ожидающий оплаты, сохраняется до создания следующего."""
+
+        self.session.state = state
+        self.session.category_id = category_id
+        self.session.product_id = product_id
+        if order_id is not None:
+            self.session.order_id = order_id
@@ -0,0 +1,123 @@
+"""Модуль потоковой выгрузки сообщений в JSON Lines и CSV.
+
+Выгрузка не собирает сообщения в памяти: строки таблицы читаются итератором QuerySet.iterator пачками
+по EXPORT_CHUNK_SIZE (на PostgreSQL - серверным курсором), архивные сообщения - по одному блоку,
+а готовый текст сразу уходит потребителю кусками около EXPORT_BUFFER_SIZE байт, при необходимости
+сжатый потоковым gzip. Расход памяти не зависит от объёма выгрузки."""
+
+import csv
+import json
+import zlib
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .archive import MessageArchive
+from .constants import EXPORT_BUFFER_SIZE, EXPORT_CHUNK_SIZE, ExportFormat
+from .models import ArchivedChatBlock, Message
+
+
+EXPORT_FIELDS = (
+    'id', 'bot_id', 'chat_id', 'bot_user_id', 'direction', 'content_type', 'status', 'id_in_messenger',
+    'reply_id_in_messenger', 'ts_in_messenger', 'text', 'image_url', 'file_url', 'video_url', 'language',
+    'created_at',
+)
+CONTENT_TYPES = {ExportFormat.JSONL: 'application/x-ndjson', ExportFormat.CSV: 'text/csv'}
+
+_encoder = DjangoJSONEncoder()
+
+
+def parse_moment(value: str) -> datetime:
+    """Разбирает границу периода выгрузки: дату (начало суток) или дату и время в ISO 8601.
+
+    Время без часового пояса считается временем TIME_ZONE проекта."""
+
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Invalid date: {value}')
+        moment = datetime.combine(day, time())
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def export_rows(bot_id: Optional[int] = None,
+                chat_id: Optional[int] = None,
+                since: Optional[datetime] = None,
+                until: Optional[datetime] = None) -> Iterator[Dict[str, Any]]:
+    """Отдаёт поля сообщений бота bot_id и/или чата chat_id, сохранённых в [since, until).
+
+    Сначала идут архивные сообщения (по блокам, в порядке начала блока), затем сообщения из таблицы
+    по возрастанию времени."""
+
+    blocks = ArchivedChatBlock.objects.export(bot_id, chat_id, since, until).iterator()
+    for row in MessageArchive().iter_rows(blocks):
+        # блок попадает в выгрузку целиком, если пересекается с периодом, - лишние строки отбрасываются здесь
+        moment = row['created_at']
+        if (since is None or moment >= since) and (until is None or moment < until):
+            yield {field: row[field] for field in EXPORT_FIELDS}
+    messages = Message.objects.export(bot_id, chat_id, since, until).values(*EXPORT_FIELDS)
+    yield from messages.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _value(value: Any) -> Any:
+    return _encoder.default(value) if isinstance(value, (date, datetime)) else value
+
+
+class _Echo:
+    """Файлоподобный объект для csv.writer: возвращает записанную строку вместо записи."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def _lines(rows: Iterator[Dict[str, Any]], export_format: ExportFormat) -> Iterator[str]:
+    if export_format == ExportFormat.JSONL:
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+        return
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([_value(row[field]) for field in EXPORT_FIELDS])
+
+
+def _chunks(lines: Iterator[str], compress: bool, buffer_size: int) -> Iterator[bytes]:
+    # wbits=31 - поток в формате gzip (заголовок и контрольная сумма), который распаковывает gunzip
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = bytearray()
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer += compressor.compress(data) if compressor else data
+        if len(buffer) >= buffer_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if compressor:
+        buffer += compressor.flush()
+    if buffer:
+        yield bytes(buffer)
+
+
+def stream_export(export_format: ExportFormat = ExportFormat.JSONL,
+                  compress: bool = False,
+                  bot_id: Optional[int] = None,
+                  chat_id: Optional[int] = None,
+                  since: Optional[datetime] = None,
+                  until: Optional[datetime] = None,
+                  buffer_size: int = EXPORT_BUFFER_SIZE) -> Iterator[bytes]:
+    """Отдаёт выгрузку сообщений кусками байт, готовыми к записи в файл или в ответ StreamingHttpResponse."""
+
+    rows = export_rows(bot_id, chat_id, since, until)
+    return _chunks(_lines(rows, export_format), compress, buffer_size)
+
+
+def export_file_info(export_format: ExportFormat, compress: bool) -> Tuple[str, str]:
+    """Возвращает имя файла выгрузки и его Content-Type."""
+
+    name = f'messages-{timezone.now():%Y%m%d%H%M%S}.{export_format.value}'
+    if compress:
+        return f'{name}.gz', 'application/gzip'
+    return name, CONTENT_TYPES[export_format]
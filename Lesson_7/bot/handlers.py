@@ -1,11 +1,15 @@
+import dataclasses
 import logging
 from typing import Optional
 
-from marshmallow import ValidationError
+from django.db import transaction
 
 from common.entities import EventCommandReceived, EventCommandToSend
+from common.serializers import SerializerRegistry
+from .dedup import DuplicateWebhookError, WebhookDeduplicator
 from .dialog import Dialog
 from .models import Message
+from .sessions import SessionStore
 
 
 logger = logging.getLogger('root')
@@ -14,33 +18,60 @@ logger = logging.getLogger('root')
 def message_handler(event: EventCommandReceived) -> Optional[EventCommandToSend]:
     """Возвращает команду для отправки (ECTS) в ответ на принятую команду (ECR).
 
-    Передаёт полученные данные обработчику логики диалога и сохраняет входящие/исходящие сообщения."""
-
-    Message.objects.save_message(
-        event.bot_id,
-        event.chat_id_in_messenger,
-        event.chat_type,
-        event.payload.direction,
-        event.content_type,
-        event.user_id_in_messenger,
-        event.user_name_in_messenger,
-        str(event.payload.command),
-        event.message_id_in_messenger)
-    result: Optional[EventCommandToSend] = Dialog().reply(event)
+    Передаёт полученные данные и сессию чата обработчику логики диалога, сохраняет изменённую сессию
+    и входящие/исходящие сообщения, исходящее - вместе с командой на отправку в OutboxMessage.
+    Ответ формируется до транзакции: для оплаты диалог обращается к АПИ платёжной системы, и транзакция
+    записи не должна оставаться открытой на время этого запроса. Квитанция о принятом сообщении, входящее
+    сообщение, сессия и исходящее сообщение фиксируются одной короткой транзакцией, поэтому после ошибки
+    или падения процесса повторная доставка платформой обрабатывается заново, а не отбрасывается
+    как дубликат. Повторно доставленное платформой сообщение не обрабатывается, возвращается None."""
+
+    dedup = WebhookDeduplicator()
+    message_id = event.message_id_in_messenger
+    if message_id and dedup.is_duplicate(event.bot_id, message_id):
+        logger.info(f'Duplicate webhook dropped: {event.bot_id}:{message_id}')
+        return None
+    sessions = SessionStore()
+    try:
+        session = sessions.load(event.bot_id, event.chat_id_in_messenger)
+        previous = dataclasses.replace(session)
+        result: Optional[EventCommandToSend] = Dialog().reply(event, session)
+        with transaction.atomic():
+            if message_id:
+                dedup.record(event.bot_id, message_id)
+            received = Message.objects.save_message(
+                event.bot_id,
+                event.chat_id_in_messenger,
+                event.chat_type,
+                event.payload.direction,
+                event.content_type,
+                event.user_id_in_messenger,
+                event.user_name_in_messenger,
+                str(event.payload.command),
+                message_id)
+            if session.chat_id is None:
+                # первое сообщение чата: чат создан только что; ключ чата сам по себе не повод записывать сессию
+                session.chat_id = previous.chat_id = received.chat_id
+            if session != previous:
+                sessions.save(event.bot_id, event.chat_id_in_messenger, session)
+            if result:
+                # ответ отправит OutboxDrainer после фиксации транзакции
+                Message.objects.store_outgoing(
+                    result,
+                    event.chat_type,
+                    event.user_id_in_messenger,
+                    event.user_name_in_messenger,
+                )
+    except DuplicateWebhookError:
+        logger.info(f'Duplicate webhook dropped by index: {event.bot_id}:{message_id}')
+        return None
+    except Exception:
+        # транзакция откачена: горячий слой сессий не должен опережать БД
+        sessions.forget(event.bot_id, event.chat_id_in_messenger)
+        raise
     if result:
-        message = Message.objects.save_message(
-            result.bot_id,
-            result.chat_id_in_messenger,
-            event.chat_type,
-            result.payload.direction,
-            result.content_type,
-            event.user_id_in_messenger,
-            event.user_name_in_messenger,
-            result.payload.text,
-        )
-        result.message_id = message.pk
-        try:
-            result.Schema().validate(result.Schema().dump(result))
-        except ValidationError as err:
-            logger.error(f'Malformed ECTS in handler: {err.args}')
+        # validate() возвращает ошибки, а не выбрасывает исключение
+        errors = SerializerRegistry().validate(result)
+        if errors:
+            logger.error(f'Malformed ECTS in handler: {errors}')
     return result
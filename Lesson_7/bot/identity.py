@@ -0,0 +1,47 @@
+"""Модуль процессного кэша идентификаторов пользователей и чатов.
+
+Позволяет получать первичные ключи BotUser и Chat по идентификаторам в мессенджере без обращения к БД.
+Записи сбрасываются сигналами моделей и по истечении TTL - последнее нужно для изменений, сделанных
+в других процессах."""
+
+from typing import Any, Dict, Optional, Tuple
+
+from common.cache import LRUCache
+from patterns.singleton import Singleton
+from .constants import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+
+
+class IdentityCache(metaclass=Singleton):
+    """Кэш соответствий (bot_id, id в мессенджере) -> первичные ключи.
+
+    users: (bot_id, messenger_user_id) -> BotUser.pk
+    chats: (bot_id, chat_id_in_messenger) -> (Chat.pk, BotUser.pk)"""
+
+    def __init__(self, maxsize: int = IDENTITY_CACHE_SIZE, ttl: float = IDENTITY_CACHE_TTL) -> None:
+        self.users: LRUCache[Tuple[int, Optional[str]], int] = LRUCache(maxsize, ttl)
+        self.chats: LRUCache[Tuple[int, str], Tuple[int, int]] = LRUCache(maxsize, ttl)
+
+    def forget_user(self, user_id: int) -> None:
+        """Сбрасывает записи пользователя и его чата."""
+
+        self.users.delete_where(lambda key, value: value == user_id)
+        self.chats.delete_where(lambda key, value: value[1] == user_id)
+
+    def forget_chat(self, chat_id: int) -> None:
+        self.chats.delete_where(lambda key, value: value[0] == chat_id)
+
+    def forget(self, bot_id: int, chat_id_in_messenger: str, messenger_user_id: Optional[str]) -> None:
+        """Сбрасывает записи по идентификаторам в мессенджере, например после ошибки целостности."""
+
+        self.chats.delete((bot_id, chat_id_in_messenger))
+        self.users.delete((bot_id, messenger_user_id))
+
+    def clear(self) -> None:
+        self.users.clear()
+        self.chats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'users': self.users.stats(),
+            'chats': self.chats.stats(),
+        }
@@ -0,0 +1,141 @@
+"""Модуль асинхронного приёма входящих вебхуков.
+
+Вью только проверяет и ставит событие в очередь, после чего сразу отвечает платформе.
+Очереди разбиты на разделы по чату, поэтому сообщения одного чата обрабатываются строго по порядку."""
+
+import logging
+import queue
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Any, List
+
+from django.db import close_old_connections
+
+from clients.common import PlatformClientFactory
+from common.entities import EventCommandReceived
+from patterns.singleton import Singleton
+from .constants import INGESTION_WORKERS, INGESTION_QUEUE_SIZE, INGESTION_MODE
+from .handlers import message_handler
+
+
+logger = logging.getLogger('root')
+
+
+def process_event(bot_type: int, event: EventCommandReceived) -> None:
+    """Передаёт событие обработчику. Ответ сохраняется в OutboxMessage и отправляется OutboxDrainer.
+
+    Данные ответа для разбора следующего вебхука (команды кнопок Jivo) клиент платформы запоминает здесь,
+    в процессе, который принимает вебхуки, - OutboxDrainer может работать в отдельном процессе run_outbox."""
+
+    result = message_handler(event)
+    if result is not None:
+        PlatformClientFactory.create(bot_type).remember_reply(result)
+
+
+@dataclass
+class IngestionTask:
+    """Событие, ожидающее обработки в очереди раздела."""
+
+    bot_type: int
+    event: EventCommandReceived
+    enqueued_at: float
+
+
+class IngestionPool(metaclass=Singleton):
+    """Пул воркеров, разбирающих очереди входящих событий.
+
+    Каждому разделу соответствует своя очередь и свой поток, раздел выбирается по чату,
+    так что порядок сообщений внутри одного чата сохраняется."""
+
+    def __init__(self, workers: int = INGESTION_WORKERS, queue_size: int = INGESTION_QUEUE_SIZE) -> None:
+        self._partitions: List['queue.Queue[IngestionTask]'] = [
+            queue.Queue(maxsize=queue_size) for _ in range(max(workers, 1))
+        ]
+        self._processed: List[int] = [0] * len(self._partitions)
+        self._last_lag: List[float] = [0.0] * len(self._partitions)
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def partition_for(self, event: EventCommandReceived) -> int:
+        key = f'{event.bot_id}:{event.chat_id_in_messenger}'.encode('utf-8')
+        return zlib.crc32(key) % len(self._partitions)
+
+    def start(self) -> None:
+        """Запускает потоки воркеров, если они ещё не запущены."""
+
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(len(self._partitions)):
+                thread = threading.Thread(
+                    target=self._work,
+                    args=(number,),
+                    name=f'ingestion-{number}',
+                    daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f'Ingestion pool started with {len(self._threads)} workers')
+
+    def submit(self, bot_type: int, event: EventCommandReceived) -> bool:
+        """Ставит событие в очередь его раздела.
+
+        Возвращает False, если очередь раздела переполнена и событие не принято."""
+
+        self.start()
+        number = self.partition_for(event)
+        try:
+            self._partitions[number].put_nowait(IngestionTask(bot_type, event, time.monotonic()))
+        except queue.Full:
+            logger.error(f'Ingestion partition {number} is full, event rejected: {event.message_id_in_messenger}')
+            return False
+        return True
+
+    def _work(self, number: int) -> None:
+        partition = self._partitions[number]
+        while True:
+            task = partition.get()
+            self._last_lag[number] = time.monotonic() - task.enqueued_at
+            close_old_connections()
+            try:
+                process_event(task.bot_type, task.event)
+            except Exception as e:
+                logger.exception(f'Ingestion worker {number} failed: {e.args}')
+            finally:
+                self._processed[number] += 1
+                close_old_connections()
+                partition.task_done()
+
+    def join(self) -> None:
+        """Блокирует выполнение до тех пор, пока все очереди не будут разобраны."""
+
+        for partition in self._partitions:
+            partition.join()
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает глубину очередей и отставание по каждому разделу.
+
+        lag - сколько секунд ждёт самое старое событие раздела, last_lag - ожидание последнего взятого события."""
+
+        now = time.monotonic()
+        partitions: List[Dict[str, Any]] = []
+        for number, partition in enumerate(self._partitions):
+            with partition.mutex:
+                depth = len(partition.queue)
+                oldest = partition.queue[0].enqueued_at if depth else now
+            partitions.append({
+                'partition': number,
+                'depth': depth,
+                'lag': round(now - oldest, 3),
+                'last_lag': round(self._last_lag[number], 3),
+                'processed': self._processed[number],
+            })
+
+        return {
+            'mode': INGESTION_MODE.value,
+            'workers': len(self._threads),
+            'queue_depth': sum(p['depth'] for p in partitions),
+            'partitions': partitions,
+        }
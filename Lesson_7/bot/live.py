@@ -0,0 +1,103 @@
+"""Модуль обновления операторской страницы чатов в реальном времени.
+
+Сохранённые сообщения публикуются в MessageBroadcaster (сигнал post_save модели Message после фиксации
+транзакции), а открытые страницы получают их по потоку server-sent events. Каждый поток помнит курсор -
+id последнего отправленного сообщения - и по сигналу читает более новые строки одним запросом
+по первичному ключу. Транзакции фиксируются не в порядке выдачи id, поэтому чтение захватывает и окно
+из recheck_window id ниже курсора, а уже отправленные из него сообщения пропускаются. Сообщения, сохранённые
+другими процессами, поток подхватывает при периодической проверке, которая заодно служит keep-alive соединения."""
+
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from patterns.singleton import Singleton
+from .constants import LIVE_BATCH_SIZE, LIVE_POLL_INTERVAL, LIVE_RECHECK_WINDOW, LIVE_STREAM_TTL
+from .models import Message
+
+
+class MessageBroadcaster(metaclass=Singleton):
+    """Оповещает потоки операторских страниц о новых сообщениях."""
+
+    def __init__(self,
+                 poll_interval: float = LIVE_POLL_INTERVAL,
+                 stream_ttl: float = LIVE_STREAM_TTL,
+                 batch_size: int = LIVE_BATCH_SIZE,
+                 recheck_window: int = LIVE_RECHECK_WINDOW) -> None:
+        self._poll_interval = poll_interval
+        self._stream_ttl = stream_ttl
+        self._batch_size = batch_size
+        self._recheck_window = recheck_window
+        self._condition = threading.Condition()
+        self._last_id = 0
+        self._subscribers = 0
+        self._counters: Dict[str, int] = {'published': 0, 'batches': 0, 'messages': 0, 'late': 0, 'polls': 0}
+
+    def publish(self, message_id: int) -> None:
+        """Сообщает потокам, что сохранено сообщение message_id."""
+
+        with self._condition:
+            self._last_id = max(self._last_id, message_id)
+            self._counters['published'] += 1
+            self._condition.notify_all()
+
+    def _published(self) -> int:
+        with self._condition:
+            return self._counters['published']
+
+    def _wait(self, published: int) -> bool:
+        """Ждёт публикации после published-й (в том числе сообщения с id ниже курсора) не дольше poll_interval."""
+
+        with self._condition:
+            return self._condition.wait_for(lambda: self._counters['published'] > published, self._poll_interval)
+
+    def stream(self, cursor: int) -> Iterator[List[Message]]:
+        """Отдаёт пачки сообщений с id больше cursor по мере их сохранения.
+
+        Сообщение, зафиксированное позже сообщений с большими id, отдаётся, если его id не дальше recheck_window
+        от курсора. Сообщения окна, которые уже были в таблице при открытии потока, считаются отправленными.
+        Пустая пачка означает, что за poll_interval новых сообщений не было - потребитель отправляет keep-alive.
+        Поток завершается через stream_ttl секунд, чтобы не занимать воркер: EventSource переподключится
+        с тем же курсором (Last-Event-ID)."""
+
+        deadline = time.monotonic() + self._stream_ttl
+        sent: Set[int] = set(Message.objects.filter(
+            pk__gt=cursor - self._recheck_window, pk__lte=cursor
+        ).values_list('pk', flat=True))
+        with self._condition:
+            self._subscribers += 1
+        try:
+            while time.monotonic() < deadline:
+                published = self._published()
+                floor = cursor - self._recheck_window
+                sent = {pk for pk in sent if pk > floor}
+                rows = Message.objects.stream_after(floor, self._batch_size + len(sent))
+                batch = [message for message in rows if message.pk not in sent][:self._batch_size]
+                if batch:
+                    late = sum(message.pk < cursor for message in batch)
+                    sent.update(message.pk for message in batch)
+                    cursor = max(cursor, batch[-1].pk)
+                    with self._condition:
+                        self._counters['batches'] += 1
+                        self._counters['messages'] += len(batch)
+                        self._counters['late'] += late
+                    yield batch
+                    if len(batch) == self._batch_size:
+                        continue
+                if not self._wait(published):
+                    with self._condition:
+                        self._counters['polls'] += 1
+                    yield []
+        finally:
+            with self._condition:
+                self._subscribers -= 1
+
+    def latest_id(self) -> int:
+        """Возвращает курсор для нового потока, которому не нужна история."""
+
+        last_id: Optional[int] = Message.objects.order_by('-pk').values_list('pk', flat=True).first()
+        return last_id or 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            return {'subscribers': self._subscribers, 'last_id': self._last_id, **self._counters}
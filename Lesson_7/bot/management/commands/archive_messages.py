@@ -0,0 +1,21 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from bot.archive import MessageArchive
+from bot.constants import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Переносит старые сообщения из таблицы в сжатые файлы архива'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--older-than-days', type=float, default=ARCHIVE_AFTER_DAYS,
+                            help='Переносить сообщения старше указанного количества дней')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+                            help='Количество сообщений в одном файле-сегменте')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        archive = MessageArchive()
+        archived = archive.archive(options['older_than_days'], options['batch_size'])
+        self.stdout.write(f'Messages archived: {archived} ({archive.directory})')
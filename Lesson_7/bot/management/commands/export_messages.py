@@ -0,0 +1,40 @@
+import sys
+from typing import Any, BinaryIO, Iterable
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+
+from bot.constants import ExportFormat
+from bot.export import parse_moment, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Выгружает сообщения в JSON Lines или CSV, не загружая их в память'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--bot', type=int, help='id бота')
+        parser.add_argument('--chat', type=int, help='id чата')
+        parser.add_argument('--since', help='Начало периода: дата или дата и время ISO 8601')
+        parser.add_argument('--until', help='Конец периода (не включается): дата или дата и время ISO 8601')
+        parser.add_argument('--format', choices=[item.value for item in ExportFormat], default=ExportFormat.JSONL.value)
+        parser.add_argument('--gzip', action='store_true', help='Сжимать выгрузку gzip')
+        parser.add_argument('--output', default='-', help='Файл выгрузки, "-" - стандартный вывод')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        try:
+            since = parse_moment(options['since']) if options['since'] else None
+            until = parse_moment(options['until']) if options['until'] else None
+        except ValueError as e:
+            raise CommandError(e)
+        chunks = stream_export(ExportFormat(options['format']), options['gzip'], options['bot'], options['chat'],
+                               since, until)
+        if options['output'] == '-':
+            self._write(chunks, sys.stdout.buffer)
+        else:
+            with open(options['output'], 'wb') as output:
+                self._write(chunks, output)
+
+    @staticmethod
+    def _write(chunks: Iterable[bytes], output: BinaryIO) -> None:
+        for chunk in chunks:
+            output.write(chunk)
+        output.flush()
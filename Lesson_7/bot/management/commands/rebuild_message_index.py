@@ -0,0 +1,16 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from bot.search import create_index, drop_index
+
+
+class Command(BaseCommand):
+    help = 'Пересоздаёт полнотекстовый индекс сообщений и заполняет его заново'
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        with transaction.atomic():
+            drop_index(connection)
+            create_index(connection)
+        self.stdout.write(f'Message search index rebuilt ({connection.vendor})')
@@ -0,0 +1,28 @@
+import time
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from bot.outbox import OutboxDrainer
+from clients.delivery import DeliveryDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Отправляет сообщения из OutboxMessage в платформы, пока процесс не будет остановлен'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('--shutdown-timeout', type=float, default=10,
+                            help='Сколько секунд после остановки ждать отправки уже захваченных сообщений')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        drainer = OutboxDrainer()
+        drainer.start()
+        self.stdout.write(f'Outbox drainer running as {drainer.owner}')
+        try:
+            while True:
+                time.sleep(60)
+        except KeyboardInterrupt:
+            # незавершённые строки освободятся по истечении срока захвата
+            drainer.stop()
+            DeliveryDispatcher().join(options['shutdown_timeout'])
+            self.stdout.write(f'Outbox drainer stopped: {drainer.stats()}')
@@ -1,11 +1,27 @@
-from typing import Optional, TYPE_CHECKING
+from datetime import datetime, timedelta
+from typing import AbstractSet, Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Q
 from django.db.models.query import QuerySet
+from django.utils import timezone
 
 from common.constants import (ChatType, MessageDirection, MessageContentType, MessageStatus)
+from common.entities import EventCommandToSend
+from common.serializers import SerializerRegistry
+from .constants import CHAT_PAGE_SIZE, MESSAGE_PAGE_SIZE
+from .identity import IdentityCache
+from .pagination import Cursor, Page, make_page
 if TYPE_CHECKING:
-    from bot.models import (BotUser, Chat, Message)
+    from bot.models import (ArchivedChatBlock, BotUser, Chat, Message, OutboxMessage)
+
+
+class ChatUserConflictError(Exception):
+    """Пользователь бота уже привязан к другому чату: связь Chat.bot_user - один к одному."""
+
+    def __init__(self, bot_id: int, chat_id_in_messenger: str, user_id: int, other_chat: Optional[str]) -> None:
+        super().__init__(f'Bot user #{user_id} of bot {bot_id} already has chat {other_chat!r}, '
+                         f'cannot attach chat {chat_id_in_messenger!r}')
 
 
 class BotManager(models.Manager):
@@ -18,7 +34,7 @@ class BotManager(models.Manager):
         return self.get(bot_type=bot_type).id
 
     def get_bot_type_by_id(self, bot_id: int) -> int:
-        return self.get(bot_id=bot_id).bot_type
+        return self.get(id=bot_id).bot_type
 
 
 class BotUserManager(models.Manager):
@@ -29,8 +45,46 @@ class BotUserManager(models.Manager):
             user.save()
         return user
 
+    def upsert_user_id(self, bot_id: int, messenger_user_id: Optional[str], user_name: Optional[str]) -> int:
+        """Возвращает идентификатор пользователя, создавая его при отсутствии.
+
+        Вставка игнорирует конфликт по уникальному индексу, поэтому безопасна при гонке двух вебхуков.
+        Известные идентификаторы отдаются из IdentityCache без обращения к БД."""
+
+        cache = IdentityCache().users
+        user_id = cache.get((bot_id, messenger_user_id))
+        if user_id is not None:
+            return user_id
+
+        user_id = self.filter(bot_id=bot_id, messenger_user_id=messenger_user_id).values_list('pk', flat=True).first()
+        if user_id is None:
+            self.bulk_create(
+                [self.model(bot_id=bot_id, messenger_user_id=messenger_user_id, name=user_name)],
+                ignore_conflicts=True,
+            )
+            user_id = self.filter(bot_id=bot_id, messenger_user_id=messenger_user_id).values_list('pk', flat=True).get()
+        cache.set((bot_id, messenger_user_id), user_id)
+        return user_id
+
 
 class ChatManager(models.Manager):
+    def page(self, after: Optional[Cursor] = None, limit: int = CHAT_PAGE_SIZE) -> Page['Chat']:
+        """Возвращает страницу чатов в порядке убывания (last_message_time, id), начиная после курсора after.
+
+        Один запрос по индексу bot_chat_last_message_idx, имя пользователя читается в нём же через JOIN.
+        Чаты без сообщений идут в конце списка."""
+
+        chats = self.select_related('bot_user').only('id', 'last_message_time', 'last_message_text', 'bot_user__name')
+        if after is not None:
+            moment, pk = after
+            if moment is None:
+                chats = chats.filter(last_message_time__isnull=True, pk__lt=pk)
+            else:
+                chats = chats.filter(Q(last_message_time__lt=moment) | Q(last_message_time=moment, pk__lt=pk)
+                                     | Q(last_message_time__isnull=True))
+        rows = list(chats.order_by(F('last_message_time').desc(nulls_last=True), '-pk')[:limit + 1])
+        return make_page(rows, limit, lambda chat: (chat.last_message_time, chat.pk))
+
     def get_or_create_chat(self,
                            bot_id: int,
                            chat_id_in_messenger: str,
@@ -45,6 +99,55 @@ class ChatManager(models.Manager):
         )
         return chat
 
+    def upsert_chat_ids(self,
+                        bot_id: int,
+                        chat_id_in_messenger: str,
+                        chat_type: ChatType,
+                        messenger_user_id: Optional[str],
+                        user_name: Optional[str]) -> Tuple[int, int]:
+        """Возвращает идентификаторы чата и его пользователя, создавая их при отсутствии.
+
+        Для существующего чата обходится одним запросом, для закэшированного - ни одним. Если пользователь
+        уже привязан к другому чату этого бота, выбрасывает ChatUserConflictError."""
+
+        from .models import BotUser
+        cache = IdentityCache().chats
+        ids = cache.get((bot_id, chat_id_in_messenger))
+        if ids is not None:
+            return ids
+
+        row = self.filter(bot_id=bot_id, id_in_messenger=chat_id_in_messenger).values_list('pk', 'bot_user_id').first()
+        if row is not None and row[1] is not None:
+            cache.set((bot_id, chat_id_in_messenger), row)
+            return row
+
+        user_id = BotUser.objects.upsert_user_id(bot_id, messenger_user_id, user_name)
+        if row is None:
+            self.bulk_create(
+                [self.model(bot_id=bot_id, id_in_messenger=chat_id_in_messenger, type=chat_type.value,
+                            bot_user_id=user_id)],
+                ignore_conflicts=True,
+            )
+            # вставка пропускается и при конфликте по bot_user - тогда чата с этим id в мессенджере нет
+            chat_id = self.filter(
+                bot_id=bot_id, id_in_messenger=chat_id_in_messenger
+            ).values_list('pk', flat=True).first()
+            if chat_id is None:
+                raise self._user_conflict(bot_id, chat_id_in_messenger, user_id)
+        else:
+            chat_id = row[0]
+            try:
+                with transaction.atomic():
+                    self.filter(pk=chat_id, bot_user__isnull=True).update(bot_user_id=user_id)
+            except IntegrityError:
+                raise self._user_conflict(bot_id, chat_id_in_messenger, user_id)
+        cache.set((bot_id, chat_id_in_messenger), (chat_id, user_id))
+        return chat_id, user_id
+
+    def _user_conflict(self, bot_id: int, chat_id_in_messenger: str, user_id: int) -> ChatUserConflictError:
+        other_chat = self.filter(bot_user_id=user_id).values_list('id_in_messenger', flat=True).first()
+        return ChatUserConflictError(bot_id, chat_id_in_messenger, user_id, other_chat)
+
 
 class MessageManager(models.Manager):
     """Класс для управления моделью Message."""
@@ -59,37 +162,286 @@ class MessageManager(models.Manager):
                      user_name: Optional[str],
                      message_text: Optional[str] = '',
                      message_id_in_messenger: Optional[str] = '') -> 'Message':
-        """Сохраняет входящие/исходящие сообщения, обновляет соответствующие поля активности чатов."""
+        """Сохраняет входящие/исходящие сообщения, обновляет соответствующие поля активности чатов.
 
-        from .models import BotUser, Chat
-        # can't import the models at the top of the file because of a circular dependency
-        user = BotUser.objects.get_or_create_user(bot_id, messenger_user_id, user_name)
-        chat = Chat.objects.get_or_create_chat(bot_id, chat_id_in_messenger, chat_type, user)
-        message = self.create(
-            bot_id=bot_id,
-            bot_user=user,
-            chat=chat,
-            direction=message_direction.value,
-            content_type=message_content_type.value,
-            id_in_messenger=message_id_in_messenger,
-            text=message_text,
+        Оставлен для совместимости, вся работа выполняется в store_message."""
+
+        return self.store_message(
+            bot_id,
+            chat_id_in_messenger,
+            chat_type,
+            message_direction,
+            message_content_type,
+            messenger_user_id,
+            user_name,
+            message_text,
+            message_id_in_messenger,
         )
-        if message_direction == MessageDirection.RECEIVED:
-            message.status = MessageStatus.DELIVERED.value
-        message.save()
-        # save message in chat last message
-        chat.last_message_time = message.created_at
-        chat.last_message_text = message.text
-        chat.save()
+
+    def store_message(self,
+                      bot_id: int,
+                      chat_id_in_messenger: str,
+                      chat_type: ChatType,
+                      message_direction: MessageDirection,
+                      message_content_type: MessageContentType,
+                      messenger_user_id: Optional[str],
+                      user_name: Optional[str],
+                      message_text: Optional[str] = '',
+                      message_id_in_messenger: Optional[str] = '') -> 'Message':
+        """Сохраняет сообщение одной транзакцией с минимальным количеством запросов.
+
+        Пользователь и чат создаются вставкой с игнорированием конфликтов, у чата обновляются
+        только поля последнего сообщения. Для уже известного чата выполняется три запроса:
+        поиск чата, вставка сообщения и обновление чата; для чата из IdentityCache - два."""
+
+        status = MessageStatus.DELIVERED if message_direction == MessageDirection.RECEIVED else MessageStatus.NEW
+        try:
+            return self._store_message(bot_id, chat_id_in_messenger, chat_type, message_direction, status,
+                                       message_content_type, messenger_user_id, user_name, message_text,
+                                       message_id_in_messenger)
+        except IntegrityError:
+            # закэшированный чат или пользователь мог быть удалён в другом процессе; проверка внешних ключей
+            # откладывается до фиксации внешней транзакции, поэтому удаление обнаруживается по обновлению чата
+            IdentityCache().forget(bot_id, chat_id_in_messenger, messenger_user_id)
+            return self._store_message(bot_id, chat_id_in_messenger, chat_type, message_direction, status,
+                                       message_content_type, messenger_user_id, user_name, message_text,
+                                       message_id_in_messenger)
+
+    def _store_message(self,
+                       bot_id: int,
+                       chat_id_in_messenger: str,
+                       chat_type: ChatType,
+                       message_direction: MessageDirection,
+                       status: MessageStatus,
+                       message_content_type: MessageContentType,
+                       messenger_user_id: Optional[str],
+                       user_name: Optional[str],
+                       message_text: Optional[str],
+                       message_id_in_messenger: Optional[str]) -> 'Message':
+        from .models import Chat
+        # can't import the models at the top of the file because of a circular dependency
+        with transaction.atomic():
+            chat_id, user_id = Chat.objects.upsert_chat_ids(
+                bot_id, chat_id_in_messenger, chat_type, messenger_user_id, user_name
+            )
+            message = self.create(
+                bot_id=bot_id,
+                bot_user_id=user_id,
+                chat_id=chat_id,
+                status=status.value,
+                direction=message_direction.value,
+                content_type=message_content_type.value,
+                id_in_messenger=message_id_in_messenger,
+                text=message_text,
+            )
+            # save message in chat last message
+            last_text_length = Chat._meta.get_field('last_message_text').max_length
+            updated = Chat.objects.filter(pk=chat_id).update(
+                last_message_time=message.created_at,
+                last_message_text=message.text[:last_text_length] if message.text else message.text,
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                # откат точки сохранения вместе с сообщением, которое ссылается на удалённый чат
+                raise IntegrityError(f'Chat {chat_id} does not exist')
 
         return message
 
+    def store_outgoing(self,
+                       command: EventCommandToSend,
+                       chat_type: ChatType,
+                       messenger_user_id: Optional[str],
+                       user_name: Optional[str]) -> 'Message':
+        """Сохраняет исходящее сообщение и ставит команду в очередь отправки OutboxMessage одной транзакцией.
+
+        Присваивает команде message_id сохранённого сообщения."""
+
+        from .models import OutboxMessage
+        with transaction.atomic():
+            message = self.store_message(
+                command.bot_id,
+                command.chat_id_in_messenger,
+                chat_type,
+                command.payload.direction,
+                command.content_type,
+                messenger_user_id,
+                user_name,
+                command.payload.text,
+            )
+            command.message_id = message.pk
+            OutboxMessage.objects.create(
+                message_id=message.pk,
+                bot_id=command.bot_id,
+                payload=SerializerRegistry().dumps(command),
+            )
+        return message
+
     def set_sent(self, message_id: int) -> None:
         """Устанавливает статус SENT сообщениям, успешно отправленным через API платформы."""
 
-        message = self.get(id=message_id)
-        message.status = MessageStatus.SENT.value
-        message.save()
+        self._set_status(message_id, MessageStatus.SENT)
+
+    def set_failed(self, message_id: int) -> None:
+        """Устанавливает статус FAILED сообщениям, которые не удалось доставить на платформу."""
+
+        self._set_status(message_id, MessageStatus.FAILED)
+
+    def _set_status(self, message_id: int, status: MessageStatus) -> None:
+        from .models import OutboxMessage
+        with transaction.atomic():
+            self.filter(id=message_id).update(status=status.value, updated_at=timezone.now())
+            OutboxMessage.objects.filter(message_id=message_id).delete()
+
+    def get_chat_messages(self, chat_id: int) -> List['Message']:
+        """Возвращает всю историю чата по возрастанию времени, включая сообщения из архива."""
+
+        from .archive import MessageArchive
+
+        archived = MessageArchive().chat_messages(chat_id)
+        return archived[::-1] + list(self.filter(chat_id=chat_id).order_by('created_at', 'pk'))
+
+    def stream_after(self, message_id: int, limit: int) -> List['Message']:
+        """Возвращает до limit сообщений с id больше message_id по возрастанию id вместе с чатом и его пользователем."""
+
+        return list(self.filter(pk__gt=message_id).select_related('chat__bot_user').order_by('pk')[:limit])
+
+    def export(self, bot_id: Optional[int] = None, chat_id: Optional[int] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> 'QuerySet[Message]':
+        """Возвращает сообщения бота bot_id и/или чата chat_id, сохранённые в [since, until), по возрастанию времени."""
+
+        messages = self.all()
+        if bot_id is not None:
+            messages = messages.filter(bot_id=bot_id)
+        if chat_id is not None:
+            messages = messages.filter(chat_id=chat_id)
+        if since is not None:
+            messages = messages.filter(created_at__gte=since)
+        if until is not None:
+            messages = messages.filter(created_at__lt=until)
+        return messages.order_by('created_at', 'pk')
+
+    def chat_page(self, chat_id: int, before: Optional[Cursor] = None,
+                  limit: int = MESSAGE_PAGE_SIZE) -> Page['Message']:
+        """Возвращает страницу сообщений чата от новых к старым, начиная с более ранних, чем курсор before.
+
+        Один запрос по индексу bot_message_chat_created_idx. Если в таблице страница не набирается,
+        она дополняется старыми сообщениями из архива (MessageArchive)."""
+
+        from .archive import MessageArchive
+
+        messages = self.filter(chat_id=chat_id).only('id', 'text', 'direction', 'created_at')
+        if before is not None:
+            moment, pk = before
+            messages = messages.filter(Q(created_at__lt=moment) | Q(created_at=moment, pk__lt=pk))
+        rows = list(messages.order_by('-created_at', '-pk')[:limit + 1])
+        if len(rows) <= limit:
+            rows.extend(MessageArchive().chat_messages(chat_id, before, limit + 1 - len(rows)))
+            rows.sort(key=lambda message: (message.created_at, message.pk), reverse=True)
+        return make_page(rows, limit, lambda message: (message.created_at, message.pk))
+
+
+class OutboxMessageManager(models.Manager):
+    """Класс для управления очередью исходящих сообщений OutboxMessage.
+
+    Строки захватываются процессом на время lease: захват продлевается, пока процесс жив,
+    а строки упавшего процесса после истечения срока забирает любой другой (или он сам после перезапуска)."""
+
+    def claim(self, owner: str, limit: int, lease: float,
+              exclude: AbstractSet[int] = frozenset()) -> List['OutboxMessage']:
+        """Захватывает до limit свободных строк в порядке создания и возвращает их.
+
+        Захват выполняется условным UPDATE, поэтому строку получает только один из конкурирующих процессов.
+        Свои строки, которых нет в exclude (например, после ошибки при отметке статуса), захватываются повторно."""
+
+        if limit <= 0:
+            return []
+        now = timezone.now()
+        free = Q(claimed_until__isnull=True) | Q(claimed_until__lt=now) | Q(claimed_by=owner)
+        ids = list(self.filter(free).exclude(id__in=exclude).order_by('id').values_list('id', flat=True)[:limit])
+        if not ids:
+            return []
+        self.filter(free, id__in=ids).update(claimed_by=owner, claimed_until=now + timedelta(seconds=lease))
+        return list(self.filter(id__in=ids, claimed_by=owner).order_by('id'))
+
+    def renew(self, owner: str, lease: float) -> int:
+        """Продлевает захват всех строк процесса и возвращает их количество."""
+
+        return int(self.filter(claimed_by=owner).update(claimed_until=timezone.now() + timedelta(seconds=lease)))
+
+
+class DialogSessionManager(models.Manager):
+    """Класс для управления моделью DialogSession."""
+
+    def get_active(self, bot_id: int, chat_id_in_messenger: str) -> Optional[Dict[str, Any]]:
+        """Возвращает неистёкшую сессию чата одним запросом (вместе с первичным ключом чата) или None."""
+
+        return self.filter(
+            chat__bot_id=bot_id,
+            chat__id_in_messenger=chat_id_in_messenger,
+            expires_at__gt=timezone.now(),
+        ).values('chat_id', 'state', 'category_id', 'product_id', 'order_id').first()
+
+    def store(self, chat_id: int, ttl: float, **fields: Any) -> None:
+        """Сохраняет сессию чата и продлевает её срок. Обычно это один UPDATE."""
+
+        fields['expires_at'] = timezone.now() + timedelta(seconds=ttl)
+        if self.filter(chat_id=chat_id).update(**fields):
+            return
+        try:
+            with transaction.atomic():
+                self.create(chat_id=chat_id, **fields)
+        except IntegrityError:
+            # сессию одновременно создал другой воркер
+            self.filter(chat_id=chat_id).update(**fields)
+
+    def delete_expired(self) -> int:
+        deleted, _ = self.filter(expires_at__lte=timezone.now()).delete()
+        return int(deleted)
+
+
+class WebhookReceiptManager(models.Manager):
+    """Класс для управления квитанциями WebhookReceipt о принятых входящих сообщениях."""
+
+    def is_recorded(self, bot_id: int, id_in_messenger: str) -> bool:
+        return bool(self.filter(bot_id=bot_id, id_in_messenger=id_in_messenger).exists())
+
+    def record(self, bot_id: int, id_in_messenger: str) -> bool:
+        """Сохраняет квитанцию и возвращает False, если она уже есть (сообщение доставлено повторно)."""
+
+        try:
+            with transaction.atomic():
+                self.create(bot_id=bot_id, id_in_messenger=id_in_messenger)
+        except IntegrityError:
+            return False
+        return True
+
+    def delete_older_than(self, seconds: float) -> int:
+        deleted, _ = self.filter(created_at__lt=timezone.now() - timedelta(seconds=seconds)).delete()
+        return int(deleted)
+
+
+class ArchivedChatBlockManager(models.Manager):
+    """Класс для управления индексом архива сообщений ArchivedChatBlock."""
+
+    def for_chat(self, chat_id: int, before: Optional[Cursor] = None) -> 'QuerySet[ArchivedChatBlock]':
+        """Возвращает блоки чата от новых к старым, которые могут содержать сообщения раньше курсора before."""
+
+        blocks = self.filter(chat_id=chat_id)
+        if before is not None and before[0] is not None:
+            blocks = blocks.filter(first_created_at__lte=before[0])
+        return blocks.order_by('-last_created_at', '-pk')
+
+    def export(self, bot_id: Optional[int] = None, chat_id: Optional[int] = None,
+               since: Optional[datetime] = None, until: Optional[datetime] = None) -> 'QuerySet[ArchivedChatBlock]':
+        """Возвращает блоки, которые могут содержать сообщения бота bot_id и/или чата chat_id за [since, until)."""
 
-    def get_chat_messages(self, chat_id: int) -> 'QuerySet[Message]':
-        return self.filter(chat_id=chat_id).order_by('created_at').all()
+        blocks = self.all()
+        if bot_id is not None:
+            blocks = blocks.filter(chat__bot_id=bot_id)
+        if chat_id is not None:
+            blocks = blocks.filter(chat_id=chat_id)
+        if since is not None:
+            blocks = blocks.filter(last_created_at__gte=since)
+        if until is not None:
+            blocks = blocks.filter(first_created_at__lt=until)
+        return blocks.order_by('first_created_at', 'pk')
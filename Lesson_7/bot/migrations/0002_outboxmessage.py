@@ -0,0 +1,34 @@
+# Generated by Django 3.1.2 on 2026-10-18 12:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField(verbose_name='Payload')),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=64, verbose_name='Claimed by')),
+                ('claimed_until', models.DateTimeField(blank=True, db_index=True, null=True,
+                                                       verbose_name='Claimed until')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.bot',
+                                          verbose_name='Bot')),
+                ('message', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE,
+                                                 related_name='outbox', to='bot.message', verbose_name='Message')),
+            ],
+            options={
+                'verbose_name': 'Outbox message',
+                'verbose_name_plural': 'Outbox messages',
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.2 on 2026-10-18 12:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0002_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DialogSession',
+            fields=[
+                ('chat', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True,
+                                              serialize=False, to='bot.chat', verbose_name='Chat')),
+                ('state', models.PositiveSmallIntegerField(choices=[(0, 'Initial'), (1, 'Category'), (2, 'Product'),
+                                                                    (3, 'Order'), (4, 'Paypal'), (5, 'Stripe')],
+                                                           default=0, verbose_name='State')),
+                ('category_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Category')),
+                ('product_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Product')),
+                ('order_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Pending order')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Expires at')),
+            ],
+            options={
+                'verbose_name': 'Dialog session',
+                'verbose_name_plural': 'Dialog sessions',
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.2 on 2026-10-18 13:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0003_dialogsession'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookReceipt',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('id_in_messenger', models.CharField(max_length=64, verbose_name='ID in messenger')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('bot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.bot',
+                                          verbose_name='Bot')),
+            ],
+            options={
+                'verbose_name': 'Webhook receipt',
+                'verbose_name_plural': 'Webhook receipts',
+                'unique_together': {('bot', 'id_in_messenger')},
+            },
+        ),
+    ]
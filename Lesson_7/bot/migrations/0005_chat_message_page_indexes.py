@@ -0,0 +1,21 @@
+# Generated by Django 3.1.2 on 2026-10-18 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0004_webhookreceipt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['-last_message_time', '-id'], name='bot_chat_last_message_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['chat', 'created_at', 'id'], name='bot_message_chat_created_idx'),
+        ),
+    ]
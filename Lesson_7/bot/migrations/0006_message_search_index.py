@@ -0,0 +1,26 @@
+# Generated by Django 3.1.2 on 2026-10-18 17:00
+
+from typing import Any
+
+from django.db import migrations
+
+
+def create_index(apps: Any, schema_editor: Any) -> None:
+    from bot.search import create_index
+    create_index(schema_editor.connection)
+
+
+def drop_index(apps: Any, schema_editor: Any) -> None:
+    from bot.search import drop_index
+    drop_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0005_chat_message_page_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.1.2 on 2026-10-18 18:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bot', '0006_message_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedChatBlock',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(max_length=255, verbose_name='Segment file')),
+                ('offset', models.BigIntegerField(verbose_name='Offset')),
+                ('length', models.PositiveIntegerField(verbose_name='Length')),
+                ('count', models.PositiveIntegerField(verbose_name='Messages')),
+                ('first_created_at', models.DateTimeField(verbose_name='First message at')),
+                ('last_created_at', models.DateTimeField(verbose_name='Last message at')),
+                ('chat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bot.chat',
+                                           verbose_name='Chat')),
+            ],
+            options={
+                'verbose_name': 'Archived chat block',
+                'verbose_name_plural': 'Archived chat blocks',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedchatblock',
+            index=models.Index(fields=['chat', '-last_created_at'], name='bot_archive_chat_idx'),
+        ),
+    ]
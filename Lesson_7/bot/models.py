@@ -1,8 +1,9 @@
 from django.db import models
 
-from common.constants import (BotType, ChatType, MessageContentType, MessageDirection, MessageStatus)
+from common.constants import (BotType, ChatType, DialogStates, MessageContentType, MessageDirection, MessageStatus)
 from ecom_chatbot.settings import LANGUAGES
-from .managers import BotManager, ChatManager, MessageManager, BotUserManager
+from .managers import (BotManager, ChatManager, DialogSessionManager, MessageManager, BotUserManager,
+                       OutboxMessageManager, WebhookReceiptManager, ArchivedChatBlockManager)
 
 
 class TrackableUpdateCreateModel(models.Model):
@@ -102,6 +103,9 @@ class Chat(TrackableUpdateCreateModel):
         index_together = (
             ('bot', 'id_in_messenger'),
         )
+        indexes = [
+            models.Index(fields=['-last_message_time', '-id'], name='bot_chat_last_message_idx'),
+        ]
 
 
 class Message(TrackableUpdateCreateModel):
@@ -164,3 +168,102 @@ class Message(TrackableUpdateCreateModel):
         verbose_name_plural = 'Messages'
         app_label = 'bot'
         ordering = ['-created_at', 'bot', 'bot_user']
+        indexes = [
+            models.Index(fields=['chat', 'created_at', 'id'], name='bot_message_chat_created_idx'),
+        ]
+
+
+class OutboxMessage(models.Model):
+    """Модель для описания исходящего сообщения, ожидающего отправки на платформу.
+
+    Создаётся в одной транзакции с сообщением и хранит сериализованную команду ECTS.
+    Строку захватывает процесс, который её отправляет (claimed_by, claimed_until),
+    после отправки или окончательной ошибки строка удаляется."""
+
+    message = models.OneToOneField(Message, verbose_name='Message', on_delete=models.CASCADE, related_name='outbox')
+    bot = models.ForeignKey(Bot, verbose_name='Bot', on_delete=models.CASCADE)
+    payload = models.TextField('Payload')
+    claimed_by = models.CharField('Claimed by', max_length=64, blank=True, default='')
+    claimed_until = models.DateTimeField('Claimed until', blank=True, null=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    objects = OutboxMessageManager()
+
+    def __str__(self) -> str:
+        return f'#{self.message_id} <{self.bot}> {self.claimed_by}'
+
+    class Meta:
+        verbose_name = 'Outbox message'
+        verbose_name_plural = 'Outbox messages'
+        app_label = 'bot'
+        ordering = ['id']
+
+
+class DialogSession(models.Model):
+    """Модель для хранения состояния диалога в чате.
+
+    Содержит текущий шаг диалога, выбранные категорию и товар и последний созданный заказ.
+    Строка считается отсутствующей после expires_at, срок продлевается при каждом сохранении."""
+
+    chat = models.OneToOneField(Chat, verbose_name='Chat', on_delete=models.CASCADE, primary_key=True)
+    state = models.PositiveSmallIntegerField('State', choices=DialogStates.choices(),
+                                             default=DialogStates.INITIAL.value)
+    category_id = models.PositiveIntegerField('Category', blank=True, null=True)
+    product_id = models.PositiveIntegerField('Product', blank=True, null=True)
+    order_id = models.PositiveIntegerField('Pending order', blank=True, null=True)
+    expires_at = models.DateTimeField('Expires at', db_index=True)
+    objects = DialogSessionManager()
+
+    def __str__(self) -> str:
+        return f'<{self.chat_id}> {self.state}'
+
+    class Meta:
+        verbose_name = 'Dialog session'
+        verbose_name_plural = 'Dialog sessions'
+        app_label = 'bot'
+
+
+class WebhookReceipt(models.Model):
+    """Модель для описания квитанции о принятом входящем сообщении.
+
+    Уникальный индекс (bot, id_in_messenger) не даёт обработать повторно доставленный платформой вебхук."""
+
+    bot = models.ForeignKey(Bot, verbose_name='Bot', on_delete=models.CASCADE)
+    id_in_messenger = models.CharField('ID in messenger', max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    objects = WebhookReceiptManager()
+
+    def __str__(self) -> str:
+        return f'<{self.bot_id}> {self.id_in_messenger}'
+
+    class Meta:
+        verbose_name = 'Webhook receipt'
+        verbose_name_plural = 'Webhook receipts'
+        app_label = 'bot'
+        unique_together = (('bot', 'id_in_messenger'),)
+
+
+class ArchivedChatBlock(models.Model):
+    """Модель для описания блока архивных сообщений одного чата в файле-сегменте архива.
+
+    Блок - отдельный gzip-поток внутри сегмента: offset и length позволяют прочитать сообщения чата,
+    не распаковывая остальные чаты сегмента."""
+
+    chat = models.ForeignKey(Chat, verbose_name='Chat', on_delete=models.CASCADE)
+    segment = models.CharField('Segment file', max_length=255)
+    offset = models.BigIntegerField('Offset')
+    length = models.PositiveIntegerField('Length')
+    count = models.PositiveIntegerField('Messages')
+    first_created_at = models.DateTimeField('First message at')
+    last_created_at = models.DateTimeField('Last message at')
+    objects = ArchivedChatBlockManager()
+
+    def __str__(self) -> str:
+        return f'<{self.chat_id}> {self.segment}@{self.offset}'
+
+    class Meta:
+        verbose_name = 'Archived chat block'
+        verbose_name_plural = 'Archived chat blocks'
+        app_label = 'bot'
+        indexes = [
+            models.Index(fields=['chat', '-last_created_at'], name='bot_archive_chat_idx'),
+        ]
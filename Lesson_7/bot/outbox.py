@@ -0,0 +1,139 @@
+"""Модуль отправки исходящих сообщений из таблицы OutboxMessage.
+
+Исходящее сообщение сохраняется вместе со строкой OutboxMessage в одной транзакции, поэтому команда
+на отправку не теряется ни при деплое, ни при падении процесса. OutboxDrainer пачками захватывает строки,
+передаёт их в DeliveryDispatcher и продлевает захват, пока сообщения отправляются. После перезапуска
+он продолжает с того места, где остановился: незавершённые строки упавшего процесса освобождаются
+по истечении срока захвата."""
+
+import logging
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Dict, Optional, Set
+
+from django.db import DatabaseError, close_old_connections
+
+from clients.common import PlatformClientFactory
+from clients.delivery import DeliveryDispatcher, DeliveryTask
+from common.entities import EventCommandToSend
+from common.serializers import SerializerRegistry
+from patterns.singleton import Singleton
+from .constants import OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_LEASE
+from .models import Message, OutboxMessage
+from .registry import BotRegistry
+
+
+logger = logging.getLogger('root')
+
+
+class OutboxDrainer(metaclass=Singleton):
+    """Поток, передающий строки OutboxMessage в DeliveryDispatcher.
+
+    Просыпается по сигналу о новом сообщении (wake) или раз в poll_interval секунд."""
+
+    def __init__(self,
+                 batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 lease: float = OUTBOX_LEASE) -> None:
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'[-64:]
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._lease = lease
+        self._in_flight: Set[int] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._counters: Dict[str, int] = {'claimed': 0, 'submitted': 0, 'broken': 0, 'errors': 0}
+
+    def start(self) -> None:
+        """Запускает поток отправки, если он ещё не запущен."""
+
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='outbox-drainer', daemon=True)
+            self._thread.start()
+        logger.info(f'Outbox drainer started as {self.owner}')
+
+    def stop(self) -> None:
+        """Останавливает захват новых строк; уже переданные в DeliveryDispatcher сообщения продолжают отправляться."""
+
+        self._stopped.set()
+        self._wake.set()
+
+    def wake(self) -> None:
+        """Сообщает потоку, что в таблице появились новые сообщения."""
+
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.clear()
+            claimed = 0
+            close_old_connections()
+            try:
+                claimed = self.drain()
+            except DatabaseError as e:
+                self._counters['errors'] += 1
+                logger.error(f'Outbox drain failed: {e.args}')
+            except Exception as e:
+                self._counters['errors'] += 1
+                logger.exception(f'Outbox drain failed: {e.args}')
+            finally:
+                close_old_connections()
+            if claimed < self._batch_size:
+                self._wake.wait(self._poll_interval)
+
+    def drain(self) -> int:
+        """Продлевает захват отправляемых строк, захватывает новую пачку и передаёт её на отправку.
+
+        Возвращает количество захваченных строк. Пачка не больше свободного места в DeliveryDispatcher,
+        так что при перегрузке строки остаются в таблице, а не получают отказ."""
+
+        dispatcher = DeliveryDispatcher()
+        OutboxMessage.objects.renew(self.owner, self._lease)
+        with self._lock:
+            in_flight = frozenset(self._in_flight)
+        limit = min(self._batch_size, dispatcher.capacity())
+        rows = OutboxMessage.objects.claim(self.owner, limit, self._lease, exclude=in_flight)
+        self._counters['claimed'] += len(rows)
+        for row in rows:
+            try:
+                task = self._task_for(row)
+            except Exception as e:
+                # сообщение невозможно отправить ни сейчас, ни после перезапуска
+                self._counters['broken'] += 1
+                logger.exception(f'Outbox message {row.message_id} is broken: {e.args}')
+                Message.objects.set_failed(row.message_id)
+                continue
+            with self._lock:
+                self._in_flight.add(row.pk)
+            if dispatcher.submit(task):
+                self._counters['submitted'] += 1
+        return len(rows)
+
+    def _task_for(self, row: OutboxMessage) -> DeliveryTask:
+        command: EventCommandToSend = SerializerRegistry().loads(EventCommandToSend, row.payload)
+        client = PlatformClientFactory.create(BotRegistry().get_bot_type(row.bot_id))
+        task = client.delivery_task(command)
+        task.message_id = row.message_id
+        row_id = row.pk
+        task.done = lambda _: self._forget(row_id)
+        return task
+
+    def _forget(self, row_id: int) -> None:
+        with self._lock:
+            self._in_flight.discard(row_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return {
+            'owner': self.owner,
+            'running': self._thread is not None,
+            'in_flight': in_flight,
+            **self._counters,
+        }
@@ -0,0 +1,50 @@
+"""Модуль постраничного вывода по ключу (keyset).
+
+Страница продолжается с позиции последней строки предыдущей страницы - пары (время, первичный ключ),
+а не со смещения OFFSET, поэтому запрос любой страницы - поиск по индексу и чтение limit строк.
+Позиция передаётся клиенту непрозрачной строкой-курсором."""
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+
+T = TypeVar('T')
+
+Cursor = Tuple[Optional[datetime], int]
+
+
+class InvalidCursorError(ValueError):
+    """Курсор повреждён или сформирован не этим модулем."""
+
+
+def encode_cursor(moment: Optional[datetime], pk: int) -> str:
+    raw = f'{moment.isoformat() if moment is not None else ""}|{pk}'
+    return urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(value: str) -> Cursor:
+    try:
+        raw = urlsafe_b64decode(value + '=' * (-len(value) % 4)).decode('utf-8')
+        moment, pk = raw.split('|')
+        return (datetime.fromisoformat(moment) if moment else None), int(pk)
+    except ValueError as e:
+        raise InvalidCursorError(value) from e
+
+
+@dataclass
+class Page(Generic[T]):
+    """Строки страницы и курсор следующей страницы (None - страница последняя)."""
+
+    items: List[T]
+    next: Optional[str] = None
+
+
+def make_page(rows: List[T], limit: int, key: Callable[[T], Cursor]) -> Page[T]:
+    """Собирает страницу из limit + 1 прочитанных строк: лишняя строка означает, что есть продолжение."""
+
+    items = rows[:limit]
+    if len(rows) > limit and items:
+        return Page(items, encode_cursor(*key(items[-1])))
+    return Page(items)
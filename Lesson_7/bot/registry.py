@@ -0,0 +1,99 @@
+"""Модуль реестра ботов.
+
+Реестр заполняется лениво: при первом обращении к боту читается только его строка Bot, а при изменении
+строки сбрасываются её записи. Клиенты платформ получают соответствие типа и идентификатора бота
+без запросов к БД, а запуск приложения (в том числе migrate на пустой БД) к таблице ботов не обращается."""
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from patterns.singleton import Singleton
+
+
+logger = logging.getLogger('root')
+
+
+@dataclass(frozen=True)
+class BotInfo:
+    """Неизменяемая копия настроек бота."""
+
+    id: int
+    bot_type: int
+    name: str
+
+
+class BotRegistry(metaclass=Singleton):
+    """Хранит соответствия тип <-> идентификатор <-> настройки бота.
+
+    При промахе реестр читает из БД только недостающего бота - так подхватываются боты, добавленные
+    в другом процессе. Если бот так и не найден, выбрасывается Bot.DoesNotExist, как и при запросе к БД."""
+
+    def __init__(self) -> None:
+        self._by_id: Dict[int, BotInfo] = {}
+        self._by_type: Dict[int, BotInfo] = {}
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        """Перечитывает все боты и атомарно подменяет словари реестра."""
+
+        from .models import Bot
+        bots: List[BotInfo] = [
+            BotInfo(row['id'], row['bot_type'], row['name'])
+            for row in Bot.objects.order_by('id').values('id', 'bot_type', 'name')
+        ]
+        by_type: Dict[int, BotInfo] = {}
+        for bot in bots:
+            # при нескольких ботах одного типа используется первый созданный
+            by_type.setdefault(bot.bot_type, bot)
+        with self._lock:
+            self._by_id = {bot.id: bot for bot in bots}
+            self._by_type = by_type
+        logger.info(f'Bot registry loaded: {len(bots)} bots')
+
+    def forget(self, bot_id: int, bot_type: int) -> None:
+        """Сбрасывает записи бота и записи его типа; они перечитаются при следующем обращении."""
+
+        with self._lock:
+            self._by_id.pop(bot_id, None)
+            self._by_type.pop(bot_type, None)
+            self._by_type = {key: bot for key, bot in self._by_type.items() if bot.id != bot_id}
+
+    def get(self, bot_id: int) -> BotInfo:
+        bot = self._by_id.get(bot_id)
+        if bot is None:
+            from .models import Bot
+            bot = self._fetch(Bot.objects.filter(pk=bot_id))
+            if bot is None:
+                raise Bot.DoesNotExist(f'Bot #{bot_id} is not registered')
+        return bot
+
+    def get_by_type(self, bot_type: int) -> BotInfo:
+        bot = self._by_type.get(bot_type)
+        if bot is None:
+            from .models import Bot
+            # при нескольких ботах одного типа используется первый созданный
+            bot = self._fetch(Bot.objects.filter(bot_type=bot_type).order_by('id'))
+            if bot is None:
+                raise Bot.DoesNotExist(f'Bot of type {bot_type} is not registered')
+            with self._lock:
+                self._by_type[bot_type] = bot
+        return bot
+
+    def get_bot_id(self, bot_type: int) -> int:
+        return self.get_by_type(bot_type).id
+
+    def get_bot_type(self, bot_id: int) -> int:
+        return self.get(bot_id).bot_type
+
+    def _fetch(self, bots: Any) -> Optional[BotInfo]:
+        """Читает первого бота из выборки и сохраняет его по идентификатору."""
+
+        row = bots.values('id', 'bot_type', 'name').first()
+        if row is None:
+            return None
+        bot = BotInfo(row['id'], row['bot_type'], row['name'])
+        with self._lock:
+            self._by_id[bot.id] = bot
+        return bot
@@ -0,0 +1,179 @@
+"""Модуль полнотекстового поиска по истории сообщений.
+
+На SQLite текст сообщений индексируется виртуальной таблицей FTS5 bot_message_fts с внешним содержимым:
+индекс хранит только словарь и ссылки на id сообщений, а триггеры на bot_message обновляют его
+при каждой вставке, изменении текста и удалении сообщения (в том числе через bulk_create и update()).
+На PostgreSQL используется GIN-индекс по to_tsvector, на остальных СУБД поиск деградирует до icontains.
+Результаты упорядочены по релевантности (bm25 / ts_rank).
+
+Ищутся только сообщения, оставшиеся в bot_message: перенос в архив (bot/archive.py) удаляет строки,
+и вместе с ними из индекса уходит их текст."""
+
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from django.db import connection
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.migrations.recorder import MigrationRecorder
+
+from .constants import SEARCH_PAGE_SIZE
+from .models import Message
+
+
+SQLITE_INDEX_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS bot_message_fts USING fts5("
+    "text, content='bot_message', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS bot_message_fts_insert AFTER INSERT ON bot_message BEGIN "
+    "INSERT INTO bot_message_fts (rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER IF NOT EXISTS bot_message_fts_delete AFTER DELETE ON bot_message BEGIN "
+    "INSERT INTO bot_message_fts (bot_message_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER IF NOT EXISTS bot_message_fts_update AFTER UPDATE OF text ON bot_message BEGIN "
+    "INSERT INTO bot_message_fts (bot_message_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO bot_message_fts (rowid, text) VALUES (new.id, new.text); END",
+    "INSERT INTO bot_message_fts (bot_message_fts) VALUES ('rebuild')",
+)
+SQLITE_DROP_SQL = (
+    "DROP TRIGGER IF EXISTS bot_message_fts_insert",
+    "DROP TRIGGER IF EXISTS bot_message_fts_delete",
+    "DROP TRIGGER IF EXISTS bot_message_fts_update",
+    "DROP TABLE IF EXISTS bot_message_fts",
+)
+SQLITE_INDEX_OBJECTS = {'bot_message_fts', 'bot_message_fts_insert', 'bot_message_fts_delete', 'bot_message_fts_update'}
+INDEX_MIGRATION = ('bot', '0006_message_search_index')
+POSTGRES_INDEX_SQL = (
+    "CREATE INDEX IF NOT EXISTS bot_message_text_search_idx ON bot_message "
+    "USING GIN (to_tsvector('russian'::regconfig, COALESCE(text, '')))",
+)
+POSTGRES_DROP_SQL = (
+    "DROP INDEX IF EXISTS bot_message_text_search_idx",
+)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def create_index(db: BaseDatabaseWrapper = connection) -> None:
+    """Создаёт полнотекстовый индекс и заполняет его существующими сообщениями.
+
+    Вызывается миграцией и командой rebuild_message_index - например, после миграции, пересоздавшей
+    таблицу bot_message на SQLite (вместе со старой таблицей удаляются и триггеры)."""
+
+    statements = {'sqlite': SQLITE_INDEX_SQL, 'postgresql': POSTGRES_INDEX_SQL}.get(db.vendor, ())
+    with db.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def ensure_index(db: BaseDatabaseWrapper = connection) -> bool:
+    """Восстанавливает индекс SQLite, если миграция 0006 применена, а таблицы или триггеров индекса нет.
+
+    Вызывается после каждого migrate: миграция, пересоздающая таблицу bot_message, удаляет и её триггеры,
+    и сообщения, вставленные после неё, в индекс бы не попадали. Возвращает True, если индекс пересоздан."""
+
+    if db.vendor != 'sqlite' or INDEX_MIGRATION not in MigrationRecorder(db).applied_migrations():
+        return False
+    with db.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE %s", ['bot_message_fts%'])
+        if SQLITE_INDEX_OBJECTS <= {row[0] for row in cursor.fetchall()}:
+            return False
+    create_index(db)
+    return True
+
+
+def drop_index(db: BaseDatabaseWrapper = connection) -> None:
+    statements = {'sqlite': SQLITE_DROP_SQL, 'postgresql': POSTGRES_DROP_SQL}.get(db.vendor, ())
+    with db.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def fts_query(text: str) -> Optional[str]:
+    """Переводит строку оператора в запрос FTS5: все слова обязательны, последнее - по префиксу.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе (AND, NEAR, *, ^) не влияют на запрос."""
+
+    words = WORD_RE.findall(text)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+@dataclass
+class SearchHit:
+    """Найденное сообщение, фрагмент текста с выделенными словами и оценка релевантности."""
+
+    message: Message
+    snippet: str
+    score: float
+
+
+def search_messages(text: str,
+                    page: int = 1,
+                    size: int = SEARCH_PAGE_SIZE,
+                    chat_id: Optional[int] = None) -> Tuple[List[SearchHit], bool]:
+    """Возвращает страницу page найденных сообщений в порядке релевантности и признак следующей страницы.
+
+    Два запроса: поиск по индексу с сортировкой по релевантности и чтение сообщений с чатами по id."""
+
+    rows = rank_messages(text, (max(page, 1) - 1) * size, size + 1, chat_id)
+    messages = Message.objects.select_related('chat__bot_user').in_bulk([row[0] for row in rows[:size]])
+    hits = [SearchHit(messages[pk], snippet, score) for pk, snippet, score in rows[:size] if pk in messages]
+    return hits, len(rows) > size
+
+
+def rank_messages(text: str, offset: int, limit: int,
+                  chat_id: Optional[int] = None) -> List[Tuple[int, str, float]]:
+    """Возвращает (id сообщения, фрагмент, оценка) найденных сообщений в порядке релевантности."""
+
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(text, offset, limit, chat_id)
+    if connection.vendor == 'postgresql':
+        return _search_postgres(text, offset, limit, chat_id)
+    return _search_fallback(text, offset, limit, chat_id)
+
+
+def _search_sqlite(text: str, offset: int, limit: int, chat_id: Optional[int]) -> List[Tuple[int, str, float]]:
+    query = fts_query(text)
+    if query is None:
+        return []
+    sql = ("SELECT bot_message_fts.rowid, snippet(bot_message_fts, 0, '[', ']', '…', 16), bot_message_fts.rank "
+           "FROM bot_message_fts ")
+    params: List[object] = []
+    if chat_id is not None:
+        sql += "JOIN bot_message ON bot_message.id = bot_message_fts.rowid AND bot_message.chat_id = %s "
+        params.append(chat_id)
+    sql += "WHERE bot_message_fts MATCH %s ORDER BY bot_message_fts.rank LIMIT %s OFFSET %s"
+    params.extend([query, limit, offset])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(int(pk), str(snippet), float(score)) for pk, snippet, score in cursor.fetchall()]
+
+
+def _search_postgres(text: str, offset: int, limit: int, chat_id: Optional[int]) -> List[Tuple[int, str, float]]:
+    words = WORD_RE.findall(text)
+    if not words:
+        return []
+    query = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+    vector = "to_tsvector('russian'::regconfig, COALESCE(text, ''))"
+    sql = (f"SELECT id, ts_headline('russian', COALESCE(text, ''), q, 'StartSel=[, StopSel=]'), "
+           f"ts_rank({vector}, q) AS score "
+           f"FROM bot_message, to_tsquery('russian', %s) q WHERE {vector} @@ q ")
+    params: List[object] = [query]
+    if chat_id is not None:
+        sql += "AND chat_id = %s "
+        params.append(chat_id)
+    sql += "ORDER BY score DESC, id DESC LIMIT %s OFFSET %s"
+    params.extend([limit, offset])
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(int(pk), str(snippet), float(score)) for pk, snippet, score in cursor.fetchall()]
+
+
+def _search_fallback(text: str, offset: int, limit: int, chat_id: Optional[int]) -> List[Tuple[int, str, float]]:
+    messages = Message.objects.all()
+    for word in WORD_RE.findall(text):
+        messages = messages.filter(text__icontains=word)
+    if chat_id is not None:
+        messages = messages.filter(chat_id=chat_id)
+    rows = messages.order_by('-created_at', '-pk').values_list('pk', 'text')[offset:offset + limit]
+    return [(pk, (message_text or '')[:100], 0.0) for pk, message_text in rows]
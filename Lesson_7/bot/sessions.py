@@ -0,0 +1,124 @@
+"""Модуль хранилища сессий диалога.
+
+Сессия чата хранит текущий шаг диалога (DialogStates), выбранные категорию и товар, последний созданный
+заказ и первичный ключ чата. Горячий слой - LRU-кэш в памяти процесса, постоянный - компактная таблица
+DialogSession, строки которой истекают через SESSION_TTL секунд без активности. Горячий слой живёт
+недолго (SESSION_CACHE_TTL), чтобы изменения, сделанные другим процессом, подхватывались из БД."""
+
+import dataclasses
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from common.cache import LRUCache
+from common.constants import DialogStates
+from patterns.singleton import Singleton
+from .constants import SESSION_CACHE_SIZE, SESSION_CACHE_TTL, SESSION_TTL, SESSION_PURGE_INTERVAL
+from .identity import IdentityCache
+
+
+logger = logging.getLogger('root')
+
+SessionKey = Tuple[int, str]
+
+
+@dataclasses.dataclass
+class SessionData:
+    """Состояние диалога в одном чате."""
+
+    chat_id: Optional[int] = None
+    state: DialogStates = DialogStates.INITIAL
+    category_id: Optional[int] = None
+    product_id: Optional[int] = None
+    order_id: Optional[int] = None
+
+
+class SessionStore(metaclass=Singleton):
+    """Хранилище сессий диалога: (bot_id, chat_id_in_messenger) -> SessionData.
+
+    Наружу всегда отдаются копии, поэтому горячий слой совпадает с тем, что сохранено в БД."""
+
+    def __init__(self,
+                 maxsize: int = SESSION_CACHE_SIZE,
+                 cache_ttl: float = SESSION_CACHE_TTL,
+                 ttl: float = SESSION_TTL,
+                 purge_interval: float = SESSION_PURGE_INTERVAL) -> None:
+        self._cache: LRUCache[SessionKey, SessionData] = LRUCache(maxsize, cache_ttl)
+        self._ttl = ttl
+        self._purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.saves = 0
+
+    def cached(self, bot_id: int, chat_id_in_messenger: str) -> SessionData:
+        """Возвращает сессию из горячего слоя или новую, не обращаясь к БД."""
+
+        session = self._cache.get((bot_id, chat_id_in_messenger))
+        return dataclasses.replace(session) if session is not None else SessionData()
+
+    def load(self, bot_id: int, chat_id_in_messenger: str) -> SessionData:
+        """Возвращает сессию чата: из горячего слоя, из БД (один запрос) или новую.
+
+        Для новой сессии первичный ключ чата берётся из IdentityCache."""
+
+        key = (bot_id, chat_id_in_messenger)
+        session = self._cache.get(key)
+        if session is None:
+            from .models import DialogSession
+            self.loads += 1
+            row = DialogSession.objects.get_active(bot_id, chat_id_in_messenger)
+            if row is not None:
+                row['state'] = DialogStates(row['state'])
+                session = SessionData(**row)
+            else:
+                ids = IdentityCache().chats.get(key)
+                session = SessionData(chat_id=ids[0] if ids is not None else None)
+            self._cache.set(key, session)
+        return dataclasses.replace(session)
+
+    def save(self, bot_id: int, chat_id_in_messenger: str, session: SessionData) -> None:
+        """Сохраняет сессию в БД и горячий слой. Сессия без первичного ключа чата хранится только в памяти."""
+
+        if session.chat_id is not None:
+            from .models import DialogSession
+            self.saves += 1
+            DialogSession.objects.store(
+                session.chat_id,
+                self._ttl,
+                state=session.state.value,
+                category_id=session.category_id,
+                product_id=session.product_id,
+                order_id=session.order_id,
+            )
+            self._purge_expired()
+        self._cache.set((bot_id, chat_id_in_messenger), dataclasses.replace(session))
+
+    def _purge_expired(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._last_purge < self._purge_interval:
+                return
+            self._last_purge = time.monotonic()
+        from .models import DialogSession
+        deleted = DialogSession.objects.delete_expired()
+        logger.info(f'Expired dialog sessions deleted: {deleted}')
+
+    def forget(self, bot_id: int, chat_id_in_messenger: str) -> None:
+        """Сбрасывает сессию чата из горячего слоя; следующее обращение прочитает её из БД."""
+
+        self._cache.delete((bot_id, chat_id_in_messenger))
+
+    def forget_chat(self, chat_id: int) -> None:
+        self._cache.delete_where(lambda key, value: value.chat_id == chat_id)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'cache': self._cache.stats(),
+            'ttl': self._ttl,
+            'loads': self.loads,
+            'saves': self.saves,
+        }
@@ -0,0 +1,60 @@
+"""Модуль содержит обработчики сигналов моделей бота."""
+
+import logging
+from typing import Any
+
+from django.apps import AppConfig
+from django.db import connections, transaction
+from django.db.models.signals import post_migrate, post_save, post_delete
+from django.dispatch import receiver
+
+from .identity import IdentityCache
+from .live import MessageBroadcaster
+from .models import Bot, BotUser, Chat, Message, OutboxMessage
+from .outbox import OutboxDrainer
+from .registry import BotRegistry
+from .search import ensure_index
+from .sessions import SessionStore
+
+logger = logging.getLogger('root')
+
+
+@receiver([post_save, post_delete], sender=BotUser)  # type: ignore
+def invalidate_user_identity(sender: Any, instance: BotUser, **kwargs: Any) -> None:
+    IdentityCache().forget_user(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Chat)  # type: ignore
+def invalidate_chat_identity(sender: Any, instance: Chat, **kwargs: Any) -> None:
+    IdentityCache().forget_chat(instance.pk)
+
+
+@receiver(post_delete, sender=Chat)  # type: ignore
+def forget_chat_session(sender: Any, instance: Chat, **kwargs: Any) -> None:
+    SessionStore().forget_chat(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Bot)  # type: ignore
+def invalidate_bot_registry(sender: Any, instance: Bot, **kwargs: Any) -> None:
+    bot_id, bot_type = instance.pk, instance.bot_type
+    transaction.on_commit(lambda: BotRegistry().forget(bot_id, bot_type))
+
+
+@receiver(post_save, sender=OutboxMessage)  # type: ignore
+def wake_outbox_drainer(sender: Any, instance: OutboxMessage, created: bool, **kwargs: Any) -> None:
+    if created:
+        transaction.on_commit(OutboxDrainer().wake)
+
+
+@receiver(post_save, sender=Message)  # type: ignore
+def publish_new_message(sender: Any, instance: Message, created: bool, **kwargs: Any) -> None:
+    if created:
+        message_id = instance.pk
+        transaction.on_commit(lambda: MessageBroadcaster().publish(message_id))
+
+
+@receiver(post_migrate)  # type: ignore
+def restore_search_index(sender: Any, app_config: AppConfig, using: str, **kwargs: Any) -> None:
+    # миграция, пересоздавшая bot_message на SQLite, удаляет триггеры полнотекстового индекса
+    if app_config.label == 'bot' and ensure_index(connections[using]):
+        logger.info('Message search index restored after migrate')
@@ -1,44 +1,75 @@
-from django.http import HttpRequest, HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.views import redirect_to_login
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.urls import reverse
 # чтобы разрешить кросс-сайт POST запросы
 from django.views.decorators.csrf import csrf_exempt
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional
 from marshmallow.exceptions import ValidationError
+import json
 import logging
 
 from common.constants import BotType
-from common.entities import EventCommandReceived, EventCommandToSend
-from .handlers import message_handler
+from common.entities import EventCommandReceived
+from common.keyboards import KeyboardCache
+from common.middleware import WebhookVerifier
+from common.serializers import SerializerRegistry
 from clients.common import PlatformClientFactory
+from clients.delivery import DeliveryDispatcher
+from clients.jivosite.commands import CommandStore
+from clients.transport import HttpTransport
+from .archive import MessageArchive
+from .constants import (INGESTION_MODE, IngestionMode, ExportFormat, CHAT_PAGE_SIZE, MESSAGE_PAGE_SIZE,
+                        MAX_PAGE_SIZE, SEARCH_PAGE_SIZE)
+from .dedup import WebhookDeduplicator
+from .export import export_file_info, parse_moment, stream_export
+from .identity import IdentityCache
+from .ingestion import IngestionPool, process_event
+from .live import MessageBroadcaster
 from .models import Chat, Message
+from .outbox import OutboxDrainer
+from .pagination import Cursor, InvalidCursorError, decode_cursor
+from .search import SearchHit, search_messages
+from .sessions import SessionStore
 
 
 logger = logging.getLogger('root')
 
 
+def _ingest_webhook(request: HttpRequest, bot_type: int, platform: str) -> HttpResponse:
+    """Проводит парсинг вебхука в ECR и либо обрабатывает его сразу, либо ставит в очередь воркеров.
+
+    В режиме очереди вью отвечает платформе сразу после постановки события в очередь."""
+
+    client = PlatformClientFactory.create(bot_type)
+    try:
+        event: EventCommandReceived = client.parse_webhook(request)
+        logger.debug(event)
+        if INGESTION_MODE == IngestionMode.QUEUE:
+            if not IngestionPool().submit(bot_type, event):
+                # платформа повторит доставку позже
+                return HttpResponse('Busy', status=503)
+        else:
+            process_event(bot_type, event)
+    except ValidationError as e:
+        logger.error(f'{platform} webhook: {e.args}')
+
+    return HttpResponse('OK')
+
+
 @csrf_exempt  # type: ignore
 def ok_webhook(request: HttpRequest) -> HttpResponse:
     """Обрабатывает входящие вебхуки со стороны OK и возвращает 200 ОК.
 
-    Проводит верификацию хоста (?), проводит парсинг в ECR,
+    Адрес отправителя уже проверен WebhookVerificationMiddleware. Проводит парсинг в ECR,
     направляет в хендлер для получения ответа и отсылает обратно клиенту при удаче."""
 
-    client = PlatformClientFactory.create(BotType.TYPE_OK.value)
-
     logger.debug(f'"inc wh from: {request.get_host()}')
-    # todo doesn't work yet due to ngrok
-    logger.debug(f'verified: {client.verify_request(request)}')
-    try:
-        event: EventCommandReceived = client.parse_webhook(request)
-        logger.debug(event)
-        result: Optional[EventCommandToSend] = message_handler(event)
-        if result is not None:
-            client.send_message(result)
-    except ValidationError as e:
-        logger.error(f'OK webhook: {e.args}')
 
     # скрипт обязательно должен подтверждать получение с помощью отправки 200 ОК
-    return HttpResponse('OK')
+    return _ingest_webhook(request, BotType.TYPE_OK.value, 'OK')
 
 
 @csrf_exempt  # type: ignore
@@ -48,45 +79,235 @@ def jivo_webhook(request: HttpRequest) -> HttpResponse:
     Проводит парсинг в ECR, направляет в хендлер для получения ответа и отсылает обратно клиенту при удаче."""
 
     logger.debug(f'"inc jivo wh from: {request.get_host()}')
-    client = PlatformClientFactory.create(BotType.TYPE_JIVOSITE.value)
+
+    return _ingest_webhook(request, BotType.TYPE_JIVOSITE.value, 'JIVO')
+
+
+@staff_member_required  # type: ignore
+def runtime_stats(request: HttpRequest) -> JsonResponse:
+    """Отдаёт показатели процесса: глубину очередей входящих событий, отставание по разделам,
+    время проверки вебхуков, отброшенные повторы, счётчики кэша идентификаторов, сессий диалога, кэша клавиатур,
+    команд кнопок Jivo, реестра сериализаторов, очереди и диспетчера отправки и повторного использования
+    HTTP-соединений с платформами."""
+
+    return JsonResponse({
+        'ingestion': IngestionPool().stats(),
+        'verification': WebhookVerifier().stats(),
+        'dedup': WebhookDeduplicator().stats(),
+        'live': MessageBroadcaster().stats(),
+        'archive': MessageArchive().stats(),
+        'identity_cache': IdentityCache().stats(),
+        'keyboard_cache': KeyboardCache().stats(),
+        'jivo_commands': CommandStore().stats(),
+        'sessions': SessionStore().stats(),
+        'serializers': SerializerRegistry().stats(),
+        'delivery': DeliveryDispatcher().stats(),
+        'outbox': OutboxDrainer().stats(),
+        'transport': HttpTransport().stats(),
+    })
+
+
+def _cursor(request: HttpRequest, name: str) -> Optional[Cursor]:
+    value = request.GET.get(name)
+    return decode_cursor(value) if value else None
+
+
+def _page_limit(request: HttpRequest, default: int) -> int:
     try:
-        event: EventCommandReceived = client.parse_webhook(request)
-        logger.debug(event)
-        result: Optional[EventCommandToSend] = message_handler(event)
-        if result is not None:
-            client.send_message(result)
-    except ValidationError as e:
-        logger.error(f'JIVO webhook: {e.args}')
+        return min(max(int(request.GET.get('limit', default)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return default
+
+
+def _chat_entry(chat: Chat) -> Dict[str, Any]:
+    return {
+        'number': chat.pk,
+        'name': chat.bot_user.name if chat.bot_user else None,
+        'chat_last_message': chat.last_message_text,
+        'time': chat.last_message_time,
+    }
+
+
+def _message_entry(message: Message) -> Dict[str, Any]:
+    return {
+        'number': message.pk,
+        'content': message.text,
+        'direction': bool(message.direction % 2),
+        'time': message.created_at,
+    }
 
-    return HttpResponse('OK')
+
+def _search_entry(hit: SearchHit) -> Dict[str, Any]:
+    chat = hit.message.chat
+    return dict(
+        _message_entry(hit.message),
+        chat=hit.message.chat_id,
+        chat_name=chat.bot_user.name if chat is not None and chat.bot_user else None,
+        snippet=hit.snippet,
+        score=hit.score,
+    )
+
+
+def _search_page(request: HttpRequest) -> int:
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
 
 
 def chat_view(request: HttpRequest, pk: Optional[int] = None) -> HttpResponse:
-    """Отображает список проведённых чатов и содержимое просматриваемого чата."""
-
-    chats: List[Dict[str, Any]] = [
-        {
-            'number': chat.pk,
-            'name': chat.bot_user.name,
-            'chat_last_message': chat.last_message_text,
-            'time': chat.last_message_time
-        } for chat in Chat.objects.all()
-    ]
+    """Отображает страницу списка проведённых чатов и последние сообщения просматриваемого чата.
+
+    Следующая страница чатов задаётся курсором after, более ранние сообщения - курсором before.
+    С параметром q вместо сообщений чата выводится страница page результатов поиска по всем чатам;
+    поиск, как и message_search_api, доступен только персоналу."""
+
+    query = request.GET.get('q', '').strip()
+    if query and not (request.user.is_active and request.user.is_staff):
+        return redirect_to_login(request.get_full_path(), reverse('admin:login'))
+    try:
+        after, before = _cursor(request, 'after'), _cursor(request, 'before')
+    except InvalidCursorError:
+        return HttpResponseBadRequest('Invalid cursor')
+    # курсор потока обновлений берётся до чтения страниц, повторы страница отбрасывает по номеру сообщения
+    live_cursor = MessageBroadcaster().latest_id()
+    chats = Chat.objects.page(after, CHAT_PAGE_SIZE)
     messages: List[Dict[str, Any]] = []
-    if pk:
-        messages = [
-            {
-                'number': message.pk,
-                'content': message.text,
-                'direction': bool(message.direction % 2),
-                'time': message.created_at,
-            } for message in Message.objects.get_chat_messages(pk)
-        ]
+    older: Optional[str] = None
+    found: List[Dict[str, Any]] = []
+    page_number = _search_page(request)
+    has_next = False
+    if query:
+        hits, has_next = search_messages(query, page_number)
+        found = [_search_entry(hit) for hit in hits]
+    elif pk:
+        page = Message.objects.chat_page(pk, before, MESSAGE_PAGE_SIZE)
+        # страница читается от новых к старым, а выводится в хронологическом порядке
+        messages = [_message_entry(message) for message in reversed(page.items)]
+        older = page.next
     context: Dict[str, Any] = {
         'title_page': 'Список чатов',
-        'chat_list': chats,
+        'chat_list': [_chat_entry(chat) for chat in chats.items],
         'message_list': messages,
         'selected': pk,
+        'after': request.GET.get('after', ''),
+        'next_chats': chats.next,
+        'older_messages': older,
+        'live_cursor': live_cursor,
+        'query': query,
+        'found': found,
+        'search_page': page_number,
+        'search_has_next': has_next,
     }
 
     return render(request, 'bot/chat_view.html', context)
+
+
+@staff_member_required  # type: ignore
+def chat_list_api(request: HttpRequest) -> JsonResponse:
+    """Отдаёт страницу списка чатов в JSON: {"results": [...], "next": курсор следующей страницы или null}."""
+
+    try:
+        after = _cursor(request, 'after')
+    except InvalidCursorError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    page = Chat.objects.page(after, _page_limit(request, CHAT_PAGE_SIZE))
+    return JsonResponse({'results': [_chat_entry(chat) for chat in page.items], 'next': page.next})
+
+
+@staff_member_required  # type: ignore
+def chat_messages_api(request: HttpRequest, pk: int) -> JsonResponse:
+    """Отдаёт страницу сообщений чата от новых к старым в JSON, более ранние сообщения - по курсору next."""
+
+    try:
+        before = _cursor(request, 'before')
+    except InvalidCursorError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    page = Message.objects.chat_page(pk, before, _page_limit(request, MESSAGE_PAGE_SIZE))
+    return JsonResponse({'results': [_message_entry(message) for message in page.items], 'next': page.next})
+
+
+def _sse(event: str, event_id: int, data: Dict[str, Any]) -> str:
+    return f'event: {event}\nid: {event_id}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+def _chat_events(cursor: int, chat_id: Optional[int]) -> Iterator[str]:
+    yield 'retry: 3000\n\n'
+    for batch in MessageBroadcaster().stream(cursor):
+        if not batch:
+            yield ': keep-alive\n\n'
+            continue
+        # id всех событий - курсор потока (наибольший отправленный id), а не id сообщения: сообщение,
+        # зафиксированное с опозданием, не должно откатить Last-Event-ID при переподключении
+        cursor = max(cursor, batch[-1].pk)
+        chats: Dict[int, Chat] = {}
+        for message in batch:
+            if message.chat is None:
+                continue
+            chats[message.chat_id] = message.chat
+            if chat_id is None or message.chat_id == chat_id:
+                yield _sse('message', cursor, dict(_message_entry(message), chat=message.chat_id))
+        for chat in chats.values():
+            yield _sse('chat', cursor, _chat_entry(chat))
+
+
+@staff_member_required  # type: ignore
+def chat_events(request: HttpRequest) -> HttpResponse:
+    """Поток server-sent events для страницы чатов.
+
+    Событие message - новое сообщение (только чата chat, если он задан), событие chat - изменившаяся строка
+    списка чатов. Поток начинается после сообщения Last-Event-ID или after_id, по умолчанию - с текущего.
+    Поток занимает воркер на BOT_LIVE_STREAM_TTL секунд, после чего браузер переподключается."""
+
+    try:
+        cursor_value = request.headers.get('Last-Event-ID') or request.GET.get('after_id')
+        cursor = int(cursor_value) if cursor_value else MessageBroadcaster().latest_id()
+        chat_id = int(request.GET['chat']) if request.GET.get('chat') else None
+    except ValueError:
+        return HttpResponseBadRequest('Invalid cursor')
+    response = StreamingHttpResponse(_chat_events(cursor, chat_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # nginx не должен буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@staff_member_required  # type: ignore
+def message_search_api(request: HttpRequest) -> JsonResponse:
+    """Отдаёт страницу page результатов полнотекстового поиска q по сообщениям (только чата chat, если он задан)
+    в порядке релевантности: {"results": [...], "next": номер следующей страницы или null}."""
+
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'Empty query'}, status=400)
+    try:
+        chat_id = int(request.GET['chat']) if request.GET.get('chat') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid chat'}, status=400)
+    page = _search_page(request)
+    hits, has_next = search_messages(query, page, _page_limit(request, SEARCH_PAGE_SIZE), chat_id)
+    return JsonResponse({'results': [_search_entry(hit) for hit in hits], 'next': page + 1 if has_next else None})
+
+
+@staff_member_required  # type: ignore
+def message_export(request: HttpRequest) -> HttpResponse:
+    """Отдаёт выгрузку сообщений файлом по мере чтения из БД и архива.
+
+    Параметры: bot и chat - id бота и чата, since и until - границы периода (дата или дата и время ISO 8601,
+    until не включается), format - jsonl (по умолчанию) или csv, gzip=1 - сжимать выгрузку."""
+
+    try:
+        export_format = ExportFormat(request.GET.get('format', ExportFormat.JSONL.value))
+        bot_id = int(request.GET['bot']) if request.GET.get('bot') else None
+        chat_id = int(request.GET['chat']) if request.GET.get('chat') else None
+        since = parse_moment(request.GET['since']) if request.GET.get('since') else None
+        until = parse_moment(request.GET['until']) if request.GET.get('until') else None
+    except ValueError as e:
+        return HttpResponseBadRequest(f'Invalid export parameters: {e}')
+    compress = request.GET.get('gzip') == '1'
+    name, content_type = export_file_info(export_format, compress)
+    response = StreamingHttpResponse(stream_export(export_format, compress, bot_id, chat_id, since, until),
+                                     content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{name}"'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,24 +1,55 @@
-from typing import TYPE_CHECKING
+from typing import Any, Dict, TYPE_CHECKING
 from abc import ABC, abstractmethod
 
 from common.entities import EventCommandToSend, EventCommandReceived
+from .delivery import DeliveryDispatcher, DeliveryTask
+from .transport import HttpTransport
 
 if TYPE_CHECKING:
     from django.http import HttpRequest
+    from requests import Response
 
 
 class SocialPlatformClient(ABC):
     """Абстрактный интерфейс, описывающий поведение социальной платформы."""
 
+    headers: Dict[str, Any] = {}
+
     @abstractmethod
     def parse_webhook(self, request: 'HttpRequest') -> EventCommandReceived:
         pass
 
     @abstractmethod
-    def send_message(self, payload: EventCommandToSend) -> None:
+    def delivery_task(self, payload: EventCommandToSend) -> DeliveryTask:
+        """Формирует готовый к отправке запрос к платформе для команды ECTS."""
         pass
 
+    def remember_reply(self, payload: EventCommandToSend) -> None:
+        """Запоминает данные ответа, нужные для разбора следующего вебхука чата.
+
+        Вызывается в процессе, принявшем вебхук, сразу после сохранения ответа: отправлять его может
+        OutboxDrainer другого процесса."""
+
+    def send_message(self, payload: EventCommandToSend) -> None:
+        """Отправляет сообщение без сохранения в OutboxMessage - при перезапуске процесса оно будет потеряно."""
+
+        DeliveryDispatcher().submit(self.delivery_task(payload))
+
     @staticmethod
     @abstractmethod
     def verify_request(request: 'HttpRequest') -> bool:
         pass
+
+    def _post(self, url: str, data: str) -> 'Response':
+        """Отправляет запрос к АПИ платформы через общий транспорт с пулом соединений и таймаутами."""
+
+        return HttpTransport().post(url, data=data, headers=self.headers)
+
+    @staticmethod
+    def _response_body(response: 'Response') -> Any:
+        """Возвращает тело ответа платформы как JSON, а если это не JSON (например, страница ошибки прокси) - текст."""
+
+        try:
+            return response.json()
+        except ValueError:
+            return response.text
@@ -0,0 +1,20 @@
+"""Модуль с набором констант и параметров окружения, общих для клиентов социальных платформ."""
+
+import os
+
+
+# количество потоков, отправляющих сообщения на платформы
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '4'))
+# сколько сообщений может одновременно ожидать отправки или повтора
+DELIVERY_MAX_PENDING = int(os.getenv('DELIVERY_MAX_PENDING', '10000'))
+# задержка перед первым повтором и верхняя граница задержки (секунды), задержка растёт вдвое с каждой попыткой
+DELIVERY_BASE_DELAY = float(os.getenv('DELIVERY_BASE_DELAY', '1'))
+DELIVERY_MAX_DELAY = float(os.getenv('DELIVERY_MAX_DELAY', '60'))
+# сколько секунд с момента постановки сообщение пытаются доставить, прежде чем пометить как FAILED
+DELIVERY_MAX_AGE = float(os.getenv('DELIVERY_MAX_AGE', '300'))
+
+# таймауты HTTP-запросов к платформам (секунды): установка соединения и ожидание ответа
+TRANSPORT_CONNECT_TIMEOUT = float(os.getenv('TRANSPORT_CONNECT_TIMEOUT', '3.05'))
+TRANSPORT_READ_TIMEOUT = float(os.getenv('TRANSPORT_READ_TIMEOUT', '10'))
+# максимальное количество одновременно открытых соединений с одним хостом
+TRANSPORT_POOL_SIZE = int(os.getenv('TRANSPORT_POOL_SIZE', '8'))
@@ -0,0 +1,234 @@
+"""Модуль диспетчера исходящих сообщений.
+
+Клиенты платформ передают сюда готовую к отправке задачу вместо того, чтобы заводить на каждое сообщение
+отдельное задание планировщика. Задачи ждут своей очереди в одной куче, упорядоченной по времени
+следующей попытки, и выполняются ограниченным числом потоков. Временные ошибки (сеть, таймауты,
+HTTP 429 и 5xx) повторяются с экспоненциально растущей задержкой со случайным разбросом, постоянные
+ошибки и истечение срока доставки переводят сообщение в статус FAILED."""
+
+import heapq
+import itertools
+import logging
+import queue
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from django.db import close_old_connections
+
+from patterns.singleton import Singleton
+from .constants import (DELIVERY_WORKERS, DELIVERY_MAX_PENDING, DELIVERY_BASE_DELAY, DELIVERY_MAX_DELAY,
+                        DELIVERY_MAX_AGE)
+from .exceptions import PlatformUnavailableError
+
+
+logger = logging.getLogger('root')
+
+RETRYABLE_ERRORS = (requests.Timeout, requests.ConnectionError, PlatformUnavailableError)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Определяет, имеет ли смысл повторить отправку после ошибки.
+
+    Ошибки, которые вернула сама платформа (OkServerError, JivoServerError), и любые неожиданные
+    исключения считаются постоянными - повтор того же запроса даст тот же результат."""
+
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+def backoff_delay(attempt: int, base: float = DELIVERY_BASE_DELAY, cap: float = DELIVERY_MAX_DELAY) -> float:
+    """Возвращает задержку перед попыткой attempt (начиная с 1) - случайную величину от 0 до base * 2^(attempt-1)."""
+
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+@dataclass
+class DeliveryTask:
+    """Исходящее сообщение, ожидающее отправки.
+
+    send выполняет один запрос к платформе и выбрасывает исключение при неудаче,
+    done (если задан) вызывается после того, как задача отправлена или получила статус FAILED."""
+
+    key: str
+    send: Callable[[], None]
+    message_id: Optional[int] = None
+    done: Optional[Callable[['DeliveryTask'], None]] = None
+    created_at: float = field(default_factory=time.monotonic)
+    attempts: int = 0
+    last_error: Optional[str] = None
+
+
+def mark_sent(task: DeliveryTask) -> None:
+    from bot.models import Message
+    if task.message_id is not None:
+        Message.objects.set_sent(task.message_id)
+
+
+def mark_failed(task: DeliveryTask) -> None:
+    from bot.models import Message
+    if task.message_id is not None:
+        Message.objects.set_failed(task.message_id)
+
+
+class DeliveryDispatcher(metaclass=Singleton):
+    """Ограниченный пул потоков отправки с отложенными повторами.
+
+    Отложенные задачи хранятся в куче (время попытки, порядковый номер, задача) и переносятся
+    в очередь готовых задач отдельным потоком-таймером, поэтому тысячи ожидающих повтора сообщений
+    не занимают ни потоков, ни заданий планировщика."""
+
+    def __init__(self,
+                 workers: int = DELIVERY_WORKERS,
+                 max_pending: int = DELIVERY_MAX_PENDING,
+                 max_age: float = DELIVERY_MAX_AGE,
+                 on_sent: Callable[[DeliveryTask], None] = mark_sent,
+                 on_failed: Callable[[DeliveryTask], None] = mark_failed) -> None:
+        self._workers = max(workers, 1)
+        self._max_pending = max_pending
+        self._max_age = max_age
+        self._on_sent = on_sent
+        self._on_failed = on_failed
+        self._delayed: List[Tuple[float, int, DeliveryTask]] = []
+        self._ready: 'queue.Queue[DeliveryTask]' = queue.Queue()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._threads: List[threading.Thread] = []
+        self._pending = 0
+        self._in_progress = 0
+        self._counters: Dict[str, int] = {'submitted': 0, 'rejected': 0, 'sent': 0, 'retried': 0, 'failed': 0}
+
+    def start(self) -> None:
+        """Запускает таймер и потоки отправки, если они ещё не запущены."""
+
+        with self._condition:
+            if self._threads:
+                return
+            timer = threading.Thread(target=self._schedule, name='delivery-timer', daemon=True)
+            timer.start()
+            self._threads.append(timer)
+            for number in range(self._workers):
+                thread = threading.Thread(target=self._work, args=(number,), name=f'delivery-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f'Delivery dispatcher started with {self._workers} workers')
+
+    def submit(self, task: DeliveryTask) -> bool:
+        """Ставит задачу на немедленную отправку.
+
+        Возвращает False, если ожидающих задач уже слишком много - тогда сообщение помечается как FAILED."""
+
+        self.start()
+        with self._condition:
+            if self._pending >= self._max_pending:
+                self._counters['rejected'] += 1
+                rejected = True
+            else:
+                self._pending += 1
+                self._counters['submitted'] += 1
+                rejected = False
+        if rejected:
+            logger.error(f'Delivery queue is full, message rejected: {task.key}')
+            task.last_error = 'delivery queue is full'
+            try:
+                self._on_failed(task)
+            finally:
+                if task.done is not None:
+                    task.done(task)
+            return False
+        self._ready.put(task)
+        return True
+
+    def _schedule(self) -> None:
+        """Переносит задачи, время повтора которых наступило, в очередь готовых."""
+
+        while True:
+            with self._condition:
+                while not self._delayed or self._delayed[0][0] > time.monotonic():
+                    timeout = self._delayed[0][0] - time.monotonic() if self._delayed else None
+                    self._condition.wait(timeout)
+                _, _, task = heapq.heappop(self._delayed)
+            self._ready.put(task)
+
+    def _retry_later(self, task: DeliveryTask) -> None:
+        due = time.monotonic() + backoff_delay(task.attempts)
+        with self._condition:
+            heapq.heappush(self._delayed, (due, next(self._sequence), task))
+            self._counters['retried'] += 1
+            self._condition.notify()
+
+    def _work(self, number: int) -> None:
+        while True:
+            task = self._ready.get()
+            with self._condition:
+                self._in_progress += 1
+            close_old_connections()
+            try:
+                self._attempt(task)
+            except Exception as e:
+                logger.exception(f'Delivery worker {number} failed on {task.key}: {e.args}')
+            finally:
+                with self._condition:
+                    self._in_progress -= 1
+                    self._condition.notify_all()
+                close_old_connections()
+                self._ready.task_done()
+
+    def _attempt(self, task: DeliveryTask) -> None:
+        task.attempts += 1
+        outcome = 'sent'
+        try:
+            task.send()
+        except Exception as e:
+            task.last_error = f'{type(e).__name__}: {e}'
+            expired = time.monotonic() - task.created_at >= self._max_age
+            if is_retryable(e) and not expired:
+                logger.warning(f'Delivery of {task.key} failed (attempt {task.attempts}), will retry: {e.args}')
+                self._retry_later(task)
+                return
+            logger.error(f'Delivery of {task.key} failed after {task.attempts} attempts: {task.last_error}')
+            outcome = 'failed'
+        try:
+            if outcome == 'sent':
+                self._on_sent(task)
+            else:
+                self._on_failed(task)
+        finally:
+            if task.done is not None:
+                task.done(task)
+            with self._condition:
+                self._pending -= 1
+                self._counters[outcome] += 1
+
+    def capacity(self) -> int:
+        """Возвращает, сколько задач ещё можно поставить без отказа."""
+
+        with self._condition:
+            return max(self._max_pending - self._pending, 0)
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Ждёт, пока все поставленные задачи не будут отправлены или не получат статус FAILED."""
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending or self._in_progress:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining if remaining is not None else 0.1)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            next_retry = round(self._delayed[0][0] - time.monotonic(), 3) if self._delayed else None
+            return {
+                'workers': self._workers,
+                'pending': self._pending,
+                'ready': self._ready.qsize(),
+                'delayed': len(self._delayed),
+                'in_progress': self._in_progress,
+                'next_retry_in': next_retry,
+                **self._counters,
+            }
@@ -17,3 +17,13 @@ class JivoServerError(Exception):
         super().__init__(
             f'JIVO error: code {code} -> {text}"'
         )
+
+
+class PlatformUnavailableError(Exception):
+    """Возникает, когда платформа временно не принимает сообщения (HTTP 429 или 5xx) - отправку стоит повторить."""
+
+    def __init__(self, platform: str, status_code: int) -> None:
+        self.status_code = status_code
+        super().__init__(
+            f'{platform} unavailable: HTTP {status_code}'
+        )
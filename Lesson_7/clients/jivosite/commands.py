@@ -0,0 +1,186 @@
+"""Модуль хранилища команд кнопок Jivo.
+
+Jivo присылает в вебхуке только текст нажатой кнопки, поэтому для каждого чата хранится соответствие
+текста кнопок последнего сообщения командам (Callback в JSON). Хранилище ограничено по размеру,
+записи истекают через JIVO_COMMAND_STORE_TTL секунд. Бэкенд выбирается переменной JIVO_COMMAND_BACKEND:
+memory - LRU-кэш в памяти процесса, sqlite - файл SQLite, общий для всех воркеров на узле, так что нажатие
+кнопки, попавшее в другой воркер, не теряет команду."""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from common.cache import LRUCache
+from patterns.singleton import Singleton
+from .jivo_constants import (JivoCommandBackend, JIVO_COMMAND_BACKEND, JIVO_COMMAND_STORE_PATH,
+                             JIVO_COMMAND_STORE_SIZE, JIVO_COMMAND_STORE_TTL)
+
+
+logger = logging.getLogger('root')
+
+Commands = Dict[str, Optional[str]]
+
+
+class CommandBackend(ABC):
+    """Абстрактный интерфейс хранилища: id клиента Jivo -> {текст кнопки: команда}."""
+
+    @abstractmethod
+    def get(self, client_id: str) -> Optional[Commands]:
+        pass
+
+    @abstractmethod
+    def set(self, client_id: str, commands: Commands) -> None:
+        pass
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    @abstractmethod
+    def stats(self) -> Dict[str, Any]:
+        pass
+
+
+class MemoryCommandBackend(CommandBackend):
+    """Хранилище в памяти процесса на основе LRUCache."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._cache: LRUCache[str, Commands] = LRUCache(maxsize, ttl)
+
+    def get(self, client_id: str) -> Optional[Commands]:
+        return self._cache.get(client_id)
+
+    def set(self, client_id: str, commands: Commands) -> None:
+        self._cache.set(client_id, commands)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': JivoCommandBackend.MEMORY.value, **self._cache.stats()}
+
+
+class SqliteCommandBackend(CommandBackend):
+    """Хранилище в файле SQLite, общее для всех процессов узла.
+
+    Файл открывается в режиме WAL, у каждого потока своё соединение. Лишние записи вытесняются
+    в порядке давности записи, а не чтения, чтобы чтение не требовало записи в файл.
+    Размер хранилища общий, счётчики попаданий, вытеснений и истёкших записей - свои у каждого процесса."""
+
+    def __init__(self, path: str, maxsize: int, ttl: float) -> None:
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        connection = self._connection()
+        connection.execute('CREATE TABLE IF NOT EXISTS jivo_commands ('
+                           'client_id TEXT PRIMARY KEY, commands TEXT NOT NULL, '
+                           'expires_at REAL NOT NULL, written_at REAL NOT NULL)')
+        connection.execute('CREATE INDEX IF NOT EXISTS jivo_commands_written_at ON jivo_commands (written_at)')
+        connection.execute('CREATE INDEX IF NOT EXISTS jivo_commands_expires_at ON jivo_commands (expires_at)')
+
+    def _connection(self) -> sqlite3.Connection:
+        connection: Optional[sqlite3.Connection] = getattr(self._local, 'connection', None)
+        if connection is None:
+            # isolation_level=None - каждая команда фиксируется сразу, без неявных транзакций
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, client_id: str) -> Optional[Commands]:
+        row = self._connection().execute(
+            'SELECT commands, expires_at FROM jivo_commands WHERE client_id = ?', (client_id,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if row[1] <= time.time():
+            self._connection().execute('DELETE FROM jivo_commands WHERE client_id = ? AND expires_at <= ?',
+                                       (client_id, time.time()))
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self.hits += 1
+        commands: Commands = json.loads(row[0])
+        return commands
+
+    def set(self, client_id: str, commands: Commands) -> None:
+        now = time.time()
+        connection = self._connection()
+        connection.execute('INSERT OR REPLACE INTO jivo_commands (client_id, commands, expires_at, written_at) '
+                           'VALUES (?, ?, ?, ?)', (client_id, json.dumps(commands), now + self.ttl, now))
+        self.expirations += connection.execute('DELETE FROM jivo_commands WHERE expires_at <= ?', (now,)).rowcount
+        excess = self._size() - self.maxsize
+        if excess > 0:
+            self.evictions += connection.execute(
+                'DELETE FROM jivo_commands WHERE client_id IN '
+                '(SELECT client_id FROM jivo_commands ORDER BY written_at LIMIT ?)', (excess,)
+            ).rowcount
+
+    def _size(self) -> int:
+        return int(self._connection().execute('SELECT COUNT(*) FROM jivo_commands').fetchone()[0])
+
+    def clear(self) -> None:
+        self._connection().execute('DELETE FROM jivo_commands')
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'backend': JivoCommandBackend.SQLITE.value,
+            'path': self.path,
+            'size': self._size(),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+def create_backend(backend: JivoCommandBackend = JIVO_COMMAND_BACKEND,
+                   maxsize: int = JIVO_COMMAND_STORE_SIZE,
+                   ttl: float = JIVO_COMMAND_STORE_TTL,
+                   path: str = JIVO_COMMAND_STORE_PATH) -> CommandBackend:
+    if backend == JivoCommandBackend.SQLITE:
+        return SqliteCommandBackend(path, maxsize, ttl)
+    return MemoryCommandBackend(maxsize, ttl)
+
+
+class CommandStore(metaclass=Singleton):
+    """Единственный на процесс экземпляр хранилища команд с выбранным бэкендом."""
+
+    def __init__(self, backend: Optional[CommandBackend] = None) -> None:
+        self.backend = backend if backend is not None else create_backend()
+        logger.info(f'Jivo command store: {type(self.backend).__name__}')
+
+    def get(self, client_id: str) -> Optional[Commands]:
+        return self.backend.get(client_id)
+
+    def set(self, client_id: str, commands: Commands) -> None:
+        self.backend.set(client_id, commands)
+
+    def command_for(self, client_id: str, text: Optional[str]) -> Optional[str]:
+        """Возвращает команду кнопки с текстом text из последнего сообщения чата или None."""
+
+        commands = self.get(client_id)
+        if not commands or text is None:
+            return None
+        return commands.get(text)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return self.backend.stats()
@@ -4,6 +4,10 @@ from enum import Enum
 
 JIVO_WH_KEY = os.getenv('JIVO_WH_KEY')
 JIVO_TOKEN = os.getenv('JIVO_TOKEN')
+# сети, с которых Jivo присылает вебхуки; пустое значение отключает проверку адреса
+JIVO_IP_POOL = os.getenv('JIVO_IP_POOL', '')
+# шаблон адреса отправки сообщений; по умолчанию - АПИ Jivo из strings.ini, для util/platform_stub.py - адрес заглушки
+JIVO_API_LINK = os.getenv('JIVO_API_LINK')
 
 
 class JivoResponseType(Enum):
@@ -33,3 +37,17 @@ class JivoMessageType(Enum):
     TEXT = 'TEXT'
     MARKDOWN = 'MARKDOWN'
     BUTTONS = 'BUTTONS'
+
+
+class JivoCommandBackend(Enum):
+    """Где хранится соответствие текста кнопок командам: в памяти процесса или в общем файле SQLite узла."""
+
+    MEMORY = 'memory'
+    SQLITE = 'sqlite'
+
+
+JIVO_COMMAND_BACKEND = JivoCommandBackend(os.getenv('JIVO_COMMAND_BACKEND', JivoCommandBackend.MEMORY.value))
+JIVO_COMMAND_STORE_PATH = os.getenv('JIVO_COMMAND_STORE_PATH', '/tmp/jivo_commands.sqlite3')
+JIVO_COMMAND_STORE_SIZE = int(os.getenv('JIVO_COMMAND_STORE_SIZE', '10000'))
+# сколько секунд кнопки последнего сообщения чата остаются действительными
+JIVO_COMMAND_STORE_TTL = float(os.getenv('JIVO_COMMAND_STORE_TTL', '86400'))
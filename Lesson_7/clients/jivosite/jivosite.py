@@ -1,16 +1,24 @@
-from datetime import datetime, timedelta
-import requests
+from datetime import datetime
+import functools
+import json
 import logging
 from typing import Dict, Any, Optional, TYPE_CHECKING
 
-from bot.models import Bot, Message
+from marshmallow.exceptions import ValidationError
+
+from bot.registry import BotRegistry
 from clients.abstract import SocialPlatformClient
-from clients.exceptions import JivoServerError
+from clients.delivery import DeliveryDispatcher, DeliveryTask
+from clients.exceptions import JivoServerError, PlatformUnavailableError
+from common.allowlist import IpAllowlist, client_ip
 from common.constants import MessageDirection, ChatType, MessageContentType, BotType
 from common.entities import EventCommandToSend, EventCommandReceived
+from common.keyboards import KeyboardCache
+from common.serializers import SerializerRegistry
+from clients.jivosite.commands import Commands, CommandStore
 from clients.jivosite.jivo_entities import JivoEvent, JivoIncomingWebhook
-from clients.jivosite.jivo_constants import JivoEventType, JivoMessageType, JIVO_WH_KEY, JIVO_TOKEN
-from bot.apps import SingletonAPS
+from clients.jivosite.jivo_constants import (JivoEventType, JivoMessageType, JIVO_API_LINK, JIVO_IP_POOL,
+                                             JIVO_WH_KEY, JIVO_TOKEN)
 from common.strings import JivoStrings
 
 if TYPE_CHECKING:
@@ -18,7 +26,6 @@ if TYPE_CHECKING:
 
 
 logger = logging.getLogger('root')
-bot_scheduler = SingletonAPS().get_aps
 
 
 class JivositeClient(SocialPlatformClient):
@@ -30,15 +37,17 @@ class JivositeClient(SocialPlatformClient):
     """
 
     headers: Dict[str, Any] = {'Content-Type': 'application/json'}
-    command_cache: Dict[str, Dict[str, Optional[str]]] = {}
-    _send_link = JivoStrings.API_LINK.value.format(
+    _send_link = (JIVO_API_LINK or JivoStrings.API_LINK.value).format(
         key=JIVO_WH_KEY, token=JIVO_TOKEN
     )
+    ip_allowlist: Optional[IpAllowlist] = IpAllowlist.parse(JIVO_IP_POOL) if JIVO_IP_POOL.strip() else None
 
     @staticmethod
     def verify_request(request: 'HttpRequest') -> bool:
-        # todo implement auth session?
-        return True
+        """Проверяет адрес отправителя вебхука, если задан JIVO_IP_POOL. Тело запроса не читается."""
+
+        allowlist = JivositeClient.ip_allowlist
+        return allowlist is None or client_ip(request) in allowlist
 
     def _form_message(self, payload: EventCommandToSend) -> JivoEvent:
         """Создаёт программный объект с данными исходящего сообщения, готовыми для отправки."""
@@ -74,16 +83,47 @@ class JivositeClient(SocialPlatformClient):
         else:
             msg_data['type'] = JivoMessageType.TEXT
         event_data['message'] = msg_data
-        event = JivoEvent.Schema().load(event_data)
+        event = SerializerRegistry().load(JivoEvent, event_data)
 
         logger.debug(event)
 
+        return event
+
+    def remember_reply(self, payload: EventCommandToSend) -> None:
+        """Запоминает соответствие текста кнопок ответа их командам: Jivo пришлёт только текст нажатой кнопки."""
+
         if payload.inline_buttons:
-            self.command_cache[payload.chat_id_in_messenger] = {
-                btn.text: btn.action.payload for btn in payload.inline_buttons
-            }
+            CommandStore().set(payload.chat_id_in_messenger, self._commands(payload))
 
-        return event
+    @staticmethod
+    def _commands(payload: EventCommandToSend) -> Commands:
+        """Возвращает соответствие текста кнопок сообщения их командам."""
+
+        return {btn.text: btn.action.payload for btn in payload.inline_buttons or ()}
+
+    def _serialize(self, payload: EventCommandToSend) -> str:
+        """Возвращает JSON исходящего события.
+
+        Для сообщений с ключом клавиатуры поля сообщения (текст, кнопки) берутся из KeyboardCache в готовом
+        виде, а подставляются только идентификаторы, клиент и время."""
+
+        if payload.keyboard_key is None:
+            event = self._form_message(payload)
+            return SerializerRegistry().dumps(event)
+
+        message_fields = KeyboardCache().get('jivo', payload.keyboard_key)
+        if message_fields is None:
+            event = self._form_message(payload)
+            message = SerializerRegistry().dump(event)['message']
+            del message['timestamp']
+            # поля сообщения без фигурных скобок, чтобы дописать к ним время отправки
+            message_fields = json.dumps(message)[1:-1]
+            KeyboardCache().set('jivo', payload.keyboard_key, message_fields)
+        client_id = json.dumps(payload.chat_id_in_messenger)
+        message_id = json.dumps(str(payload.message_id))
+        timestamp = int(datetime.now().timestamp())
+        return (f'{{"client_id": {client_id}, "event": "{JivoEventType.BOT_MESSAGE.value}", '
+                f'"message": {{{message_fields}, "timestamp": {timestamp}}}, "id": {message_id}}}')
 
     def _invite_agent(self, wh: JivoIncomingWebhook) -> None:
         data = {
@@ -93,26 +133,25 @@ class JivositeClient(SocialPlatformClient):
             'client_id': wh.client_id,
             'chat_id': wh.chat_id,
         }
-        event = JivoEvent.Schema().load(data)
-        bot_scheduler.add_job(
-            self._post_to_platform,
-            'interval',
-            seconds=5,
-            next_run_time=datetime.now(),
-            end_date=datetime.now() + timedelta(minutes=5),
-            args=[data['id'], self._send_link, event.Schema().dumps(event)],
-            id=f'jivo_-{wh.client_id}',
-            )
+        event = SerializerRegistry().load(JivoEvent, data)
+        # приглашение оператора не связано с сообщением в базе, поэтому статус отправки не сохраняется
+        DeliveryDispatcher().submit(DeliveryTask(
+            f'jivo_{data["id"]}',
+            functools.partial(self._post_to_platform, self._send_link, SerializerRegistry().dumps(event)),
+        ))
 
     def parse_webhook(self, request: 'HttpRequest') -> EventCommandReceived:
         """Преобразует объект входящего вебхука в формат входящей команды бота - ECR."""
 
         logger.debug(f'For parsing: {request.body}')
-        wh = JivoIncomingWebhook.Schema().loads(request.body)
+        wh = SerializerRegistry().loads(JivoIncomingWebhook, request.body)
         logger.debug(wh)
+        if wh.message is None:
+            # вью отвечает на вебхук, не прошедший проверку схемы, 200 OK и пишет ошибку в лог
+            raise ValidationError({'message': ['Field may not be null.']})
         # формирование объекта с данными для ECR
         ecr_data: Dict[str, Any] = {
-            'bot_id': Bot.objects.get_bot_id_by_type(BotType.TYPE_JIVOSITE.value),
+            'bot_id': BotRegistry().get_bot_id(BotType.TYPE_JIVOSITE.value),
             'chat_id_in_messenger': wh.client_id,  # important, do not change
             'content_type': MessageContentType.COMMAND,
             'payload': {
@@ -124,16 +163,17 @@ class JivositeClient(SocialPlatformClient):
             # switched places
             'user_id_in_messenger': str(wh.chat_id),
             'user_name_in_messenger': 'Тест',
-            'message_id_in_messenger': str(wh.sender.id),
+            # id события, по нему отбрасываются повторные доставки вебхука
+            'message_id_in_messenger': wh.id,
             'reply_id_in_messenger': None,
             'ts_in_messenger': str(datetime.fromtimestamp(int(wh.message.timestamp))),
         }
 
-        try:
-            if self.command_cache[wh.client_id]:
-                ecr_data['payload']['command'] = self.command_cache[wh.client_id][wh.message.text]
-        except KeyError as err:
-            logger.debug(f'nothing in command_cache: {err.args}')
+        command = CommandStore().command_for(wh.client_id, wh.message.text)
+        if command is not None:
+            ecr_data['payload']['command'] = command
+        else:
+            logger.debug(f'nothing in command store for {wh.client_id}')
 
         if wh.message.text == JivoStrings.INVITE_OPERATOR.value:
             logger.info('Agent invited: {}'.format(wh.client_id))
@@ -141,42 +181,37 @@ class JivositeClient(SocialPlatformClient):
             # todo more hacks
             ecr_data['payload']['command'] = '{"type": "invite", "id": 0}'
 
-        ecr = EventCommandReceived.Schema().load(ecr_data)
+        ecr = SerializerRegistry().load(EventCommandReceived, ecr_data)
 
         logger.debug(ecr)
 
         return ecr
 
-    def _post_to_platform(self, message_id: str, send_link: str, data: str,) -> None:
-        print('Trying to send...')
+    def _post_to_platform(self, send_link: str, data: str) -> None:
+        """Выполняет одну попытку отправки; повторами занимается DeliveryDispatcher."""
 
-        try:
-            r = requests.post(send_link, headers=self.headers, data=data)
-            logger.debug(f'JIVO answered: {r.text}')
-            bot_scheduler.remove_job(f'jivo_{message_id}')
-            if 'error' in r.json():
-                err = r.json()['error']
-                logger.error(f'OK error: {err["code"]} -> {err["message"]}')
-                raise JivoServerError(err["code"], err["message"])
-            if message_id[0] != '-':
-                Message.objects.set_sent(int(message_id))
-        except (requests.Timeout, requests.ConnectionError) as e:
-            logger.error(f'JIVO unreachable{e.args}')
+        r = self._post(send_link, data)
+        logger.debug(f'JIVO answered: {r.text}')
+        if r.status_code == 429 or r.status_code >= 500:
+            raise PlatformUnavailableError('JIVO', r.status_code)
+        body = self._response_body(r)
+        if isinstance(body, dict) and 'error' in body:
+            err = body['error']
+            logger.error(f'JIVO error: {err["code"]} -> {err["message"]}')
+            raise JivoServerError(err["code"], err["message"])
+        if r.status_code >= 400:
+            logger.error(f'JIVO error: HTTP {r.status_code} -> {body}')
+            raise JivoServerError(str(r.status_code), str(body))
 
-    def send_message(self, payload: EventCommandToSend) -> None:
-        """Отправляет соответствующее используемой команде формата ECTS сообщение в Jivo."""
+    def delivery_task(self, payload: EventCommandToSend) -> DeliveryTask:
+        """Формирует запрос с соответствующим используемой команде формата ECTS сообщением для Jivo."""
 
-        msg = self._form_message(payload)
-        data = msg.Schema().dumps(msg)
+        data = self._serialize(payload)
 
         logger.debug(f'Sending to JIVO: {data}')
 
-        bot_scheduler.add_job(
-            self._post_to_platform,
-            'interval',
-            seconds=5,
-            next_run_time=datetime.now(),
-            end_date=datetime.now() + timedelta(minutes=5),
-            args=[payload.message_id, self._send_link, data],
-            id=f'jivo_{payload.message_id}',
-            )
+        return DeliveryTask(
+            f'jivo_{payload.message_id}',
+            functools.partial(self._post_to_platform, self._send_link, data),
+            payload.message_id,
+        )
@@ -1,18 +1,21 @@
-import requests
+import functools
+import json
 import logging
-from datetime import datetime, timedelta
-from ipaddress import ip_network, ip_address
+from datetime import datetime
 from typing import Dict, Any, TYPE_CHECKING
 
 from common.builders import MessageDirector
-from bot.models import Bot, Message
+from bot.registry import BotRegistry
 from common.constants import MessageDirection, ChatType, MessageContentType, BotType
 from common.entities import EventCommandToSend, EventCommandReceived
-from .ok_constants import OK_TOKEN
+from common.keyboards import KeyboardCache
+from common.serializers import SerializerRegistry
+from .ok_constants import OK_API_LINK, OK_IP_POOL, OK_TOKEN
 from .ok_entities import OkOutgoingMessage, OkIncomingWebhook
-from bot.apps import SingletonAPS
 from clients.abstract import SocialPlatformClient
-from clients.exceptions import OkServerError
+from clients.delivery import DeliveryTask
+from clients.exceptions import OkServerError, PlatformUnavailableError
+from common.allowlist import IpAllowlist, client_ip
 from common.strings import OkStrings
 
 if TYPE_CHECKING:
@@ -20,7 +23,6 @@ if TYPE_CHECKING:
 
 
 logger = logging.getLogger('root')
-bot_scheduler = SingletonAPS().get_aps
 
 
 class OkClient(SocialPlatformClient):
@@ -32,35 +34,47 @@ class OkClient(SocialPlatformClient):
     """
 
     headers: Dict[str, Any] = {'Content-Type': 'application/json;charset=utf-8'}
+    ip_allowlist = IpAllowlist.parse(OK_IP_POOL or OkStrings.IP_POOL.value)
 
     @staticmethod
     def verify_request(request: 'HttpRequest') -> bool:
-        ip_pool = [ip_network(net)
-                   for net in OkStrings.IP_POOL.value.split(', ')]
-        # todo might not work due to host routing
-        logger.info(f'request.META: {request.META}')
-        host_ip = ip_address(request.META.get('HTTP_X_FORWARDED_FOR').split(', ')[0])
+        """Проверяет, что вебхук пришёл из сетей OK. Тело запроса не читается."""
 
-        for network in ip_pool:
-            if host_ip in network:
-                return True
-        return False
+        return client_ip(request) in OkClient.ip_allowlist
 
     def _form_message(self, payload: EventCommandToSend) -> OkOutgoingMessage:
 
         msg = MessageDirector().create_ok_message(payload)
-        msg.Schema().validate(msg.Schema().dump(msg))
+        SerializerRegistry().validate(msg)
 
         logger.debug(msg)
 
         return msg
 
+    def _serialize(self, payload: EventCommandToSend) -> str:
+        """Возвращает JSON исходящего сообщения.
+
+        Для сообщений с ключом клавиатуры тело сообщения берётся из KeyboardCache в готовом виде,
+        а подставляется только получатель."""
+
+        if payload.keyboard_key is None:
+            msg = self._form_message(payload)
+            return SerializerRegistry().dumps(msg)
+
+        message = KeyboardCache().get('ok', payload.keyboard_key)
+        if message is None:
+            msg = self._form_message(payload)
+            message = json.dumps(SerializerRegistry().dump(msg)['message'])
+            KeyboardCache().set('ok', payload.keyboard_key, message)
+        recipient = json.dumps({'chat_id': payload.chat_id_in_messenger})
+        return f'{{"message": {message}, "recipient": {recipient}}}'
+
     def parse_webhook(self, request: 'HttpRequest') -> EventCommandReceived:
-        wh = OkIncomingWebhook.Schema().loads(request.body)
+        wh = SerializerRegistry().loads(OkIncomingWebhook, request.body)
         logger.debug(wh)
         # формирование объекта с данными для ECR
         ecr_data: Dict[str, Any] = {
-            'bot_id': Bot.objects.get_bot_id_by_type(BotType.TYPE_OK.value),
+            'bot_id': BotRegistry().get_bot_id(BotType.TYPE_OK.value),
             'chat_id_in_messenger': wh.recipient.chat_id,
             'content_type': MessageContentType.COMMAND,
             'payload': {
@@ -71,44 +85,37 @@ class OkClient(SocialPlatformClient):
             'chat_type': ChatType.PRIVATE,
             'user_id_in_messenger': wh.sender.user_id,
             'user_name_in_messenger': wh.sender.name,
-            'message_id_in_messenger': wh.mid if wh.mid else wh.message.mid,
+            'message_id_in_messenger': wh.mid or wh.callbackId or (wh.message.mid if wh.message else None),
             'reply_id_in_messenger': wh.message.reply_to if wh.message else None,
             'ts_in_messenger': str(datetime.fromtimestamp(wh.timestamp // 1000)),
         }
-        ecr = EventCommandReceived.Schema().load(ecr_data)
+        ecr = SerializerRegistry().load(EventCommandReceived, ecr_data)
         # logger.debug(ecr)
 
         return ecr
 
-    def _post_to_platform(self, message_id: int, send_link: str, data: str) -> None:
-        print('Trying to send...')
-        try:
-            r = requests.post(send_link, headers=self.headers, data=data)
-            logger.debug(f'OK answered: {r.text}')
-            bot_scheduler.remove_job(f'ok_{message_id}')
-            if 'invocation-error' in r.headers:
-                logger.error(f'OK error: {r.headers["invocation-error"]} -> {r.json()}')
-                raise OkServerError(r.headers["invocation-error"], r.json())
-            Message.objects.set_sent(message_id)
-        except (requests.Timeout, requests.ConnectionError) as e:
-            logger.error(f'OK unreachable: {e.args}')
-
-    def send_message(self, payload: EventCommandToSend) -> None:
-        msg = self._form_message(payload)
-
-        send_link = OkStrings.API_LINK.value.format(
+    def _post_to_platform(self, send_link: str, data: str) -> None:
+        """Выполняет одну попытку отправки; повторами занимается DeliveryDispatcher."""
+
+        r = self._post(send_link, data)
+        logger.debug(f'OK answered: {r.text}')
+        if r.status_code == 429 or r.status_code >= 500:
+            raise PlatformUnavailableError('OK', r.status_code)
+        if 'invocation-error' in r.headers:
+            body = self._response_body(r)
+            logger.error(f'OK error: {r.headers["invocation-error"]} -> {body}')
+            raise OkServerError(r.headers["invocation-error"], body)
+
+    def delivery_task(self, payload: EventCommandToSend) -> DeliveryTask:
+        send_link = (OK_API_LINK or OkStrings.API_LINK.value).format(
             chat_id=payload.chat_id_in_messenger, token=OK_TOKEN
         )
 
-        data = msg.Schema().dumps(msg)
+        data = self._serialize(payload)
         logger.debug(f'Sending to OK: {data}')
 
-        bot_scheduler.add_job(
-            self._post_to_platform,
-            'interval',
-            seconds=5,
-            next_run_time=datetime.now(),
-            end_date=datetime.now() + timedelta(minutes=5),
-            args=[payload.message_id, send_link, data],
-            id=f'ok_{payload.message_id}',
-            )
+        return DeliveryTask(
+            f'ok_{payload.message_id}',
+            functools.partial(self._post_to_platform, send_link, data),
+            payload.message_id,
+        )
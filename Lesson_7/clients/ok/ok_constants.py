@@ -3,6 +3,10 @@ from enum import Enum
 
 
 OK_TOKEN = os.getenv('OK_TOKEN')
+# сети, с которых OK присылает вебхуки; по умолчанию - список из strings.ini
+OK_IP_POOL = os.getenv('OK_IP_POOL')
+# шаблон адреса отправки сообщений; по умолчанию - АПИ OK из strings.ini, для util/platform_stub.py - адрес заглушки
+OK_API_LINK = os.getenv('OK_API_LINK')
 
 
 class OkButtonType(Enum):
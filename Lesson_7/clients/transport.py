@@ -0,0 +1,93 @@
+"""Модуль общего HTTP-транспорта клиентов социальных платформ.
+
+Для каждого хоста создаётся одна сессия requests с пулом keep-alive соединений, поэтому повторные
+запросы к платформе не тратят время на установку TCP и TLS. Все запросы выполняются с таймаутами
+на соединение и чтение, а количество соединений с одним хостом ограничено размером пула."""
+
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from patterns.singleton import Singleton
+from .constants import TRANSPORT_CONNECT_TIMEOUT, TRANSPORT_READ_TIMEOUT, TRANSPORT_POOL_SIZE
+
+
+logger = logging.getLogger('root')
+
+
+class HttpTransport(metaclass=Singleton):
+    """Хранит по одной сессии с пулом соединений на хост и выполняет через них запросы."""
+
+    def __init__(self,
+                 connect_timeout: float = TRANSPORT_CONNECT_TIMEOUT,
+                 read_timeout: float = TRANSPORT_READ_TIMEOUT,
+                 pool_size: int = TRANSPORT_POOL_SIZE) -> None:
+        self.timeout: Tuple[float, float] = (connect_timeout, read_timeout)
+        self._pool_size = max(pool_size, 1)
+        self._sessions: Dict[str, requests.Session] = {}
+        self._adapters: Dict[str, HTTPAdapter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        parts = urlsplit(url)
+        return f'{parts.scheme}://{parts.netloc}'
+
+    def session(self, url: str) -> requests.Session:
+        host = self.host_of(url)
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    session = requests.Session()
+                    # pool_block: при исчерпании пула запрос ждёт свободное соединение, а не открывает лишнее
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size, pool_block=True)
+                    session.mount(f'{urlsplit(url).scheme}://', adapter)
+                    self._sessions[host] = session
+                    self._adapters[host] = adapter
+                    logger.info(f'HTTP session opened for {host}')
+        return session
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Выполняет запрос через сессию хоста. Таймауты можно переопределить аргументом timeout."""
+
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session(url).request(method, url, **kwargs)
+
+    def post(self, url: str, data: Optional[str] = None, headers: Optional[Dict[str, Any]] = None,
+             **kwargs: Any) -> requests.Response:
+        return self.request('POST', url, data=data, headers=headers, **kwargs)
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._adapters.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Возвращает для каждого хоста количество запросов, открытых соединений и повторно использованных."""
+
+        hosts: Dict[str, Dict[str, int]] = {}
+        for host, adapter in list(self._adapters.items()):
+            counters = {'requests': 0, 'connections': 0, 'idle': 0}
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                counters['requests'] += pool.num_requests
+                counters['connections'] += pool.num_connections
+                counters['idle'] += pool.pool.qsize() if pool.pool is not None else 0
+            counters['reused'] = max(counters['requests'] - counters['connections'], 0)
+            hosts[host] = counters
+        return {
+            'timeout': list(self.timeout),
+            'pool_size': self._pool_size,
+            'hosts': hosts,
+        }
@@ -0,0 +1,73 @@
+"""Модуль списков разрешённых IP-адресов для проверки входящих вебхуков.
+
+Список сетей разбирается один раз при создании: сети переводятся в отсортированные непересекающиеся
+диапазоны целых чисел, поэтому проверка адреса - двоичный поиск, а не перебор сетей ip_network."""
+
+from bisect import bisect_right
+from ipaddress import IPv6Address, ip_address, ip_network
+from typing import Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+from .constants import WEBHOOK_TRUSTED_PROXIES
+
+if TYPE_CHECKING:
+    from django.http import HttpRequest
+
+
+class IpAllowlist:
+    """Множество IPv4/IPv6 сетей с проверкой вхождения адреса за O(log n)."""
+
+    def __init__(self, networks: Iterable[str]) -> None:
+        ranges: Dict[int, List[Tuple[int, int]]] = {4: [], 6: []}
+        for net in networks:
+            network = ip_network(net.strip(), strict=False)
+            ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+        self._starts: Dict[int, List[int]] = {}
+        self._ends: Dict[int, List[int]] = {}
+        for version, items in ranges.items():
+            merged: List[Tuple[int, int]] = []
+            for start, end in sorted(items):
+                # смежные и пересекающиеся сети объединяются в один диапазон
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    @classmethod
+    def parse(cls, value: str) -> 'IpAllowlist':
+        """Создаёт список из строки сетей через запятую, например '217.20.145.192/28, 10.0.0.1'."""
+
+        return cls(net for net in value.split(',') if net.strip())
+
+    def __contains__(self, address: object) -> bool:
+        if not isinstance(address, str):
+            return False
+        try:
+            ip = ip_address(address.strip())
+        except ValueError:
+            return False
+        if isinstance(ip, IPv6Address) and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+        value = int(ip)
+        index = bisect_right(self._starts[ip.version], value) - 1
+        return index >= 0 and value <= self._ends[ip.version][index]
+
+    def __len__(self) -> int:
+        return sum(len(starts) for starts in self._starts.values())
+
+
+def client_ip(request: 'HttpRequest', trusted_proxies: int = WEBHOOK_TRUSTED_PROXIES) -> Optional[str]:
+    """Возвращает адрес отправителя запроса.
+
+    Без доверенных прокси - REMOTE_ADDR. Каждый прокси дописывает в X-Forwarded-For адрес, с которого получил
+    запрос, а начало заголовка задаёт сам клиент, поэтому за trusted_proxies прокси адрес отправителя -
+    запись на trusted_proxies позиций от правого края. Если записей меньше, запрос прошёл мимо прокси
+    и адрес не определяется."""
+
+    if trusted_proxies > 0:
+        header = request.META.get('HTTP_X_FORWARDED_FOR') or ''
+        entries = [entry.strip() for entry in str(header).split(',') if entry.strip()]
+        return entries[-trusted_proxies] if len(entries) >= trusted_proxies else None
+    address = request.META.get('REMOTE_ADDR')
+    return str(address) if address else None
@@ -0,0 +1,46 @@
+"""Модуль содержит фильтр Блума - компактное вероятностное множество строк.
+
+Фильтр не даёт ложноотрицательных ответов: если строки нет в фильтре, её точно не добавляли.
+Положительный ответ ошибочен с вероятностью не выше error_rate, пока количество добавленных строк
+не превышает capacity."""
+
+import hashlib
+import math
+import threading
+
+
+class BloomFilter:
+    """Фильтр Блума на битовом массиве bytearray с k хеш-функциями, полученными двойным хешированием blake2b."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        self.size = max(int(-self.capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(int(round(self.size / self.capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+        self._lock = threading.Lock()
+
+    def _positions(self, key: str) -> range:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return range(first, first + self.hash_count * second, second)
+
+    def add(self, key: str) -> None:
+        with self._lock:
+            for position in self._positions(key):
+                bit = position % self.size
+                self._bits[bit >> 3] |= 1 << (bit & 7)
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        for position in self._positions(key):
+            bit = position % self.size
+            if not self._bits[bit >> 3] & (1 << (bit & 7)):
+                return False
+        return True
+
+    @property
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
@@ -6,6 +6,8 @@ from clients.ok.ok_entities import (OkOutgoingMessage, OkMessage, OkRecipient, O
                                     OkButtons)
 from common.constants import MessageDirection, MessageContentType, GenericTemplateActionType
 from common.entities import Payload, EventCommandToSend, InlineButton, GenericTemplateAction, Callback
+from common.keyboards import KeyboardCache
+from common.serializers import SerializerRegistry
 
 
 logger = logging.getLogger('root')
@@ -34,20 +36,26 @@ class ECTSBuilder:
         buttons = []
         for entry in button_data:
             action = GenericTemplateAction(GenericTemplateActionType.POSTBACK)
-            action.payload = Callback.Schema().dumps({
-                 'type': entry['type'],
-                 'id': entry['id'],
-            })
+            action.payload = SerializerRegistry().dumps(Callback(type=entry['type'], id=entry['id']))
             btn = InlineButton(entry['title'], action)
             buttons.append(btn)
 
         logger.debug(f'Builder: {buttons}')
         return buttons
 
-    def add_buttons(self, button_data: List[Dict[str, str]]) -> None:
+    def add_buttons(self, button_data: List[Dict[str, Any]], keyboard_key: Optional[str] = None) -> None:
         cmd = self._command
         cmd.content_type = MessageContentType.INLINE
-        cmd.inline_buttons = self._build_buttons(button_data)
+        if keyboard_key is None:
+            cmd.inline_buttons = self._build_buttons(button_data)
+            return
+
+        buttons = KeyboardCache().get('ects', keyboard_key)
+        if buttons is None:
+            buttons = tuple(self._build_buttons(button_data))
+            KeyboardCache().set('ects', keyboard_key, buttons)
+        cmd.inline_buttons = list(buttons)
+        cmd.keyboard_key = keyboard_key
 
 
 class OkOutgoingBuilder:
@@ -88,15 +96,17 @@ class MessageDirector:
             bot_id: int,
             chat_id_in_messenger: str,
             text: str,
-            button_data: Optional[List[Dict[str, Any]]] = None
+            button_data: Optional[List[Dict[str, Any]]] = None,
+            keyboard_key: Optional[str] = None,
     ) -> EventCommandToSend:
+        """Формирует ECTS. keyboard_key передаётся, только если текст и кнопки одинаковы для всех пользователей."""
 
         self._builder = ECTSBuilder()
 
         self._builder.form_preset(bot_id, chat_id_in_messenger)
         self._builder.add_text(text)
         if button_data is not None:
-            self._builder.add_buttons(button_data)
+            self._builder.add_buttons(button_data, keyboard_key)
 
         return self._builder.get_command()
 
@@ -0,0 +1,82 @@
+"""Модуль содержит потокобезопасный LRU-кэш ограниченного размера с истечением записей по времени."""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+
+KT = TypeVar('KT')
+VT = TypeVar('VT')
+
+
+class LRUCache(Generic[KT, VT]):
+    """Кэш, вытесняющий давно не использованные записи при превышении размера.
+
+    Если задан ttl, запись считается отсутствующей по истечении ttl секунд с момента сохранения.
+    Ведёт счётчики попаданий, промахов, вытеснений и истёкших записей."""
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: 'OrderedDict[KT, Tuple[float, VT]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: KT) -> Optional[VT]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, value = entry
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: KT, value: VT) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: KT) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate: Callable[[KT, VT], bool]) -> None:
+        """Удаляет все записи, для которых predicate(key, value) истинен. Выполняется за O(n)."""
+
+        with self._lock:
+            for key in [k for k, (_, v) in self._data.items() if predicate(k, v)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
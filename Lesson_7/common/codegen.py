@@ -0,0 +1,242 @@
+"""Модуль генерации быстрых функций dump/load для схем marshmallow_dataclass.
+
+По описанию полей схемы собирается исходный код двух функций, которые обходят поля в том же порядке,
+что и marshmallow, и дают тот же результат. Простые значения точного типа (str, int, bool, float),
+перечисления, вложенные схемы и списки вложенных схем обрабатываются на месте, остальные поля
+передаются в serialize/deserialize самого поля marshmallow.
+
+Быстрый load не формирует сообщений об ошибках: при любом несоответствии (лишний или отсутствующий ключ,
+неожиданный тип, ошибка валидатора) он выбрасывает FallbackError, и вызывающий код повторяет загрузку
+штатной схемой, получая то же исключение ValidationError, что и без кодогенерации."""
+
+import dataclasses
+import enum
+import logging
+import typing
+from typing import Any, Callable, Dict, List, Optional, Type
+
+import marshmallow
+import marshmallow_enum
+from marshmallow.decorators import POST_DUMP, POST_LOAD, PRE_DUMP, PRE_LOAD, VALIDATES, VALIDATES_SCHEMA
+
+
+logger = logging.getLogger('root')
+
+DumpFunction = Callable[[Any], Dict[str, Any]]
+LoadFunction = Callable[[Any], Any]
+
+# поля, значение которых точного типа возвращается marshmallow без изменений и при dump, и при load
+PLAIN_TYPES: Dict[Type[marshmallow.fields.Field], type] = {
+    marshmallow.fields.String: str,
+    marshmallow.fields.Integer: int,
+    marshmallow.fields.Boolean: bool,
+    marshmallow.fields.Float: float,
+}
+
+
+class FallbackError(Exception):
+    """Быстрый путь не может обработать данные, нужно использовать штатную схему."""
+
+
+class UnsupportedSchemaError(Exception):
+    """Схема использует возможности marshmallow, которые генератор не воспроизводит."""
+
+
+@dataclasses.dataclass
+class Codec:
+    """Пара сгенерированных функций для одного класса схемы."""
+
+    dump: DumpFunction
+    load: LoadFunction
+    source: str
+
+
+def _dataclass_of(annotation: Any) -> Optional[type]:
+    """Возвращает класс данных из аннотации вида X, Optional[X] или List[X]."""
+
+    if dataclasses.is_dataclass(annotation):
+        return typing.cast(type, annotation)
+    for argument in getattr(annotation, '__args__', ()):
+        found = _dataclass_of(argument)
+        if found is not None:
+            return found
+    return None
+
+
+def _renamed(field: marshmallow.fields.Field) -> bool:
+    """Проверяет, задано ли полю другое имя в данных или в объекте."""
+
+    # marshmallow 3.8 аннотирует data_key и attribute как str, хотя без переименования они равны None
+    data_key = typing.cast(Optional[str], field.data_key)
+    attribute = typing.cast(Optional[str], field.attribute)
+    return data_key is not None or attribute is not None
+
+
+def _validators(field: marshmallow.fields.Field) -> List[Callable[[Any], Any]]:
+    # тип атрибута validators mypy не выводит из аннотаций marshmallow 3.8
+    return typing.cast(List[Callable[[Any], Any]], getattr(field, 'validators'))
+
+
+def _enum_class(field: marshmallow.fields.Field) -> Type[enum.Enum]:
+    # marshmallow_enum не аннотирован, атрибуты EnumField читаются через getattr
+    return typing.cast(Type[enum.Enum], getattr(field, 'enum'))
+
+
+def _enum_by_value(field: marshmallow.fields.Field, direction: str) -> bool:
+    """Проверяет, что EnumField выгружает (direction='dump_by') или загружает ('load_by') значение члена."""
+
+    return bool(getattr(field, direction) == marshmallow_enum.EnumField.VALUE)
+
+
+def _check_hooks(schema: marshmallow.Schema) -> List[str]:
+    """Проверяет обработчики схемы и возвращает имена поддерживаемых post_dump-обработчиков."""
+
+    hooks = schema._hooks
+    for tag in (PRE_DUMP, PRE_LOAD, POST_LOAD, VALIDATES_SCHEMA):
+        if hooks[(tag, False)] or hooks[(tag, True)]:
+            raise UnsupportedSchemaError(f'{type(schema).__name__} has {tag} hooks')
+    if hooks[VALIDATES] or hooks[(POST_DUMP, True)]:
+        raise UnsupportedSchemaError(f'{type(schema).__name__} has field validators or pass_many hooks')
+    post_dump = list(hooks[(POST_DUMP, False)])
+    for name in post_dump:
+        if getattr(schema, name).__marshmallow_hook__[(POST_DUMP, False)].get('pass_original'):
+            raise UnsupportedSchemaError(f'{type(schema).__name__}.{name} needs original object')
+    return post_dump
+
+
+class CodecBuilder:
+    """Собирает кодеки для схемы и всех вложенных в неё схем."""
+
+    def __init__(self) -> None:
+        self._codecs: Dict[Type[marshmallow.Schema], Codec] = {}
+
+    def build(self, clazz: type, schema: marshmallow.Schema) -> Codec:
+        schema_class = type(schema)
+        codec = self._codecs.get(schema_class)
+        if codec is None:
+            codec = self._generate(clazz, schema)
+            self._codecs[schema_class] = codec
+        return codec
+
+    def _nested(self, clazz: type, name: str, field: marshmallow.fields.Nested) -> Codec:
+        nested_class = _dataclass_of(typing.get_type_hints(clazz).get(name))
+        unknown = typing.cast(Optional[str], field.unknown)
+        if nested_class is None or field.many or field.only or field.exclude or unknown is not None:
+            raise UnsupportedSchemaError(f'{clazz.__name__}.{name}: unsupported nested field')
+        return self.build(nested_class, field.schema)
+
+    def _generate(self, clazz: type, schema: marshmallow.Schema) -> Codec:
+        if schema.many or schema.unknown != marshmallow.RAISE or schema.only or schema.exclude:
+            raise UnsupportedSchemaError(f'{type(schema).__name__}: unsupported schema options')
+        post_dump = _check_hooks(schema)
+
+        namespace: Dict[str, Any] = {'FallbackError': FallbackError, 'clazz': clazz}
+        dump_lines = ['def dump(obj):', '    result = {}']
+        load_lines = [
+            'def load(data):',
+            '    if type(data) is not dict or not data.keys() <= known_keys:',
+            '        raise FallbackError',
+            '    kwargs = {}',
+        ]
+        known_keys = set()
+
+        for number, (name, field) in enumerate(schema.dump_fields.items()):
+            if _renamed(field) or field.load_only:
+                raise UnsupportedSchemaError(f'{clazz.__name__}.{name}: renamed or load-only field')
+            ref = f'field_{number}'
+            namespace[ref] = field
+            dump_lines.append(f'    value = obj.{name}')
+            dump_lines.extend(f'    {line}' for line in self._dump_value(clazz, name, ref, field, namespace))
+
+        for number, (name, field) in enumerate(schema.load_fields.items()):
+            if _renamed(field) or field.dump_only:
+                raise UnsupportedSchemaError(f'{clazz.__name__}.{name}: renamed or dump-only field')
+            known_keys.add(name)
+            ref = f'load_field_{number}'
+            namespace[ref] = field
+            load_lines.append(f'    if {name!r} in data:')
+            load_lines.append(f'        value = data[{name!r}]')
+            if field.allow_none:
+                load_lines.append('        if value is None:')
+                load_lines.append(f'            kwargs[{name!r}] = None')
+                load_lines.append('        else:')
+            else:
+                load_lines.append('        if value is None:')
+                load_lines.append('            raise FallbackError')
+                load_lines.append('        else:')
+            load_lines.extend(f'            {line}' for line in self._load_value(clazz, name, ref, field, namespace))
+            if field.required:
+                load_lines.extend(['    else:', '        raise FallbackError'])
+            elif field.missing is not marshmallow.missing:
+                namespace[f'{ref}_missing'] = field.missing
+                default = f'{ref}_missing()' if callable(field.missing) else f'{ref}_missing'
+                load_lines.extend(['    else:', f'        kwargs[{name!r}] = {default}'])
+        namespace['known_keys'] = frozenset(known_keys)
+
+        for number, hook in enumerate(post_dump):
+            namespace[f'post_dump_{number}'] = getattr(schema, hook)
+            dump_lines.append(f'    result = post_dump_{number}(result, many=False)')
+        dump_lines.append('    return result')
+        load_lines.append('    return clazz(**kwargs)')
+
+        source = '\n'.join(dump_lines) + '\n\n\n' + '\n'.join(load_lines) + '\n'
+        exec(compile(source, f'<codec {clazz.__module__}.{clazz.__name__}>', 'exec'), namespace)
+        return Codec(namespace['dump'], namespace['load'], source)
+
+    def _dump_value(self, clazz: type, name: str, ref: str, field: marshmallow.fields.Field,
+                    namespace: Dict[str, Any]) -> List[str]:
+        target = f'result[{name!r}]'
+        generic = f'{target} = {ref}.serialize({name!r}, obj)'
+        plain_type = PLAIN_TYPES.get(type(field))
+        if plain_type is not None and not getattr(field, 'as_string', False):
+            namespace[f'{ref}_type'] = plain_type
+            return [f'if value is None or type(value) is {ref}_type:', f'    {target} = value', 'else:',
+                    f'    {generic}']
+        if type(field) is marshmallow_enum.EnumField:
+            attribute = 'value' if _enum_by_value(field, 'dump_by') else 'name'
+            return [f'{target} = None if value is None else value.{attribute}']
+        if type(field) is marshmallow.fields.Nested:
+            namespace[f'{ref}_codec'] = self._nested(clazz, name, field).dump
+            return [f'{target} = None if value is None else {ref}_codec(value)']
+        if type(field) is marshmallow.fields.List and type(field.inner) is marshmallow.fields.Nested:
+            namespace[f'{ref}_codec'] = self._nested(clazz, name, field.inner).dump
+            return [f'{target} = None if value is None else [{ref}_codec(item) for item in value]']
+        return [generic]
+
+    def _load_value(self, clazz: type, name: str, ref: str, field: marshmallow.fields.Field,
+                    namespace: Dict[str, Any]) -> List[str]:
+        target = f'kwargs[{name!r}]'
+        generic = [f'{target} = {ref}.deserialize(value, {name!r}, data)']
+        if _validators(field):
+            return generic
+        plain_type = PLAIN_TYPES.get(type(field))
+        if plain_type is not None:
+            namespace[f'{ref}_type'] = plain_type
+            return [f'if type(value) is {ref}_type:', f'    {target} = value', 'else:', f'    {generic[0]}']
+        if type(field) is marshmallow_enum.EnumField and _enum_by_value(field, 'load_by'):
+            enum_class = _enum_class(field)
+            namespace[f'{ref}_enum'] = enum_class
+            namespace[f'{ref}_members'] = {member.value: member for member in enum_class}
+            return [f'if type(value) is {ref}_enum:', '    member = value',
+                    'elif type(value) in (str, int):', f'    member = {ref}_members.get(value)', 'else:',
+                    '    member = None',
+                    'if member is None:', '    raise FallbackError', f'{target} = member']
+        if type(field) is marshmallow.fields.Nested:
+            namespace[f'{ref}_codec'] = self._nested(clazz, name, field).load
+            return [f'{target} = {ref}_codec(value)']
+        if type(field) is marshmallow.fields.List and type(field.inner) is marshmallow.fields.Nested \
+                and not _validators(field.inner):
+            namespace[f'{ref}_codec'] = self._nested(clazz, name, field.inner).load
+            return ['if type(value) is not list:', '    raise FallbackError',
+                    f'{target} = [{ref}_codec(item) for item in value]']
+        return generic
+
+
+def build_codec(clazz: type, schema: marshmallow.Schema) -> Optional[Codec]:
+    """Возвращает кодек для класса данных или None, если схема не поддерживается генератором."""
+
+    try:
+        return CodecBuilder().build(clazz, schema)
+    except UnsupportedSchemaError as e:
+        logger.info(f'No fast codec for {clazz.__name__}: {e.args}')
+        return None
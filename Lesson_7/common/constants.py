@@ -1,3 +1,4 @@
+import os
 from enum import Enum
 from typing import Any, Tuple, Dict, List, Union
 
@@ -125,3 +126,24 @@ class PaymentSystem(Choice):
     STRIPE = 1
     CLICK = 2
     PAYMO = 3
+
+
+# ----------------------------
+# Caches
+# ----------------------------
+
+# сколько сериализованных клавиатур (по всем платформам) хранится в памяти процесса
+KEYBOARD_CACHE_SIZE = int(os.getenv('KEYBOARD_CACHE_SIZE', '1000'))
+# язык пользователя, если платформа его не сообщает (совпадает со значением BotUser.lang_code по умолчанию)
+DEFAULT_LANG_CODE = 'ru'
+# включает сгенерированные функции dump/load для сущностей (см. common/serializers.py)
+SERIALIZER_CODEGEN = os.getenv('SERIALIZER_CODEGEN', '0') == '1'
+
+
+# ----------------------------
+# Webhooks
+# ----------------------------
+
+# количество доверенных обратных прокси перед приложением: адрес отправителя вебхука берётся из X-Forwarded-For
+# на столько записей от правого края; 0 - адрес соединения REMOTE_ADDR, заголовок не учитывается
+WEBHOOK_TRUSTED_PROXIES = int(os.getenv('WEBHOOK_TRUSTED_PROXIES', '0'))
@@ -190,6 +190,8 @@ class EventCommandReceived(LinterFix, AbstractCommand):
         }
     )
     ts_in_messenger: Optional[datetime] = None
+    # язык пользователя, если его сообщает платформа; от него зависит ключ клавиатуры в KeyboardCache
+    lang_code: Optional[str] = None
 
 
 @dataclass(order=True)
@@ -203,12 +205,14 @@ class EventCommandToSend(LinterFix, AbstractCommand):
 
     inline_buttons: Optional[List[InlineButton]] = None
     inline_buttons_cols: Optional[int] = None
+    # ключ готовой клавиатуры в KeyboardCache, задаётся только для сообщений, одинаковых для всех пользователей
+    keyboard_key: Optional[str] = field(default=None, compare=False)
 
 
 #####
 
 @dataclass(order=True, base_schema=SkipNoneSchema)
-class Callback:
+class Callback(LinterFix):
     Schema: ClassVar[Type[marshmallow.Schema]] = marshmallow.Schema
 
     type: CallbackType = field(
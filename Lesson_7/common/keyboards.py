@@ -0,0 +1,41 @@
+"""Модуль кэша готовых клавиатур меню.
+
+Клавиатуры шагов меню одинаковы для всех пользователей, поэтому их окончательное представление
+для каждой платформы (уже сериализованное) сохраняется по ключу (платформа, шаг диалога, id сущности,
+язык пользователя, хэш каталога). При отправке в готовый фрагмент подставляются только поля получателя.
+Хэш содержимого каталога в ключе делает записи прежних снимков недостижимыми - они вытесняются из LRU.
+Ключ сохраняется в OutboxMessage вместе с командой, поэтому он зависит только от содержимого каталога
+и в любом процессе (в том числе после перезапуска) указывает на ту же клавиатуру."""
+
+from typing import Any, Dict, Optional, Tuple
+
+from common.cache import LRUCache
+from common.constants import DEFAULT_LANG_CODE, KEYBOARD_CACHE_SIZE
+from patterns.singleton import Singleton
+
+
+class KeyboardCache(metaclass=Singleton):
+    """Кэш сериализованных фрагментов сообщений с клавиатурами: (платформа, ключ клавиатуры) -> фрагмент."""
+
+    def __init__(self, maxsize: int = KEYBOARD_CACHE_SIZE) -> None:
+        self._cache: LRUCache[Tuple[str, str], Any] = LRUCache(maxsize)
+
+    @staticmethod
+    def make_key(step: str, entity_id: int, lang_code: Optional[str], catalog_digest: str) -> str:
+        """Формирует платформонезависимую часть ключа, которая передаётся в ECTS.
+
+        Без языка пользователя используется DEFAULT_LANG_CODE."""
+
+        return f'{step}:{entity_id}:{lang_code or DEFAULT_LANG_CODE}:{catalog_digest}'
+
+    def get(self, platform: str, keyboard_key: str) -> Any:
+        return self._cache.get((platform, keyboard_key))
+
+    def set(self, platform: str, keyboard_key: str, fragment: Any) -> None:
+        self._cache.set((platform, keyboard_key), fragment)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return self._cache.stats()
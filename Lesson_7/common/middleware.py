@@ -0,0 +1,107 @@
+"""Модуль проверки входящих вебхуков до вызова вью.
+
+WebhookVerificationMiddleware сопоставляет вью вебхуков с методом verify_request клиента платформы
+и отклоняет запрос с ответом 403 до того, как вью прочитает и разберёт тело. Проверки не обращаются
+ни к телу запроса, ни к БД: списки сетей разобраны заранее (см. common/allowlist.py),
+а подписи платёжных систем полностью проверяются уже во вью."""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+
+from billing.paypal.client import PaypalClient
+from billing.stripe.client import StripeClient
+from clients.jivosite.jivosite import JivositeClient
+from clients.ok.ok import OkClient
+from patterns.singleton import Singleton
+from .allowlist import client_ip
+
+
+logger = logging.getLogger('root')
+
+
+@dataclass(frozen=True)
+class WebhookRoute:
+    """Вью вебхука и проверка, которую проходит каждый запрос к нему."""
+
+    name: str
+    view: str
+    verify: Callable[[HttpRequest], bool]
+
+
+WEBHOOK_ROUTES: Tuple[WebhookRoute, ...] = (
+    WebhookRoute('ok', 'bot.views.ok_webhook', OkClient.verify_request),
+    WebhookRoute('jivo', 'bot.views.jivo_webhook', JivositeClient.verify_request),
+    WebhookRoute('paypal', 'billing.views.paypal_webhook', PaypalClient.verify_request),
+    WebhookRoute('stripe', 'billing.views.stripe_webhook', StripeClient.verify_request),
+)
+
+
+class WebhookVerifier(metaclass=Singleton):
+    """Проверяет запросы к вью вебхуков и ведёт по каждому маршруту счётчики и время проверки."""
+
+    def __init__(self) -> None:
+        self._routes: Dict[str, WebhookRoute] = {route.view: route for route in WEBHOOK_ROUTES}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, float]] = {
+            route.name: {'checked': 0, 'rejected': 0, 'seconds': 0.0, 'max_seconds': 0.0}
+            for route in WEBHOOK_ROUTES
+        }
+
+    def route_for(self, view_func: Callable[..., Any]) -> Optional[WebhookRoute]:
+        return self._routes.get(f'{view_func.__module__}.{view_func.__name__}')
+
+    def check(self, route: WebhookRoute, request: HttpRequest) -> bool:
+        started = time.perf_counter()
+        try:
+            verified = route.verify(request)
+        except Exception as e:
+            logger.exception(f'{route.name} webhook verification failed: {e.args}')
+            verified = False
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            counters = self._counters[route.name]
+            counters['checked'] += 1
+            counters['rejected'] += 0 if verified else 1
+            counters['seconds'] += elapsed
+            counters['max_seconds'] = max(counters['max_seconds'], elapsed)
+        return verified
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                name: {
+                    'checked': int(counters['checked']),
+                    'rejected': int(counters['rejected']),
+                    'avg_us': round(counters['seconds'] / counters['checked'] * 10 ** 6, 1)
+                    if counters['checked'] else None,
+                    'max_us': round(counters['max_seconds'] * 10 ** 6, 1),
+                }
+                for name, counters in self._counters.items()
+            }
+
+
+class WebhookVerificationMiddleware:
+    """Отклоняет непрошедшие проверку запросы к вью вебхуков до разбора тела."""
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]) -> None:
+        self.get_response = get_response
+        self.verifier = WebhookVerifier()
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        return self.get_response(request)
+
+    def process_view(self,
+                     request: HttpRequest,
+                     view_func: Callable[..., Any],
+                     view_args: Tuple[Any, ...],
+                     view_kwargs: Dict[str, Any]) -> Optional[HttpResponse]:
+        route = self.verifier.route_for(view_func)
+        if route is None or self.verifier.check(route, request):
+            return None
+        logger.warning(f'Rejected {route.name} webhook from {client_ip(request)}')
+        return HttpResponseForbidden()
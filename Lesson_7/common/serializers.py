@@ -0,0 +1,137 @@
+"""Модуль реестра сериализаторов сущностей.
+
+Схемы marshmallow_dataclass создаются один раз на класс данных и переиспользуются во всех вызовах.
+При включённой переменной окружения SERIALIZER_CODEGEN для поддерживаемых схем используются
+сгенерированные функции dump/load (см. common/codegen.py) с тем же результатом; при любом
+несоответствии загрузка повторяется штатной схемой."""
+
+import importlib
+import inspect
+import logging
+import threading
+import typing
+from typing import Any, Dict, Iterable, List, Optional, Type, TypeVar, Union
+
+import marshmallow
+
+from common.codegen import Codec, build_codec
+from common.constants import SERIALIZER_CODEGEN
+from patterns.singleton import Singleton
+
+
+logger = logging.getLogger('root')
+
+# модули с классами данных, схемы которых создаются заранее при старте приложения
+ENTITY_MODULES = (
+    'common.entities',
+    'clients.ok.ok_entities',
+    'clients.jivosite.jivo_entities',
+    'billing.paypal.paypal_entities',
+    'billing.stripe.stripe_entities',
+)
+
+T = TypeVar('T')
+
+
+def schema_class(clazz: type) -> Optional[Type[marshmallow.Schema]]:
+    """Возвращает схему, которую marshmallow_dataclass добавляет классу данных, или None для прочих классов."""
+
+    schema = getattr(clazz, 'Schema', None)
+    if isinstance(schema, type) and issubclass(schema, marshmallow.Schema) and schema is not marshmallow.Schema:
+        return schema
+    return None
+
+
+class SerializerRegistry(metaclass=Singleton):
+    """Хранит по одному экземпляру схемы (и, если включено, по одному кодеку) на класс данных."""
+
+    def __init__(self, codegen: bool = SERIALIZER_CODEGEN) -> None:
+        self.codegen = codegen
+        self._schemas: Dict[type, marshmallow.Schema] = {}
+        self._codecs: Dict[type, Optional[Codec]] = {}
+        self._lock = threading.Lock()
+        self.fallbacks = 0
+
+    def schema(self, clazz: Type[T]) -> marshmallow.Schema:
+        schema = self._schemas.get(clazz)
+        if schema is None:
+            with self._lock:
+                schema = self._schemas.get(clazz)
+                if schema is None:
+                    schema_type = schema_class(clazz)
+                    if schema_type is None:
+                        raise TypeError(f'{clazz.__name__} is not a marshmallow_dataclass')
+                    schema = schema_type()
+                    self._schemas[clazz] = schema
+        return schema
+
+    def codec(self, clazz: Type[T]) -> Optional[Codec]:
+        if not self.codegen:
+            return None
+        try:
+            return self._codecs[clazz]
+        except KeyError:
+            codec = build_codec(clazz, self.schema(clazz))
+            self._codecs[clazz] = codec
+            return codec
+
+    def dump(self, obj: Any) -> Dict[str, Any]:
+        codec = self.codec(type(obj))
+        if codec is not None:
+            return codec.dump(obj)
+        result: Dict[str, Any] = self.schema(type(obj)).dump(obj)
+        return result
+
+    def dumps(self, obj: Any) -> str:
+        result: str = self.schema(type(obj)).opts.render_module.dumps(self.dump(obj))
+        return result
+
+    def load(self, clazz: Type[T], data: Any) -> T:
+        """Загружает экземпляр класса данных."""
+
+        codec = self.codec(clazz)
+        if codec is not None:
+            try:
+                return typing.cast(T, codec.load(data))
+            except Exception:
+                # ошибку со всеми подробностями сформирует штатная схема
+                self.fallbacks += 1
+        return typing.cast(T, self.schema(clazz).load(data))
+
+    def loads(self, clazz: Type[T], data: Union[str, bytes]) -> T:
+        return self.load(clazz, self.schema(clazz).opts.render_module.loads(data))
+
+    def validate(self, obj: Any) -> Dict[str, List[str]]:
+        """Проверяет, что сериализованный объект загружается обратно без ошибок, и возвращает ошибки."""
+
+        codec = self.codec(type(obj))
+        if codec is not None:
+            try:
+                codec.load(codec.dump(obj))
+                return {}
+            except Exception:
+                self.fallbacks += 1
+        errors: Dict[str, List[str]] = self.schema(type(obj)).validate(self.dump(obj))
+        return errors
+
+    def warm_up(self, modules: Iterable[str] = ENTITY_MODULES) -> int:
+        """Создаёт схемы (и кодеки) для всех классов данных из модулей и возвращает их количество."""
+
+        count = 0
+        for module_name in modules:
+            module = importlib.import_module(module_name)
+            for _, clazz in inspect.getmembers(module, inspect.isclass):
+                if clazz.__module__ == module_name and schema_class(clazz) is not None:
+                    self.schema(clazz)
+                    self.codec(clazz)
+                    count += 1
+        logger.info(f'Serializers ready: {count} entities, codegen {"on" if self.codegen else "off"}')
+        return count
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'codegen': self.codegen,
+            'schemas': len(self._schemas),
+            'codecs': len([codec for codec in self._codecs.values() if codec is not None]),
+            'fallbacks': self.fallbacks,
+        }
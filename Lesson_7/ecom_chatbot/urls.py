@@ -17,7 +17,8 @@ from django.contrib import admin
 from django.urls import path, include
 
 from shop.views import index_page
-from bot.views import jivo_webhook, ok_webhook, chat_view
+from bot.views import (jivo_webhook, ok_webhook, chat_view, chat_list_api, chat_messages_api, chat_events,
+                       message_search_api, message_export, runtime_stats)
 
 
 urlpatterns = [
@@ -27,5 +28,11 @@ urlpatterns = [
     path('jivo_webhook/test', jivo_webhook),
     path('chats/<int:pk>/', chat_view),
     path('chats/', chat_view),
+    path('api/chats/', chat_list_api),
+    path('api/chats/events/', chat_events),
+    path('api/messages/search/', message_search_api),
+    path('api/messages/export/', message_export),
+    path('api/chats/<int:pk>/messages/', chat_messages_api),
+    path('stats/', runtime_stats),
     path('billing/', include('billing.urls', namespace='billing')),
 ]
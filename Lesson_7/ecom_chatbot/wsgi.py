@@ -18,3 +18,11 @@ project_folder = Path(__file__).parent.parent.absolute()
 load_dotenv(project_folder.parent.joinpath('.env'))
 
 application = get_wsgi_application()
+
+from bot.constants import OUTBOX_DRAINER  # noqa: E402
+
+if OUTBOX_DRAINER:
+    # поток отправки запускается только в процессе веб-сервера, а не в каждой команде manage.py;
+    # продолжает отправку сообщений, оставшихся в OutboxMessage после остановки процесса
+    from bot.outbox import OutboxDrainer
+    OutboxDrainer().start()
@@ -17,8 +17,8 @@ class ProductAdmin(admin.ModelAdmin):
     """Класс с настройками для работы с моделью Product в админке Django."""
 
     readonly_fields = ('created_at', 'updated_at')
-    list_display = ('name', 'get_categories', 'price', 'description', 'image_url', 'is_active', 'sort_order')
-    search_fields = ('name__exact', 'categories__name__exact')
+    list_display = ('name', 'sku', 'get_categories', 'price', 'description', 'image_url', 'is_active', 'sort_order')
+    search_fields = ('name__exact', 'sku__exact', 'categories__name__exact')
 
 
 @admin.register(Order)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class ShopConfig(AppConfig):
     name = 'shop'
+
+    def ready(self) -> None:
+        from . import signals  # noqa: F401
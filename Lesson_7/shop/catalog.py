@@ -0,0 +1,202 @@
+"""Модуль неизменяемого снимка каталога магазина.
+
+Снимок строится один раз, хранит только активные категории и товары в порядке сортировки,
+а также заранее подготовленные укороченные описания и отформатированные цены.
+При изменении моделей магазина снимок помечается устаревшим и при следующем обращении
+строится заново и атомарно подменяется, поэтому шаги меню диалога не обращаются к БД."""
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from django.db.models import Count, Max
+from djmoney.money import Money
+
+from patterns.singleton import Singleton
+from .constants import CATALOG_CHECK_INTERVAL, CATALOG_DESCRIPTION_LENGTH
+
+
+logger = logging.getLogger('root')
+
+
+@dataclass(frozen=True)
+class CatalogProduct:
+    """Товар в снимке каталога."""
+
+    id: int
+    name: str
+    price: Money
+    price_text: str
+    description: str
+    short_description: str
+    image_url: Optional[str]
+
+
+@dataclass(frozen=True)
+class CatalogCategory:
+    """Категория в снимке каталога с идентификаторами дочерних категорий и товаров в порядке сортировки."""
+
+    id: int
+    name: str
+    parent_id: Optional[int]
+    child_ids: Tuple[int, ...]
+    product_ids: Tuple[int, ...]
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Неизменяемый снимок каталога, помеченный версией.
+
+    version - номер снимка в этом процессе, digest - хэш содержимого снимка, одинаковый в любом процессе
+    для одинакового каталога. Всё, что сохраняется вне процесса (например, ключи клавиатур в OutboxMessage),
+    ссылается на digest."""
+
+    version: int
+    digest: str
+    fingerprint: Tuple[Any, ...]
+    root_ids: Tuple[int, ...]
+    categories: Mapping[int, CatalogCategory]
+    products: Mapping[int, CatalogProduct]
+
+    def root_categories(self) -> List[CatalogCategory]:
+        return [self.categories[category_id] for category_id in self.root_ids]
+
+    def child_categories(self, category_id: int) -> List[CatalogCategory]:
+        return [self.categories[child_id] for child_id in self.categories[category_id].child_ids]
+
+    def category_products(self, category_id: int) -> List[CatalogProduct]:
+        return [self.products[product_id] for product_id in self.categories[category_id].product_ids]
+
+
+def catalog_fingerprint() -> Tuple[Any, ...]:
+    """Возвращает дешёвый отпечаток состояния каталога: количество строк и время последнего изменения."""
+
+    from .models import Category, Product
+    categories = Category.objects.order_by().aggregate(count=Count('id'), changed=Max('updated_at'))
+    products = Product.objects.order_by().aggregate(count=Count('id'), changed=Max('updated_at'))
+    links = Product.categories.through.objects.count()
+    return categories['count'], categories['changed'], products['count'], products['changed'], links
+
+
+def catalog_digest(root_ids: Tuple[int, ...], categories: Mapping[int, CatalogCategory],
+                   products: Mapping[int, CatalogProduct]) -> str:
+    """Возвращает хэш содержимого снимка: порядка корневых категорий, категорий и товаров."""
+
+    content = repr((
+        root_ids,
+        sorted((category.id, category.name, category.parent_id, category.child_ids, category.product_ids)
+               for category in categories.values()),
+        sorted((product.id, product.name, product.price_text, product.description, product.image_url)
+               for product in products.values()),
+    ))
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def build_snapshot(version: int) -> CatalogSnapshot:
+    """Читает активные категории и товары из БД и собирает из них снимок."""
+
+    from .models import Category, Product
+    fingerprint = catalog_fingerprint()
+
+    products: Dict[int, CatalogProduct] = {}
+    for product in Product.objects.filter(is_active=True):
+        products[product.id] = CatalogProduct(
+            id=product.id,
+            name=product.name,
+            price=product.price,
+            price_text=str(product.price),
+            description=product.description,
+            short_description=product.description[:CATALOG_DESCRIPTION_LENGTH],
+            image_url=product.image_url,
+        )
+
+    category_rows = list(
+        Category.objects.filter(is_active=True).values_list('id', 'name', 'parent_category_id', 'path')
+    )
+    active_ids = {row[0] for row in category_rows}
+    # категория, у которой хотя бы один предок неактивен, недостижима и в снимок не попадает
+    category_rows = [row for row in category_rows
+                     if all(int(ancestor_id) in active_ids for ancestor_id in row[3].split('/')[:-2])]
+    reachable_ids = {row[0] for row in category_rows}
+
+    children: Dict[Optional[int], List[int]] = {}
+    for category_id, _, parent_id, _ in category_rows:
+        children.setdefault(parent_id, []).append(category_id)
+
+    category_products: Dict[int, List[int]] = {}
+    links = Product.categories.through.objects.filter(
+        category_id__in=reachable_ids, product_id__in=products.keys()
+    ).values_list('category_id', 'product_id')
+    for category_id, product_id in links:
+        category_products.setdefault(category_id, []).append(product_id)
+
+    # порядок товаров внутри категории соответствует порядку сортировки модели Product
+    product_order = {product_id: number for number, product_id in enumerate(products)}
+    categories: Dict[int, CatalogCategory] = {}
+    for category_id, name, parent_id, _ in category_rows:
+        categories[category_id] = CatalogCategory(
+            id=category_id,
+            name=name,
+            parent_id=parent_id,
+            child_ids=tuple(children.get(category_id, ())),
+            product_ids=tuple(sorted(category_products.get(category_id, ()), key=product_order.__getitem__)),
+        )
+
+    root_ids = tuple(children.get(None, ()))
+    return CatalogSnapshot(
+        version=version,
+        digest=catalog_digest(root_ids, categories, products),
+        fingerprint=fingerprint,
+        root_ids=root_ids,
+        categories=MappingProxyType(categories),
+        products=MappingProxyType(products),
+    )
+
+
+class Catalog(metaclass=Singleton):
+    """Держатель текущего снимка каталога процесса.
+
+    Снимок перестраивается после invalidate() (вызывается сигналами моделей магазина), а также
+    если при периодической сверке отпечаток каталога в БД разошёлся со снимком - так процесс
+    узнаёт об изменениях, сделанных в других процессах."""
+
+    def __init__(self, check_interval: float = CATALOG_CHECK_INTERVAL) -> None:
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._stale = True
+        self._checked_at = 0.0
+        self._check_interval = check_interval
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get(self) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and not self._stale:
+            if time.monotonic() - self._checked_at < self._check_interval:
+                return snapshot
+            self._checked_at = time.monotonic()
+            if catalog_fingerprint() == snapshot.fingerprint:
+                return snapshot
+            self._stale = True
+        return self._rebuild()
+
+    def invalidate(self) -> None:
+        self._stale = True
+
+    def _rebuild(self) -> CatalogSnapshot:
+        with self._lock:
+            snapshot = self._snapshot
+            # пока ждали блокировку, снимок мог перестроить другой поток
+            if snapshot is not None and not self._stale:
+                return snapshot
+            self._stale = False
+            self._version += 1
+            snapshot = build_snapshot(self._version)
+            self._snapshot = snapshot
+            self._checked_at = time.monotonic()
+        logger.info(f'Catalog snapshot v{snapshot.version} ({snapshot.digest}) built: '
+                    f'{len(snapshot.categories)} categories, {len(snapshot.products)} products')
+        return snapshot
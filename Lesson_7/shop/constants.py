@@ -0,0 +1,11 @@
+"""Модуль с набором констант и параметров окружения, относящихся к магазину."""
+
+import os
+
+
+# как часто (в секундах) процесс сверяет свой снимок каталога с БД, чтобы подхватить изменения других процессов
+CATALOG_CHECK_INTERVAL = float(os.getenv('SHOP_CATALOG_CHECK_INTERVAL', '30'))
+# длина описания товара, показываемая в диалоге
+CATALOG_DESCRIPTION_LENGTH = 400
+# импорт товарного фида: сколько строк сверяется с БД и записывается за один раз
+CATALOG_IMPORT_BATCH_SIZE = int(os.getenv('SHOP_CATALOG_IMPORT_BATCH_SIZE', '500'))
@@ -0,0 +1,306 @@
+"""Модуль потокового импорта товарного фида поставщика.
+
+Фид в формате CSV или JSON Lines (в том числе сжатый gzip) читается построчно и обрабатывается пачками
+по CATALOG_IMPORT_BATCH_SIZE строк: товары пачки сопоставляются с каталогом по артикулу (sku) одним
+запросом, новые товары добавляются через bulk_create, изменившиеся - через bulk_update, а связи
+с категориями пишутся напрямую в промежуточную таблицу Product.categories. Товары без изменений
+не записываются. В памяти одновременно находится одна пачка и словарь категорий, поэтому расход
+памяти не зависит от размера фида.
+
+Строка фида: sku, name, price, currency (по умолчанию RUB), description, image_url, is_active, sort_order
+и categories - пути категорий от корня через "/", несколько путей в CSV разделяются "|", в JSON Lines
+передаются списком. Недостающие категории создаются."""
+
+import csv
+import gzip
+import json
+import logging
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from djmoney.money import Money
+
+from .catalog import Catalog
+from .constants import CATALOG_IMPORT_BATCH_SIZE
+from .models import Category, Product
+
+
+logger = logging.getLogger('root')
+
+PRODUCT_FIELDS = ('name', 'price', 'price_currency', 'description', 'image_url', 'is_active', 'sort_order')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да'}
+CENT = Decimal('0.01')
+
+CategoryPath = Tuple[str, ...]
+
+
+class FeedError(Exception):
+    """Строка фида не может быть импортирована."""
+
+
+@dataclass(frozen=True)
+class FeedItem:
+    """Товар из строки фида."""
+
+    sku: str
+    name: str
+    price: Decimal
+    currency: str
+    description: str
+    image_url: Optional[str]
+    is_active: bool
+    sort_order: int
+    categories: Tuple[CategoryPath, ...]
+
+    def values(self) -> Dict[str, Any]:
+        """Возвращает значения полей товара в том виде, в котором их отдаёт Product.objects.values()."""
+
+        return {
+            'name': self.name,
+            'price': self.price,
+            'price_currency': self.currency,
+            'description': self.description,
+            'image_url': self.image_url,
+            'is_active': self.is_active,
+            'sort_order': self.sort_order,
+        }
+
+
+@dataclass
+class ImportStats:
+    """Итоги импорта фида."""
+
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    errors: int = 0
+    batches: int = 0
+    failed_batches: int = 0
+    failed_rows: int = 0
+    categories_created: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rate(self) -> float:
+        """Скорость импорта в строках в секунду."""
+
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self) -> str:
+        return (f'Rows: {self.rows} (created {self.created}, updated {self.updated}, unchanged {self.unchanged}, '
+                f'duplicates {self.duplicates}, errors {self.errors}), batches: {self.batches} '
+                f'(failed {self.failed_batches}, {self.failed_rows} rows), '
+                f'categories created: {self.categories_created}, {self.seconds:.1f} s, {self.rate:.0f} rows/s')
+
+
+def read_feed(path: str) -> Iterator[Dict[str, Any]]:
+    """Построчно читает фид. Формат определяется по расширению: .csv или .jsonl, с необязательным .gz."""
+
+    suffixes = Path(path).suffixes
+    compressed = suffixes[-1:] == ['.gz']
+    feed_format = suffixes[-2] if compressed and len(suffixes) > 1 else suffixes[-1] if suffixes else ''
+    if feed_format not in ('.csv', '.jsonl'):
+        raise FeedError(f'Unknown feed format: {path}')
+    opener = gzip.open if compressed else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as stream:
+        if feed_format == '.csv':
+            yield from csv.DictReader(stream)
+        else:
+            for number, line in enumerate(stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise FeedError(f'Invalid JSON in line {number}: {e}')
+
+
+def _category_paths(value: Any) -> Tuple[CategoryPath, ...]:
+    paths = value.split('|') if isinstance(value, str) else value or []
+    result = []
+    for path in paths:
+        names = tuple(name.strip() for name in str(path).split('/') if name.strip())
+        if names:
+            result.append(names)
+    return tuple(result)
+
+
+def parse_item(row: Dict[str, Any]) -> FeedItem:
+    """Проверяет строку фида и приводит её значения к типам полей товара."""
+
+    sku = str(row.get('sku') or '').strip()
+    name = str(row.get('name') or '').strip()
+    if not sku or not name:
+        raise FeedError('sku and name are required')
+    try:
+        price = Decimal(str(row.get('price') or 0)).quantize(CENT)
+    except InvalidOperation:
+        raise FeedError(f'Invalid price: {row.get("price")}')
+    try:
+        sort_order = int(row.get('sort_order') or 1)
+    except ValueError:
+        raise FeedError(f'Invalid sort order: {row.get("sort_order")}')
+    is_active = row.get('is_active')
+    return FeedItem(
+        sku=sku[:64],
+        name=name[:100],
+        price=price,
+        currency=str(row.get('currency') or 'RUB').upper(),
+        description=str(row.get('description') or ''),
+        image_url=str(row['image_url']) if row.get('image_url') else None,
+        is_active=True if is_active in (None, '') else str(is_active).strip().lower() in TRUE_VALUES,
+        sort_order=sort_order,
+        categories=_category_paths(row.get('categories')),
+    )
+
+
+class CategoryResolver:
+    """Находит категории по пути имён от корня и создаёт недостающие.
+
+    Все категории читаются одним запросом при создании, новые добавляются в словарь по мере создания."""
+
+    def __init__(self) -> None:
+        self._ids: Dict[Tuple[Optional[int], str], int] = {}
+        self.created = 0
+        rows = Category.objects.order_by('sort_order', 'pk').values_list('pk', 'parent_category_id', 'name')
+        for pk, parent_id, name in rows:
+            # у одноимённых категорий одного родителя выбирается первая в порядке сортировки
+            self._ids.setdefault((parent_id, name), pk)
+
+    def resolve(self, path: CategoryPath) -> int:
+        parent_id: Optional[int] = None
+        for name in path:
+            key = (parent_id, name)
+            if key not in self._ids:
+                # категорий немного, а путь категории поддерживает Category.save(), поэтому по одной
+                self._ids[key] = Category.objects.create(name=name[:100], parent_category_id=parent_id).pk
+                self.created += 1
+            parent_id = self._ids[key]
+        assert parent_id is not None
+        return parent_id
+
+
+class CatalogImporter:
+    """Сверяет товары фида с каталогом и записывает изменения пачками."""
+
+    def __init__(self, batch_size: int = CATALOG_IMPORT_BATCH_SIZE) -> None:
+        self.batch_size = batch_size
+        self.stats = ImportStats()
+        self._categories: Optional[CategoryResolver] = None
+
+    def run(self, rows: Iterable[Dict[str, Any]]) -> ImportStats:
+        """Импортирует строки фида и возвращает итоги."""
+
+        started = time.monotonic()
+        self._categories = CategoryResolver()
+        batch: Dict[str, FeedItem] = {}
+        first = 1
+        for number, row in enumerate(rows, 1):
+            self.stats.rows += 1
+            try:
+                item = parse_item(row)
+            except FeedError as e:
+                self.stats.errors += 1
+                logger.warning(f'Feed row {number} skipped: {e}')
+                continue
+            if item.sku in batch:
+                # повтор артикула внутри пачки - действует последняя строка
+                self.stats.duplicates += 1
+            batch[item.sku] = item
+            if len(batch) >= self.batch_size:
+                self._write(batch, first, number)
+                batch, first = {}, number + 1
+                rate = self.stats.rows / (time.monotonic() - started)
+                logger.info(f'Catalog import: {self.stats.rows} rows, {rate:.0f} rows/s')
+        if batch:
+            self._write(batch, first, self.stats.rows)
+        self.stats.categories_created = self._categories.created
+        self.stats.seconds = time.monotonic() - started
+        # bulk-операции не отправляют сигналы моделей, поэтому снимок каталога сбрасывается явно
+        Catalog().invalidate()
+        return self.stats
+
+    def _write(self, batch: Dict[str, FeedItem], first: int, last: int) -> None:
+        """Записывает пачку строк фида first-last.
+
+        Ошибка БД откатывает только эту пачку: она учитывается в итогах, и импорт продолжается со следующей."""
+
+        try:
+            created, updated, unchanged = self._flush(batch)
+        except DatabaseError as e:
+            self.stats.failed_batches += 1
+            self.stats.failed_rows += len(batch)
+            logger.error(f'Catalog import: batch of feed rows {first}-{last} not written: {e}')
+            return
+        self.stats.batches += 1
+        self.stats.created += created
+        self.stats.updated += updated
+        self.stats.unchanged += unchanged
+
+    def _flush(self, batch: Dict[str, FeedItem]) -> Tuple[int, int, int]:
+        """Записывает изменения пачки и возвращает количество созданных, изменённых и неизменных товаров."""
+
+        assert self._categories is not None
+        through = Product.categories.through
+        existing = {
+            row['sku']: row
+            for row in Product.objects.filter(sku__in=list(batch)).values('pk', 'sku', *PRODUCT_FIELDS)
+        }
+        current: Dict[int, Set[int]] = {row['pk']: set() for row in existing.values()}
+        links = through.objects.filter(product_id__in=list(current)).values_list('product_id', 'category_id')
+        for product_id, category_id in links:
+            current[product_id].add(category_id)
+
+        now = timezone.now()
+        created: List[Product] = []
+        updated: List[Product] = []
+        unchanged = 0
+        wanted: Dict[str, Set[int]] = {}
+        relinked: Set[int] = set()
+        for sku, item in batch.items():
+            # категории создаются вне транзакции пачки: её откат не удаляет id, запомненные в словаре
+            wanted[sku] = {self._categories.resolve(path) for path in item.categories}
+            values = item.values()
+            product = Product(sku=sku, **dict(values, price=Money(item.price, item.currency)))
+            row = existing.get(sku)
+            if row is None:
+                created.append(product)
+                continue
+            fields_changed = any(row[name] != value for name, value in values.items())
+            categories_changed = current[row['pk']] != wanted[sku]
+            if not fields_changed and not categories_changed:
+                unchanged += 1
+                continue
+            product.pk = row['pk']
+            product.updated_at = now
+            updated.append(product)
+            if categories_changed:
+                relinked.add(row['pk'])
+
+        if not created and not updated:
+            return 0, 0, unchanged
+        with transaction.atomic():
+            if created:
+                Product.objects.bulk_create(created)
+                # bulk_create на SQLite не возвращает первичные ключи - они читаются по артикулам
+                new_ids = Product.objects.filter(sku__in=[product.sku for product in created]).values_list('sku', 'pk')
+                for sku, pk in new_ids:
+                    relinked.add(pk)
+                    existing[sku] = {'pk': pk}
+            if updated:
+                Product.objects.bulk_update(updated, [*PRODUCT_FIELDS, 'updated_at'])
+            if relinked:
+                through.objects.filter(product_id__in=relinked).delete()
+                through.objects.bulk_create([
+                    through(product_id=existing[sku]['pk'], category_id=category_id)
+                    for sku, category_ids in wanted.items() if existing[sku]['pk'] in relinked
+                    for category_id in category_ids
+                ])
+        return len(created), len(updated), unchanged
@@ -0,0 +1,27 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import DatabaseError
+
+from shop.constants import CATALOG_IMPORT_BATCH_SIZE
+from shop.feed import CatalogImporter, FeedError, read_feed
+
+
+class Command(BaseCommand):
+    help = 'Импортирует товарный фид CSV или JSON Lines (.csv, .jsonl, .csv.gz, .jsonl.gz) в каталог магазина'
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument('path', help='Файл фида')
+        parser.add_argument('--batch-size', type=int, default=CATALOG_IMPORT_BATCH_SIZE,
+                            help='Сколько строк фида сверяется с каталогом и записывается за один раз')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        importer = CatalogImporter(options['batch_size'])
+        try:
+            stats = importer.run(read_feed(options['path']))
+        except (FeedError, OSError, DatabaseError) as e:
+            raise CommandError(f'{e} ({importer.stats})')
+        if stats.failed_batches:
+            # записанные пачки остаются в каталоге, строки неудачных пачек загрузит повторный запуск
+            raise CommandError(f'{stats.failed_batches} batches not written, see the log ({stats})')
+        self.stdout.write(str(stats))
@@ -2,10 +2,12 @@
 
 Методы модуля предназначены для совершения операций между ботом и базой данных магазина."""
 
-from typing import Optional, List, Dict, Any, TYPE_CHECKING
+from typing import Optional, List, Dict, Any, Set, TYPE_CHECKING
 
 from django.utils import timezone
 from django.db import models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Concat, Substr
 from django.forms.models import model_to_dict
 from django.db.models.query import QuerySet
 
@@ -17,24 +19,73 @@ if TYPE_CHECKING:
 
 
 class CategoryManager(models.Manager):
+    def _with_tree_flags(self, queryset: QuerySet) -> QuerySet:
+        """Добавляет к выборке признак наличия дочерних категорий коррелированным подзапросом."""
+
+        children = self.model.objects.filter(parent_category_id=OuterRef('pk'))
+        return queryset.annotate(child_category_exists=Exists(children))
+
     def get_categories(self, category_id: Optional[int] = None) -> List[Dict[str, Any]]:
         """Возвращает список категорий в формате словаря.
 
         Возможно указание родительской категории для выдачи подкатегорий."""
 
-        categories_queryset = self.filter(parent_category_id=category_id)
-        categories = [{'id': c.id, 'name': c.name, 'parent_category_id': c.parent_category_id,
-                       'child_category_exists': c.child_categories.exists()} for c in categories_queryset]
-        # ToDo: optimize existence check
-        return categories
+        categories_queryset = self._with_tree_flags(self.filter(parent_category_id=category_id))
+        return list(categories_queryset.values('id', 'name', 'parent_category_id', 'child_category_exists'))
 
     def get_category_by_id(self, category_id: Optional[int]) -> Dict[str, Any]:
-        category = self.filter(pk=category_id).first()
-        result = {'id': category.id, 'name': category.name, 'parent_category_id': category.parent_category_id,
-                  'child_category_exists': category.child_categories.exists()}
-
+        categories_queryset = self._with_tree_flags(self.filter(pk=category_id))
+        result: Dict[str, Any] = categories_queryset.values('id', 'name', 'parent_category_id',
+                                                            'child_category_exists').get()
         return result
 
+    def get_subtree(self, category_id: Optional[int] = None, active_only: bool = True) -> List[Dict[str, Any]]:
+        """Возвращает поддерево категории (или всё дерево) в виде вложенных словарей.
+
+        Поддерево, признаки наличия дочерних категорий и количество активных товаров
+        выбираются одним запросом по префиксу материализованного пути.
+        Каждый узел содержит поля id, name, parent_category_id, path, level, product_count,
+        child_category_exists и список дочерних узлов children в порядке сортировки."""
+
+        from .models import Product
+
+        queryset = self.all()
+        if category_id is not None:
+            root_path = self.filter(pk=category_id).values('path')[:1]
+            queryset = queryset.filter(path__startswith=Subquery(root_path))
+        if active_only:
+            queryset = queryset.filter(is_active=True)
+        products = Product.objects.filter(categories=OuterRef('pk'), is_active=True).order_by()
+        product_count = products.values('categories').annotate(count=Count('pk')).values('count')
+        queryset = self._with_tree_flags(queryset).annotate(product_count=Coalesce(Subquery(product_count), 0))
+        rows = queryset.values('id', 'name', 'parent_category_id', 'path', 'product_count', 'child_category_exists')
+
+        nodes: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            nodes[row['id']] = {**row, 'level': row['path'].count('/'), 'children': []}
+
+        tree: List[Dict[str, Any]] = []
+        attached: Set[int] = set()
+        # родители обрабатываются раньше потомков, внутри уровня сохраняется порядок сортировки;
+        # узлы, чей предок отфильтрован как неактивный, в дерево не попадают
+        for node in sorted(nodes.values(), key=lambda item: item['level']):
+            if node['id'] == category_id or (category_id is None and node['parent_category_id'] is None):
+                tree.append(node)
+            elif node['parent_category_id'] in attached:
+                nodes[node['parent_category_id']]['children'].append(node)
+            else:
+                continue
+            attached.add(node['id'])
+        return tree
+
+    def move_subtree(self, old_path: str, new_path: str) -> int:
+        """Заменяет префикс пути old_path на new_path у всех потомков категории одним запросом.
+
+        Пустой new_path используется, когда категория удалена и её потомки становятся корневыми."""
+
+        descendants = self.filter(path__startswith=old_path).exclude(path=old_path)
+        return descendants.update(path=Concat(Value(new_path), Substr('path', len(old_path) + 1)))
+
 
 class ProductManager(models.Manager):
     def get_products(self, category_id: Optional[int]) -> List[Dict[str, Any]]:
@@ -45,7 +96,8 @@ class ProductManager(models.Manager):
         return products
 
     def get_product_by_id(self, product_id: Optional[int]) -> Dict[str, Any]:
-        product = model_to_dict(self.get(id=product_id), fields=(('id', 'name', 'categories', 'price',
+        # без categories: model_to_dict выполнял бы лишний запрос к M2M
+        product = model_to_dict(self.get(id=product_id), fields=(('id', 'name', 'price',
                                                                   'image_url', 'description', 'is_active')))
         return product
 
@@ -78,6 +130,17 @@ class OrderManager(models.Manager):
 
         return order
 
+    def create_order(self, chat_id: int, product_id: int, description: str = '') -> 'Order':
+        """Создаёт заказ по уже известному первичному ключу чата.
+
+        Цена читается из строки товара, а не из снимка каталога, который может отставать от БД.
+        Если товар удалён или снят с продажи, выбрасывается Product.DoesNotExist."""
+
+        from .models import Product
+
+        product = Product.objects.only('price', 'price_currency').get(pk=product_id, is_active=True)
+        return self.create(chat_id=chat_id, product_id=product_id, total=product.price, description=description)
+
     def update_order(self, order_id: int, status: int) -> None:
         """Обновляет статус заказа на завершённый или отменённый."""
 
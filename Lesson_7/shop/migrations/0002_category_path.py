@@ -0,0 +1,40 @@
+# Generated by Django 3.1.2 on 2026-10-18 11:39
+
+from typing import Any, Dict
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps: Any, schema_editor: Any) -> None:
+    Category = apps.get_model('shop', 'Category')
+    parents = dict(Category.objects.values_list('id', 'parent_category_id'))
+    paths: Dict[int, str] = {}
+
+    def build(category_id: int) -> str:
+        if category_id not in paths:
+            parent_id = parents[category_id]
+            paths[category_id] = f'{build(parent_id) if parent_id is not None else ""}{category_id}/'
+        return paths[category_id]
+
+    categories = [Category(pk=category_id, path=build(category_id)) for category_id in parents]
+    Category.objects.bulk_update(categories, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Shop',
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255,
+                                   verbose_name='Path'),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+from typing import Any, List
+
+from django.core.exceptions import ValidationError
 from django.db import models
 from djmoney.models.fields import MoneyField
 
@@ -6,12 +9,13 @@ from common.constants import OrderStatus
 from .managers import CategoryManager, ProductManager, OrderManager
 
 
-# todo parent-child category interactions unused
 class Category(TrackableUpdateCreateModel):
     """Модель для описания категории товара.
 
     Содержит поля имени, индекса родительской категории,
     а также активности и порядка сортировки.
+    Поле path хранит материализованный путь от корня дерева в виде "4/17/" и поддерживается в save(),
+    что позволяет выбирать всё поддерево одним запросом по префиксу пути.
     """
 
     parent_category = models.ForeignKey(
@@ -27,8 +31,44 @@ class Category(TrackableUpdateCreateModel):
     name = models.CharField('Name', max_length=100)
     is_active = models.BooleanField('Active', default=True)
     sort_order = models.PositiveIntegerField('Sort order', default=1)
+    path = models.CharField('Path', max_length=255, blank=True, default='', db_index=True, editable=False)
     objects = CategoryManager()
 
+    def build_path(self) -> str:
+        """Возвращает путь категории по пути родителя. Не допускает циклов в дереве категорий."""
+
+        if self.parent_category_id is None:
+            return f'{self.pk}/'
+        parent_path = self.parent_category.path
+        if self.pk is not None and (self.parent_category_id == self.pk or f'/{self.pk}/' in f'/{parent_path}'):
+            raise ValidationError({'parent_category': 'Category cannot be nested into itself or its descendant.'})
+        return f'{parent_path}{self.pk}/'
+
+    def clean(self) -> None:
+        if self.pk is not None:
+            self.build_path()
+
+    def save(self, *args: Any, **kwargs: Any) -> None:
+        """Сохраняет категорию и обновляет пути её и всех её потомков."""
+
+        if self.pk is None:
+            super().save(*args, **kwargs)
+            self.path = self.build_path()
+            Category.objects.filter(pk=self.pk).update(path=self.path)
+            return
+        old_path = self.path
+        self.path = self.build_path()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'path'}
+        super().save(*args, **kwargs)
+        if old_path and old_path != self.path:
+            Category.objects.move_subtree(old_path, self.path)
+
+    def get_ancestor_ids(self) -> List[int]:
+        """Возвращает идентификаторы предков категории от корня, не обращаясь к БД."""
+
+        return [int(category_id) for category_id in self.path.split('/')[:-2]]
+
     def __str__(self) -> str:
         if self.parent_category_id is not None:
             return '{parent_category} -> {category}'.format(parent_category=self.parent_category,
@@ -48,6 +88,7 @@ class Product(TrackableUpdateCreateModel):
 
     Содержит поля наименования, цены, описания, категории, ссылки на изображение
     а также активности и порядка сортировки.
+    Поле sku - артикул поставщика, по которому товарный фид сопоставляется с товарами каталога.
     """
 
     categories = models.ManyToManyField(
@@ -56,6 +97,7 @@ class Product(TrackableUpdateCreateModel):
         blank=True,
         related_name='categories',
     )
+    sku = models.CharField('SKU', max_length=64, unique=True, blank=True, null=True)
     name = models.CharField('Name', max_length=100, db_index=True)
     price = MoneyField('Price', max_digits=10, decimal_places=2, blank=True, default=0.0, default_currency='RUB')
     image_url = models.URLField('Image', max_length=2047, blank=True, null=True)
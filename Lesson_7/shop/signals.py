@@ -0,0 +1,25 @@
+"""Модуль содержит обработчики сигналов моделей магазина."""
+
+from typing import Any
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .catalog import Catalog
+from .models import Category, Product
+
+
+@receiver([post_save, post_delete], sender=Category)  # type: ignore
+@receiver([post_save, post_delete], sender=Product)  # type: ignore
+@receiver(m2m_changed, sender=Product.categories.through)  # type: ignore
+def invalidate_catalog(sender: Any, **kwargs: Any) -> None:
+    transaction.on_commit(Catalog().invalidate)
+
+
+@receiver(post_delete, sender=Category)  # type: ignore
+def detach_category_subtree(sender: Any, instance: Category, **kwargs: Any) -> None:
+    """Потомки удалённой категории становятся корневыми (SET_NULL), поэтому из их путей убирается её префикс."""
+
+    if instance.path:
+        Category.objects.move_subtree(instance.path, '')
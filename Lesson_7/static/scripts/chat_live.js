@@ -0,0 +1,73 @@
+// Дописывает на страницу чатов новые сообщения и изменившиеся чаты из потока /api/chats/events/.
+(function () {
+    'use strict';
+
+    var view = document.querySelector('.chat-view');
+    if (!view || !window.EventSource) {
+        return;
+    }
+    var selected = view.dataset.selected;
+    var chatList = view.querySelector('.chat-list');
+    var content = view.querySelector('.chat-content');
+
+    function formatTime(value) {
+        var date = new Date(value);
+        function pad(number) {
+            return (number < 10 ? '0' : '') + number;
+        }
+        return pad(date.getDate()) + '.' + pad(date.getMonth() + 1) + '.' + date.getFullYear() + ', ' +
+            pad(date.getHours() % 12 || 12) + ':' + pad(date.getMinutes());
+    }
+
+    function div(className, text) {
+        var element = document.createElement('div');
+        element.className = className;
+        element.textContent = text === null ? '' : text;
+        return element;
+    }
+
+    function appendMessage(message) {
+        if (content.querySelector('.chat-message[data-number="' + message.number + '"]')) {
+            return;
+        }
+        var element = div('chat-message ' + (message.direction ? 'msg-in' : 'msg-out'));
+        element.dataset.number = message.number;
+        element.appendChild(div('chat-message-content', message.content));
+        element.appendChild(div('chat-message-time', formatTime(message.time)));
+        content.appendChild(element);
+        element.scrollIntoView({block: 'end'});
+    }
+
+    function updateChat(chat) {
+        var link = chatList.querySelector('.chat-button[data-number="' + chat.number + '"]');
+        if (!link) {
+            // новые чаты появляются только на первой странице списка
+            if (view.dataset.firstPage !== '1') {
+                return;
+            }
+            link = document.createElement('a');
+            link.className = 'chat-button';
+            link.href = '/chats/' + chat.number + '/';
+            link.dataset.number = chat.number;
+            var entry = div('chat-entry');
+            entry.appendChild(div('chat-name', chat.name));
+            entry.appendChild(div('chat-last-message', ''));
+            entry.appendChild(div('chat-time', ''));
+            link.appendChild(entry);
+        }
+        link.querySelector('.chat-last-message').textContent = chat.chat_last_message || '';
+        link.querySelector('.chat-time').textContent = formatTime(chat.time);
+        if (view.dataset.firstPage === '1') {
+            chatList.insertBefore(link, chatList.firstChild);
+        }
+    }
+
+    var url = '/api/chats/events/?after_id=' + view.dataset.cursor + (selected ? '&chat=' + selected : '');
+    var source = new EventSource(url);
+    source.addEventListener('message', function (event) {
+        appendMessage(JSON.parse(event.data));
+    });
+    source.addEventListener('chat', function (event) {
+        updateChat(JSON.parse(event.data));
+    });
+})();
@@ -0,0 +1,38 @@
+import pytest
+
+from typing import Any
+
+from django.core.management import call_command
+
+from bot.dedup import WebhookDeduplicator
+from bot.identity import IdentityCache
+from bot.sessions import SessionStore
+from common.keyboards import KeyboardCache
+from patterns.singleton import Singleton
+from shop.catalog import Catalog
+
+
+@pytest.fixture
+def dialog_data(db: Any) -> None:
+    # каталог, бот и чаты, на которые ссылаются сценарии tests/dialog_content.json; откатываются вместе с тестом
+    call_command('loaddata', 'tests/test_data.json', verbosity=0)
+
+
+@pytest.fixture(autouse=True)
+def clear_identity_cache() -> None:
+    # откат транзакции теста не сбрасывает процессный кэш первичных ключей
+    IdentityCache().clear()
+    SessionStore().clear()
+    WebhookDeduplicator().clear()
+
+
+@pytest.fixture(autouse=True)
+def invalidate_catalog() -> None:
+    # сигналы откладывают сброс снимка до коммита, которого в тестах не происходит
+    Catalog().invalidate()
+
+
+@pytest.fixture(autouse=True)
+def reset_keyboard_cache(monkeypatch: Any) -> None:
+    # новый кэш клавиатур на каждый тест: сериализация меню в тестах диалога накапливает счётчики попаданий
+    monkeypatch.delitem(Singleton._instances, KeyboardCache, raising=False)
@@ -0,0 +1,137 @@
+import pytest
+
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, List
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from bot.archive import ARCHIVE_FIELDS, ArchiveConflictError, MessageArchive
+from bot.models import ArchivedChatBlock, Bot, BotUser, Chat, Message, OutboxMessage
+from bot.search import search_messages
+from common.constants import BotType, ChatType, MessageContentType, MessageDirection
+from patterns.singleton import Singleton
+
+
+@pytest.fixture
+def archive(monkeypatch: Any, tmp_path: Path) -> MessageArchive:
+    monkeypatch.delitem(Singleton._instances, MessageArchive, raising=False)
+    return MessageArchive(directory=str(tmp_path), cache_size=10)
+
+
+def create_chat(bot: Bot, number: int) -> Chat:
+    user = BotUser.objects.create(bot=bot, messenger_user_id=f'user:archive{number}', name=f'User {number}')
+    return Chat.objects.create(bot=bot, type=ChatType.PRIVATE.value, bot_user=user,
+                               id_in_messenger=f'chat:archive{number}', last_message_time=timezone.now())
+
+
+def create_messages(chat: Chat, days: int, count: int) -> List[Message]:
+    messages = [
+        Message.objects.create(bot=chat.bot, chat=chat, direction=MessageDirection.RECEIVED.value,
+                               content_type=MessageContentType.TEXT.value, text=f'{days} days {number}')
+        for number in range(count)
+    ]
+    for number, message in enumerate(messages):
+        # более поздние сообщения пачки - более новые
+        moment = timezone.now() - timedelta(days=days, minutes=count - number)
+        Message.objects.filter(pk=message.pk).update(created_at=moment)
+    return messages
+
+
+@pytest.mark.django_db
+def test_archive_moves_old_messages_into_segments(archive: MessageArchive) -> None:
+    bot = Bot.objects.create(name='archive', bot_type=BotType.TYPE_OK.value)
+    first, second = create_chat(bot, 0), create_chat(bot, 1)
+    old = create_messages(first, 100, 3) + create_messages(second, 100, 2)
+    fresh = create_messages(first, 1, 2)
+    pending = create_messages(second, 120, 1)[0]
+    OutboxMessage.objects.create(message=pending, bot=bot, payload='{}')
+
+    assert archive.archive(after_days=90, batch_size=4) == len(old)
+
+    remaining = set(Message.objects.filter(bot=bot).values_list('pk', flat=True))
+    assert remaining == {message.pk for message in fresh} | {pending.pk}
+    # пачка по 4 сообщения: два сегмента, в первом - блоки обоих чатов
+    blocks = ArchivedChatBlock.objects.filter(chat__bot=bot).order_by('pk')
+    assert [(block.chat_id, block.count) for block in blocks] == [(first.pk, 3), (second.pk, 1), (second.pk, 1)]
+    assert len(list(Path(archive.directory).glob('*.jsonl.gz'))) == 2
+    assert archive.archive(after_days=90) == 0
+
+
+@pytest.mark.django_db
+def test_chat_history_reads_through_archive(archive: MessageArchive, admin_client: Any) -> None:
+    bot = Bot.objects.create(name='archive', bot_type=BotType.TYPE_OK.value)
+    chat = create_chat(bot, 0)
+    old = create_messages(chat, 200, 3) + create_messages(chat, 100, 3)
+    fresh = create_messages(chat, 1, 2)
+    archive.archive(after_days=90, batch_size=3)
+    archive.archive(after_days=90, batch_size=3)
+    expected = [message.text for message in old + fresh]
+
+    history = Message.objects.get_chat_messages(chat.pk)
+    assert [message.text for message in history] == expected
+    assert history[0].created_at < history[-1].created_at
+
+    texts: List[str] = []
+    url = f'/api/chats/{chat.pk}/messages/?limit=3'
+    while True:
+        data = admin_client.get(url).json()
+        texts.extend(entry['content'] for entry in data['results'])
+        if data['next'] is None:
+            break
+        url = f'/api/chats/{chat.pk}/messages/?limit=3&before={data["next"]}'
+    assert texts == expected[::-1]
+    assert archive.stats()['blocks_read'] == 2
+
+
+@pytest.mark.django_db
+def test_archived_messages_leave_search_index(archive: MessageArchive) -> None:
+    bot = Bot.objects.create(name='archive', bot_type=BotType.TYPE_OK.value)
+    chat = create_chat(bot, 0)
+    create_messages(chat, 100, 2)
+    fresh = create_messages(chat, 1, 1)
+    assert len(search_messages('days')[0]) == 3
+
+    archive.archive(after_days=90)
+    # поиск охватывает только сообщения в таблице, история чата дочитывается из архива
+    assert [hit.message.pk for hit in search_messages('days')[0]] == [fresh[0].pk]
+    assert len(Message.objects.get_chat_messages(chat.pk)) == 3
+
+
+@pytest.mark.django_db
+def test_archive_keeps_microseconds(archive: MessageArchive) -> None:
+    bot = Bot.objects.create(name='archive', bot_type=BotType.TYPE_OK.value)
+    chat = create_chat(bot, 0)
+    message = create_messages(chat, 100, 1)[0]
+    moment = timezone.now().replace(microsecond=123456) - timedelta(days=100)
+    Message.objects.filter(pk=message.pk).update(created_at=moment)
+
+    archive.archive(after_days=90)
+    assert [archived.created_at for archived in archive.chat_messages(chat.pk)] == [moment]
+
+
+@pytest.mark.django_db
+def test_archive_conflict_removes_segment(archive: MessageArchive) -> None:
+    bot = Bot.objects.create(name='archive', bot_type=BotType.TYPE_OK.value)
+    chat = create_chat(bot, 0)
+    messages = create_messages(chat, 100, 3)
+    rows = list(Message.objects.filter(chat=chat).order_by('created_at', 'pk').values(*ARCHIVE_FIELDS))
+    # другой процесс уже перенёс одно сообщение пачки
+    messages[0].delete()
+
+    with pytest.raises(ArchiveConflictError):
+        archive._archive_batch(rows)
+    assert list(Path(archive.directory).iterdir()) == []
+    assert Message.objects.filter(chat=chat).count() == 2
+    assert not ArchivedChatBlock.objects.filter(chat=chat).exists()
+
+
+@pytest.mark.django_db
+def test_archive_messages_command(archive: MessageArchive, capsys: Any) -> None:
+    bot = Bot.objects.create(name='archive', bot_type=BotType.TYPE_OK.value)
+    create_messages(create_chat(bot, 0), 40, 2)
+
+    call_command('archive_messages', '--older-than-days', '30')
+    assert 'Messages archived: 2' in capsys.readouterr().out
+    assert not Message.objects.filter(bot=bot).exists()
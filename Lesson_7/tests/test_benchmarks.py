@@ -0,0 +1,167 @@
+"""Бенчмарк шагов диалога с бюджетами запросов, времени и памяти.
+
+Сценарий tests/dialog_content.json (приветствие -> категории -> товары -> описание -> подтверждение -> оплата)
+прогоняется через message_handler для новых чатов. Для каждого шага измеряются количество запросов к БД,
+перцентили времени по BENCHMARK_FLOWS прогонам и пик выделенной памяти (tracemalloc, отдельным прогоном, чтобы
+трассировка не искажала время). Тест падает, если шаг вышел за бюджет из tests/benchmark_budgets.json.
+
+Бюджет запросов от машины не зависит и проверяется при каждом запуске тестов. Бюджеты времени и памяти
+проверяет тест с меткой benchmark, который по умолчанию не запускается (addopts в pytest.ini).
+Запуск бенчмарка с отчётом: pytest -m benchmark -s. Переменные окружения:
+BENCHMARK_FLOWS - количество прогонов для перцентилей времени (по умолчанию 30),
+BENCHMARK_TIME_FACTOR - множитель бюджетов времени для медленных машин (по умолчанию 1),
+BENCHMARK_REPORT - файл, в который записываются результаты в JSON."""
+
+import pytest
+
+import itertools
+import json
+import math
+import os
+import re
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from bot.handlers import message_handler
+from bot.registry import BotRegistry
+from common.entities import EventCommandReceived
+from patterns.singleton import Singleton
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    content: Dict[str, str] = json.loads(f.readline())
+with open('tests/benchmark_budgets.json', 'r') as f:
+    budgets: Dict[str, Dict[str, float]] = json.load(f)
+
+STEPS = (
+    ('greeting', 'greet_input'),
+    ('categories', 'category_input'),
+    ('products', 'product_input'),
+    ('description', 'desc_input'),
+    ('confirmation', 'confirm_input'),
+    ('payment', 'order_input'),
+)
+FLOWS = int(os.getenv('BENCHMARK_FLOWS', '30'))
+TIME_FACTOR = float(os.getenv('BENCHMARK_TIME_FACTOR', '1'))
+TRANSACTION_SQL = re.compile(r'(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT) ')
+
+Flow = List[Tuple[str, EventCommandReceived]]
+Measure = Callable[[str, Callable[[], Any]], None]
+
+
+class FakePaymentClient:
+    def check_out(self, order_id: int, product_id: int) -> str:
+        return f'https://pay.example.com/{order_id}'
+
+
+def flow(number: int) -> Flow:
+    """События сценария для отдельного чата number с уникальными id сообщений."""
+
+    events: Flow = []
+    for step, key in STEPS:
+        data = json.loads(content[key])
+        data['chat_id_in_messenger'] = f'chat:bench{number}'
+        data['user_id_in_messenger'] = f'user:bench{number}'
+        data['message_id_in_messenger'] = f'mid:bench{number}.{step}'
+        events.append((step, EventCommandReceived.Schema().load(data)))
+    return events
+
+
+def replay(events: Flow, measure: Measure) -> None:
+    for step, event in events:
+        measure(step, lambda: message_handler(event))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)]
+
+
+@pytest.fixture
+def flows(dialog_data: None, monkeypatch: Any) -> Iterator[Flow]:
+    """Сценарии для новых чатов после прогревочного прогона.
+
+    Реестр ботов заменяется на время теста новым: боты из откатываемых данных теста не остаются
+    в реестре для остальных тестов."""
+
+    # ответы уходят через OutboxMessage, а поток отправки в тестах не запущен - платформы не вызываются
+    monkeypatch.setattr('bot.dialog.PaymentClientFactory.create', lambda payment_type: FakePaymentClient())
+    monkeypatch.delitem(Singleton._instances, BotRegistry, raising=False)
+    numbers = itertools.count()
+    # прогрев: снимок каталога, сериализаторы, кэши процесса
+    replay(flow(next(numbers)), lambda step, call: call())
+    return (flow(number) for number in numbers)
+
+
+def check_budgets(results: Dict[str, Dict[str, float]], metrics: Tuple[str, ...]) -> None:
+    exceeded = []
+    for step, row in results.items():
+        budget = budgets[step]
+        if 'queries' in metrics and row['queries'] > budget['queries']:
+            exceeded.append(f'{step}: {row["queries"]} queries > {budget["queries"]}')
+        if 'p95_ms' in metrics and row['p95_ms'] > budget['p95_ms'] * TIME_FACTOR:
+            exceeded.append(f'{step}: p95 {row["p95_ms"]} ms > {budget["p95_ms"] * TIME_FACTOR} ms')
+        if 'peak_kib' in metrics and row['peak_kib'] > budget['peak_kib']:
+            exceeded.append(f'{step}: peak {row["peak_kib"]} KiB > {budget["peak_kib"]} KiB')
+    assert not exceeded, 'Dialog step budgets exceeded:\n' + '\n'.join(exceeded)
+
+
+@pytest.mark.django_db
+def test_dialog_step_queries_within_budget(flows: Iterator[Flow]) -> None:
+    queries: Dict[str, int] = {}
+
+    def count_queries(step: str, call: Callable[[], Any]) -> None:
+        with CaptureQueriesContext(connection) as captured:
+            assert call() is not None, step
+        # управление транзакцией (SAVEPOINT, RELEASE) не считается - бюджет ограничивает обращения к данным
+        queries[step] = sum(1 for query in captured.captured_queries if not TRANSACTION_SQL.match(query['sql']))
+
+    replay(next(flows), count_queries)
+    check_budgets({step: {'queries': count} for step, count in queries.items()}, ('queries',))
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+def test_dialog_steps_within_budget(flows: Iterator[Flow]) -> None:
+    timings: Dict[str, List[float]] = {step: [] for step, _ in STEPS}
+
+    def measure_time(step: str, call: Callable[[], Any]) -> None:
+        started = time.perf_counter()
+        call()
+        timings[step].append((time.perf_counter() - started) * 1000)
+
+    for _ in range(FLOWS):
+        replay(next(flows), measure_time)
+
+    peaks: Dict[str, float] = {}
+
+    def measure_memory(step: str, call: Callable[[], Any]) -> None:
+        tracemalloc.start()
+        try:
+            call()
+            peaks[step] = tracemalloc.get_traced_memory()[1] / 1024
+        finally:
+            tracemalloc.stop()
+
+    replay(next(flows), measure_memory)
+
+    results = {
+        step: {
+            'p50_ms': round(percentile(timings[step], 0.5), 2),
+            'p95_ms': round(percentile(timings[step], 0.95), 2),
+            'peak_kib': round(peaks[step], 1),
+        }
+        for step, _ in STEPS
+    }
+    print('\n' + '\n'.join(
+        f'{step:<14} p50 {row["p50_ms"]:>7.2f} ms  p95 {row["p95_ms"]:>7.2f} ms  peak {row["peak_kib"]:>8.1f} KiB'
+        for step, row in results.items()
+    ))
+    if os.getenv('BENCHMARK_REPORT'):
+        with open(os.environ['BENCHMARK_REPORT'], 'w') as report:
+            json.dump(results, report, indent=2)
+    check_budgets(results, ('p95_ms', 'peak_kib'))
@@ -0,0 +1,107 @@
+import pytest
+
+import gzip
+import json
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError
+
+from shop.catalog import Catalog
+from shop.feed import CatalogImporter, read_feed
+from shop.models import Category, Product
+
+
+CSV_FEED = '''sku,name,price,categories,is_active,description
+FEED-1,Мышь,990,Периферия/Мыши,1,Беспроводная
+FEED-2,Клавиатура,2490.5,Периферия/Клавиатуры|Распродажа,1,
+FEED-3,Коврик,300,Периферия,0,
+,Без артикула,100,Периферия,1,
+FEED-4,Кабель,abc,Периферия,1,
+'''
+
+
+def categories(sku: str) -> Set[str]:
+    return set(Product.objects.get(sku=sku).categories.values_list('name', flat=True))
+
+
+@pytest.mark.django_db
+def test_import_creates_products_and_categories(tmp_path: Path) -> None:
+    feed = tmp_path / 'feed.csv'
+    feed.write_text(CSV_FEED, encoding='utf-8')
+
+    stats = CatalogImporter(batch_size=2).run(read_feed(str(feed)))
+    assert (stats.rows, stats.created, stats.errors, stats.categories_created) == (5, 3, 2, 4)
+
+    keyboard = Product.objects.get(sku='FEED-2')
+    assert keyboard.price.amount == Decimal('2490.50') and str(keyboard.price.currency) == 'RUB'
+    assert categories('FEED-2') == {'Клавиатуры', 'Распродажа'}
+    assert not Product.objects.get(sku='FEED-3').is_active
+    mice = Category.objects.get(name='Мыши')
+    assert mice.parent_category is not None and mice.parent_category.name == 'Периферия'
+    assert mice.path == f'{mice.parent_category_id}/{mice.pk}/'
+    # снимок каталога перестраивается после импорта
+    assert any(product.name == 'Мышь' for product in Catalog().get().products.values())
+
+
+@pytest.mark.django_db
+def test_import_skips_unchanged_rows_and_updates_changed(tmp_path: Path, django_assert_max_num_queries: Any) -> None:
+    feed = tmp_path / 'feed.csv'
+    feed.write_text(CSV_FEED, encoding='utf-8')
+    CatalogImporter().run(read_feed(str(feed)))
+    updated_at = dict(Product.objects.filter(sku__startswith='FEED-').values_list('sku', 'updated_at'))
+
+    # повторный импорт того же фида: чтение категорий, товаров пачки и их связей, без записи
+    with django_assert_max_num_queries(3):
+        stats = CatalogImporter().run(read_feed(str(feed)))
+    assert (stats.created, stats.updated, stats.unchanged) == (0, 0, 3)
+    assert dict(Product.objects.filter(sku__startswith='FEED-').values_list('sku', 'updated_at')) == updated_at
+
+    rows: List[Dict[str, Any]] = [
+        {'sku': 'FEED-1', 'name': 'Мышь', 'price': '990', 'categories': ['Периферия/Мыши'],
+         'description': 'Беспроводная'},
+        {'sku': 'FEED-2', 'name': 'Клавиатура', 'price': '1990', 'categories': ['Периферия/Клавиатуры']},
+        {'sku': 'FEED-3', 'name': 'Коврик', 'price': '300', 'categories': ['Аксессуары'], 'is_active': False},
+        {'sku': 'FEED-2', 'name': 'Клавиатура', 'price': '1890', 'categories': ['Периферия/Клавиатуры']},
+    ]
+    gz_feed = tmp_path / 'feed.jsonl.gz'
+    with gzip.open(gz_feed, 'wt', encoding='utf-8') as stream:
+        stream.writelines(json.dumps(row, ensure_ascii=False) + '\n' for row in rows)
+    stats = CatalogImporter().run(read_feed(str(gz_feed)))
+    assert (stats.created, stats.updated, stats.unchanged, stats.duplicates) == (0, 2, 1, 1)
+    assert Product.objects.get(sku='FEED-2').price.amount == Decimal('1890.00')
+    assert categories('FEED-2') == {'Клавиатуры'}
+    assert categories('FEED-3') == {'Аксессуары'}
+    assert Product.objects.get(sku='FEED-1').updated_at == updated_at['FEED-1']
+
+
+@pytest.mark.django_db
+def test_import_catalog_command(tmp_path: Path, capsys: Any) -> None:
+    feed = tmp_path / 'feed.csv'
+    feed.write_text(CSV_FEED, encoding='utf-8')
+
+    call_command('import_catalog', str(feed), '--batch-size', '10')
+    output = capsys.readouterr().out
+    assert 'created 3' in output and 'rows/s' in output
+
+
+@pytest.mark.django_db
+def test_import_catalog_reports_failed_batch(tmp_path: Path, monkeypatch: Any) -> None:
+    feed = tmp_path / 'feed.csv'
+    feed.write_text(CSV_FEED, encoding='utf-8')
+    bulk_create = Product.objects.bulk_create
+
+    def failing_bulk_create(products: List[Product], *args: Any, **kwargs: Any) -> Any:
+        if any(product.sku == 'FEED-3' for product in products):
+            raise IntegrityError('UNIQUE constraint failed: shop_product.sku')
+        return bulk_create(products, *args, **kwargs)
+
+    monkeypatch.setattr(Product.objects, 'bulk_create', failing_bulk_create)
+    # пачки по две строки: FEED-1 и FEED-2 записываются, пачка строк 3-5 с FEED-3 откатывается
+    with pytest.raises(CommandError, match=r'1 batches not written.*batches: 1 \(failed 1, 1 rows\)'):
+        call_command('import_catalog', str(feed), '--batch-size', '2')
+    assert set(Product.objects.filter(sku__startswith='FEED-').values_list('sku', flat=True)) == {'FEED-1', 'FEED-2'}
+    assert categories('FEED-2') == {'Клавиатуры', 'Распродажа'}
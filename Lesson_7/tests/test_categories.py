@@ -0,0 +1,104 @@
+import pytest
+
+import json
+from typing import Any
+
+from common.constants import CallbackType
+from common.entities import Callback, EventCommandReceived
+from bot.dialog import Dialog
+from shop.catalog import Catalog, build_snapshot
+from shop.models import Category, Product
+
+
+@pytest.mark.django_db
+def test_category_paths_follow_moves_and_deletes() -> None:
+    root = Category.objects.create(name='root')
+    child = Category.objects.create(name='child', parent_category=root)
+    leaf = Category.objects.create(name='leaf', parent_category=child)
+    assert leaf.path == f'{root.pk}/{child.pk}/{leaf.pk}/'
+
+    other = Category.objects.create(name='other')
+    child.parent_category = other
+    child.save()
+    leaf.refresh_from_db()
+    assert leaf.path == f'{other.pk}/{child.pk}/{leaf.pk}/'
+    assert leaf.get_ancestor_ids() == [other.pk, child.pk]
+
+    other.delete()
+    child.refresh_from_db()
+    leaf.refresh_from_db()
+    assert child.path == f'{child.pk}/'
+    assert leaf.path == f'{child.pk}/{leaf.pk}/'
+
+
+@pytest.mark.django_db
+def test_category_cannot_be_nested_into_descendant() -> None:
+    from django.core.exceptions import ValidationError
+
+    root = Category.objects.create(name='root')
+    child = Category.objects.create(name='child', parent_category=root)
+    root.parent_category = child
+    with pytest.raises(ValidationError):
+        root.save()
+
+
+@pytest.mark.django_db
+def test_catalog_digest_follows_content_not_version(dialog_data: None) -> None:
+    first = build_snapshot(1)
+    # другой процесс с тем же каталогом получает тот же хэш при любом номере снимка
+    assert build_snapshot(7).digest == first.digest
+
+    category = Category.objects.filter(is_active=True).first()
+    category.name = category.name + ' (новая)'
+    category.save()
+    changed = build_snapshot(1)
+    assert changed.version == first.version
+    assert changed.digest != first.digest
+
+
+@pytest.mark.django_db
+def test_get_subtree_single_query(django_assert_num_queries: Any) -> None:
+    root = Category.objects.create(name='root')
+    first = Category.objects.create(name='a', parent_category=root)
+    second = Category.objects.create(name='b', parent_category=root)
+    leaf = Category.objects.create(name='leaf', parent_category=first)
+    hidden = Category.objects.create(name='hidden', parent_category=second, is_active=False)
+    Category.objects.create(name='unreachable', parent_category=hidden)
+    for number, category in enumerate((first, first, leaf)):
+        product = Product.objects.create(name=f'product {number}')
+        product.categories.add(category, root)
+
+    with django_assert_num_queries(1):
+        tree = Category.objects.get_subtree(root.pk)
+
+    assert [node['id'] for node in tree] == [root.pk]
+    node = tree[0]
+    assert node['product_count'] == 3
+    assert [child['id'] for child in node['children']] == [first.pk, second.pk]
+    first_node, second_node = node['children']
+    assert first_node['product_count'] == 2
+    assert first_node['child_category_exists']
+    assert first_node['children'][0]['id'] == leaf.pk
+    assert first_node['children'][0]['level'] == 3
+    assert second_node['child_category_exists']
+    assert second_node['children'] == []
+
+
+@pytest.mark.django_db
+def test_dialog_navigates_nested_categories(django_assert_num_queries: Any) -> None:
+    root = Category.objects.create(name='root')
+    child = Category.objects.create(name='child', parent_category=root)
+    product = Product.objects.create(name='product')
+    product.categories.add(child)
+    Catalog().get()
+
+    with open('tests/dialog_content.json', 'r') as f:
+        event_data = json.loads(json.loads(f.readline())['product_input'])
+    event_data['payload']['command'] = Callback.Schema().dumps(Callback(CallbackType.CATEGORY, root.pk))
+    event = EventCommandReceived.Schema().load(event_data)
+
+    with django_assert_num_queries(0):
+        result = Dialog().reply(event)
+
+    buttons = [Callback.Schema().loads(button.action.payload) for button in result.inline_buttons]
+    assert buttons == [Callback(CallbackType.CATEGORY, child.pk)]
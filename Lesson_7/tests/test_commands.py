@@ -0,0 +1,40 @@
+from typing import Any
+
+from clients.jivosite.commands import MemoryCommandBackend, SqliteCommandBackend
+
+
+def test_memory_backend_is_bounded() -> None:
+    backend = MemoryCommandBackend(maxsize=2, ttl=60)
+    for number in range(3):
+        backend.set(f'client:{number}', {'Кнопка': f'{{"id": {number}}}'})
+
+    assert backend.get('client:0') is None
+    assert backend.get('client:2') == {'Кнопка': '{"id": 2}'}
+    stats = backend.stats()
+    assert (stats['size'], stats['evictions']) == (2, 1)
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path: Any) -> None:
+    path = str(tmp_path / 'commands.sqlite3')
+    first = SqliteCommandBackend(path, maxsize=2, ttl=60)
+    second = SqliteCommandBackend(path, maxsize=2, ttl=60)
+
+    first.set('client:1', {'Процессоры': '{"type": "category", "id": 4}'})
+    assert second.get('client:1') == {'Процессоры': '{"type": "category", "id": 4}'}
+
+    second.set('client:2', {})
+    second.set('client:3', {})
+    assert first.get('client:1') is None
+    assert second.stats()['evictions'] == 1
+    assert first.stats()['size'] == 2
+
+
+def test_sqlite_backend_expires_entries(tmp_path: Any, monkeypatch: Any) -> None:
+    backend = SqliteCommandBackend(str(tmp_path / 'commands.sqlite3'), maxsize=10, ttl=60)
+    backend.set('client:1', {'Кнопка': None})
+
+    clock = 10 ** 10
+    monkeypatch.setattr('clients.jivosite.commands.time.time', lambda: clock)
+    assert backend.get('client:1') is None
+    assert backend.stats()['expirations'] == 1
+    assert backend.stats()['size'] == 0
@@ -0,0 +1,86 @@
+import pytest
+
+import json
+from typing import Any, Dict
+
+from bot.dedup import WebhookDeduplicator
+from bot.dialog import Dialog
+from bot.handlers import message_handler
+from bot.models import Bot, Message, WebhookReceipt
+from bot.registry import BotRegistry
+from common.bloom import BloomFilter
+from common.constants import BotType
+from common.entities import EventCommandReceived
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    template: Dict[str, Any] = json.loads(json.loads(f.readline())['greet_input'])
+
+
+def event(bot_id: int, message_id: str) -> EventCommandReceived:
+    data = dict(template, bot_id=bot_id, chat_id_in_messenger='chat:dedup', message_id_in_messenger=message_id)
+    return EventCommandReceived.Schema().load(data)
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [f'1:mid:{number}' for number in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    assert bloom.is_full
+    false_positives = sum(f'2:mid:{number}' in bloom for number in range(10000))
+    assert false_positives < 300
+
+
+@pytest.mark.django_db
+def test_duplicate_webhook_is_dropped_without_second_message(django_assert_num_queries: Any) -> None:
+    bot = Bot.objects.create(name='dedup', bot_type=BotType.TYPE_OK.value)
+    BotRegistry().load()
+
+    assert message_handler(event(bot.pk, 'mid:1')) is not None
+    dropped = WebhookDeduplicator().stats()['dropped_precheck']
+    with django_assert_num_queries(1):
+        assert message_handler(event(bot.pk, 'mid:1')) is None
+
+    assert Message.objects.filter(id_in_messenger='mid:1').count() == 1
+    assert WebhookReceipt.objects.filter(bot=bot).count() == 1
+    assert WebhookDeduplicator().stats()['dropped_precheck'] == dropped + 1
+
+
+@pytest.mark.django_db
+def test_duplicate_from_another_worker_is_caught_by_index() -> None:
+    bot = Bot.objects.create(name='dedup', bot_type=BotType.TYPE_OK.value)
+    BotRegistry().load()
+    message_handler(event(bot.pk, 'mid:2'))
+
+    # другой воркер: фильтр Блума не знает сообщение, повтор отбрасывает уникальный индекс
+    WebhookDeduplicator().clear()
+    dropped = WebhookDeduplicator().stats()['dropped_index']
+    assert message_handler(event(bot.pk, 'mid:2')) is None
+    assert Message.objects.filter(id_in_messenger='mid:2').count() == 1
+    assert WebhookDeduplicator().stats()['dropped_index'] == dropped + 1
+
+    # новое сообщение обрабатывается как обычно
+    assert message_handler(event(bot.pk, 'mid:3')) is not None
+
+
+@pytest.mark.django_db
+def test_failed_reply_does_not_keep_receipt(monkeypatch: Any) -> None:
+    bot = Bot.objects.create(name='dedup', bot_type=BotType.TYPE_OK.value)
+    BotRegistry().load()
+
+    def fail(self: Dialog, event: EventCommandReceived, session: Any = None) -> None:
+        raise RuntimeError('dialog failed')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(Dialog, 'reply', fail)
+        with pytest.raises(RuntimeError):
+            message_handler(event(bot.pk, 'mid:4'))
+    assert not WebhookReceipt.objects.filter(bot=bot).exists()
+    assert not Message.objects.filter(id_in_messenger='mid:4').exists()
+
+    # повторная доставка того же сообщения получает ответ
+    assert message_handler(event(bot.pk, 'mid:4')) is not None
+    assert Message.objects.filter(id_in_messenger='mid:4').count() == 1
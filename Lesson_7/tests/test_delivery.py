@@ -0,0 +1,73 @@
+import pytest
+
+from typing import Any, Callable, List
+
+import requests
+
+from clients.delivery import DeliveryDispatcher, DeliveryTask
+from clients.exceptions import OkServerError, PlatformUnavailableError
+from patterns.singleton import Singleton
+
+
+class Outcomes:
+    def __init__(self) -> None:
+        self.sent: List[str] = []
+        self.failed: List[str] = []
+
+    def dispatcher(self, **kwargs: Any) -> DeliveryDispatcher:
+        return DeliveryDispatcher(on_sent=lambda task: self.sent.append(task.key),
+                                  on_failed=lambda task: self.failed.append(task.key), **kwargs)
+
+
+def flaky(errors: List[Exception]) -> Callable[[], None]:
+    def send() -> None:
+        if errors:
+            raise errors.pop(0)
+    return send
+
+
+@pytest.fixture
+def outcomes(monkeypatch: Any) -> Outcomes:
+    # отдельный экземпляр диспетчера без задержек между повторами
+    monkeypatch.delitem(Singleton._instances, DeliveryDispatcher, raising=False)
+    monkeypatch.setattr('clients.delivery.backoff_delay', lambda attempt: 0.01)
+    return Outcomes()
+
+
+def test_retryable_errors_are_retried(outcomes: Outcomes) -> None:
+    dispatcher = outcomes.dispatcher(workers=2)
+    task = DeliveryTask('ok_1', flaky([requests.ConnectionError(), PlatformUnavailableError('OK', 503)]))
+    assert dispatcher.submit(task)
+    assert dispatcher.join(timeout=5)
+
+    assert outcomes.sent == ['ok_1']
+    assert task.attempts == 3
+    assert dispatcher.stats()['retried'] == 2
+
+
+def test_platform_errors_are_not_retried(outcomes: Outcomes) -> None:
+    dispatcher = outcomes.dispatcher()
+    task = DeliveryTask('ok_2', flaky([OkServerError('error', {}), requests.Timeout()]))
+    dispatcher.submit(task)
+    assert dispatcher.join(timeout=5)
+
+    assert outcomes.failed == ['ok_2']
+    assert task.attempts == 1
+    assert task.last_error is not None and task.last_error.startswith('OkServerError')
+
+
+def test_expired_message_fails(outcomes: Outcomes) -> None:
+    dispatcher = outcomes.dispatcher(max_age=0)
+    task = DeliveryTask('ok_3', flaky([requests.Timeout()]))
+    dispatcher.submit(task)
+    assert dispatcher.join(timeout=5)
+
+    assert outcomes.failed == ['ok_3']
+    assert dispatcher.stats()['retried'] == 0
+
+
+def test_full_queue_rejects(outcomes: Outcomes) -> None:
+    dispatcher = outcomes.dispatcher(max_pending=0)
+    assert not dispatcher.submit(DeliveryTask('ok_4', flaky([])))
+    assert outcomes.failed == ['ok_4']
+    assert dispatcher.stats()['rejected'] == 1
@@ -1,11 +1,14 @@
 import pytest
 
+import dataclasses
 import json
+from typing import Any
 
 from django.core.management import call_command
 
 from common.entities import EventCommandReceived, EventCommandToSend, Callback
 from bot.dialog import Dialog
+from shop.catalog import Catalog
 
 
 with open('tests/dialog_content.json', 'r') as f:
@@ -126,6 +129,27 @@ def test_form_order_confirmation(input_: EventCommandReceived, expected: EventCo
         assert load(result.inline_buttons[i].action.payload) == load(expected.inline_buttons[i].action.payload)
 
 
+@pytest.mark.django_db
+@pytest.mark.parametrize(['input_', 'expected'], category_cases + product_cases + desc_cases + confirm_cases)
+def test_menu_steps_without_queries(input_: EventCommandReceived,
+                                    expected: EventCommandToSend,
+                                    django_assert_num_queries: Any) -> None:
+
+    Catalog().get()
+    with django_assert_num_queries(0):
+        result = Dialog().reply(input_)
+    assert result == expected
+
+
+@pytest.mark.django_db
+def test_keyboard_key_depends_on_language() -> None:
+    input_ = category_cases[0][0]
+    keys = {lang: Dialog().reply(dataclasses.replace(input_, lang_code=lang)).keyboard_key for lang in ('ru', 'en')}
+    assert keys['ru'] is not None and keys['ru'] != keys['en']
+    # без языка от платформы используется язык пользователя по умолчанию
+    assert Dialog().reply(input_).keyboard_key == keys['ru']
+
+
 # @pytest.mark.django_db
 # @pytest.mark.parametrize(['input_', 'expected'], order_cases)
 # def test_make_order(input_: EventCommandReceived, expected: EventCommandToSend):
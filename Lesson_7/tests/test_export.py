@@ -0,0 +1,87 @@
+import pytest
+
+import csv
+import gzip
+import io
+import json
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, List
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from bot.archive import MessageArchive
+from bot.constants import ExportFormat
+from bot.export import parse_moment, stream_export
+from bot.models import Bot, BotUser, Chat, Message
+from common.constants import BotType, ChatType, MessageContentType, MessageDirection
+from patterns.singleton import Singleton
+
+
+@pytest.fixture
+def bot(monkeypatch: Any, tmp_path: Path) -> Bot:
+    """Бот с чатом: три сообщения 100-дневной давности в архиве и два сообщения в таблице."""
+
+    monkeypatch.delitem(Singleton._instances, MessageArchive, raising=False)
+    MessageArchive(directory=str(tmp_path / 'archive'))
+    bot = Bot.objects.create(name='export', bot_type=BotType.TYPE_OK.value)
+    user = BotUser.objects.create(bot=bot, messenger_user_id='user:export', name='Экспорт')
+    chat = Chat.objects.create(bot=bot, type=ChatType.PRIVATE.value, bot_user=user, id_in_messenger='chat:export')
+    for number, days in enumerate([100, 100, 100, 2, 1]):
+        message = Message.objects.create(bot=bot, chat=chat, direction=MessageDirection.RECEIVED.value,
+                                         content_type=MessageContentType.TEXT.value, text=f'текст, {number}')
+        Message.objects.filter(pk=message.pk).update(created_at=timezone.now() - timedelta(days=days, minutes=-number))
+    MessageArchive().archive(after_days=90)
+    return bot
+
+
+def texts(data: bytes) -> List[str]:
+    return [json.loads(line)['text'] for line in data.decode('utf-8').splitlines()]
+
+
+@pytest.mark.django_db
+def test_export_streams_archived_and_stored_messages(bot: Bot) -> None:
+    assert Message.objects.filter(bot=bot).count() == 2
+
+    chunks = list(stream_export(bot_id=bot.pk, buffer_size=64))
+    # выгрузка отдаётся кусками по мере чтения, а не одним блоком
+    assert len(chunks) > 1
+    assert texts(b''.join(chunks)) == [f'текст, {number}' for number in range(5)]
+
+    since = timezone.now() - timedelta(days=50)
+    assert texts(b''.join(stream_export(bot_id=bot.pk, since=since))) == ['текст, 3', 'текст, 4']
+    until = timezone.now() - timedelta(days=1, hours=12)
+    assert texts(b''.join(stream_export(bot_id=bot.pk, until=until))) == [f'текст, {number}' for number in range(4)]
+
+
+@pytest.mark.django_db
+def test_export_csv_with_gzip(bot: Bot) -> None:
+    data = gzip.decompress(b''.join(stream_export(ExportFormat.CSV, True, bot_id=bot.pk, buffer_size=16)))
+    rows = list(csv.DictReader(io.StringIO(data.decode('utf-8'))))
+    assert [row['text'] for row in rows] == [f'текст, {number}' for number in range(5)]
+    # время архивных и хранимых сообщений записывается одинаково
+    assert {len(row['created_at']) for row in rows} == {len(rows[-1]['created_at'])}
+
+
+@pytest.mark.django_db
+def test_export_endpoint_and_command(bot: Bot, admin_client: Any, client: Any, tmp_path: Path) -> None:
+    response = admin_client.get(f'/api/messages/export/?bot={bot.pk}&gzip=1&since=2000-01-01')
+    assert response.status_code == 200
+    assert response['Content-Type'] == 'application/gzip'
+    assert '.jsonl.gz' in response['Content-Disposition']
+    assert len(texts(gzip.decompress(b''.join(response.streaming_content)))) == 5
+    assert admin_client.get('/api/messages/export/?since=yesterday').status_code == 400
+    assert admin_client.get('/api/messages/export/?format=xml').status_code == 400
+    assert client.get('/api/messages/export/').status_code == 302
+
+    output = tmp_path / 'messages.jsonl'
+    call_command('export_messages', '--bot', str(bot.pk), '--output', str(output))
+    assert texts(output.read_bytes()) == [f'текст, {number}' for number in range(5)]
+
+
+def test_parse_moment() -> None:
+    assert parse_moment('2020-05-01') == parse_moment('2020-05-01T00:00:00')
+    assert parse_moment('2020-05-01T10:00:00+03:00').hour == 10
+    with pytest.raises(ValueError):
+        parse_moment('01.05.2020')
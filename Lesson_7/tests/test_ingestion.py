@@ -0,0 +1,55 @@
+import pytest
+
+from typing import List, Tuple
+
+from _pytest.monkeypatch import MonkeyPatch
+
+from bot import ingestion
+from bot.ingestion import IngestionPool, process_event
+from bot.models import Bot
+from clients.jivosite.commands import CommandStore
+from common.constants import BotType
+from common.entities import EventCommandReceived
+
+
+def make_event(chat: str, number: int, bot_id: int = 1) -> EventCommandReceived:
+    return EventCommandReceived.Schema().load({
+        'bot_id': bot_id,
+        'chat_id_in_messenger': chat,
+        'content_type': 6,
+        'payload': {'direction': 1, 'text': str(number)},
+        'chat_type': 1,
+        'user_id_in_messenger': f'user:{chat}',
+        'message_id_in_messenger': f'mid:{chat}.{number}',
+    })
+
+
+def test_partitioned_order(monkeypatch: MonkeyPatch) -> None:
+    processed: List[Tuple[str, int]] = []
+
+    def fake_process(bot_type: int, event: EventCommandReceived) -> None:
+        processed.append((event.chat_id_in_messenger, int(event.payload.text)))
+
+    monkeypatch.setattr(ingestion, 'process_event', fake_process)
+    pool = IngestionPool()
+    chats = [f'chat:{i}' for i in range(6)]
+    for number in range(20):
+        for chat in chats:
+            assert pool.submit(11, make_event(chat, number))
+    pool.join()
+
+    for chat in chats:
+        assert [n for c, n in processed if c == chat] == list(range(20))
+    assert pool.partition_for(make_event(chats[0], 0)) == pool.partition_for(make_event(chats[0], 1))
+
+    stats = pool.stats()
+    assert stats['queue_depth'] == 0
+    assert sum(p['processed'] for p in stats['partitions']) >= len(processed)
+
+
+@pytest.mark.django_db
+def test_jivo_button_commands_stored_by_receiving_process() -> None:
+    bot = Bot.objects.create(name='jivo', bot_type=BotType.TYPE_JIVOSITE.value)
+    # ответ остаётся в OutboxMessage: поток отправки в тестах не запущен, как при отдельном run_outbox
+    process_event(BotType.TYPE_JIVOSITE.value, make_event('client:ingest', 0, bot.pk))
+    assert CommandStore().get('client:ingest')
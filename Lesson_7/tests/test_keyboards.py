@@ -0,0 +1,57 @@
+import pytest
+
+import json
+from typing import Optional
+
+from clients.jivosite.commands import CommandStore
+from clients.jivosite.jivosite import JivositeClient
+from clients.ok.ok import OkClient
+from common.builders import MessageDirector
+from common.constants import CallbackType
+from common.entities import EventCommandToSend
+from common.keyboards import KeyboardCache
+
+
+def menu(chat_id: str, keyboard_key: Optional[str]) -> EventCommandToSend:
+    ects = MessageDirector().create_ects(
+        bot_id=1,
+        chat_id_in_messenger=chat_id,
+        text='Выберите категорию товара:',
+        button_data=[{'title': f'Категория {i}', 'id': i, 'type': CallbackType.CATEGORY} for i in range(3)],
+        keyboard_key=keyboard_key,
+    )
+    ects.message_id = 7
+    return ects
+
+
+@pytest.fixture(autouse=True)
+def clear_keyboard_cache() -> None:
+    KeyboardCache().clear()
+
+
+def test_ok_spliced_message_matches_full_serialization() -> None:
+    client = OkClient()
+    client._serialize(menu('chat:1', 'categories:0:c0ffee'))
+
+    cached = json.loads(client._serialize(menu('chat:2', 'categories:0:c0ffee')))
+    full = json.loads(client._serialize(menu('chat:2', None)))
+
+    assert cached == full
+    assert KeyboardCache().stats()['hits'] == 2
+
+
+def test_jivo_spliced_event_matches_full_serialization() -> None:
+    client = JivositeClient()
+    client._serialize(menu('client:1', 'categories:0:c0ffee'))
+
+    cached = json.loads(client._serialize(menu('client:2', 'categories:0:c0ffee')))
+    full = json.loads(client._serialize(menu('client:2', None)))
+    cached['message'].pop('timestamp')
+    full['message'].pop('timestamp')
+
+    assert cached == full
+    # сериализация для отправки команды кнопок не запоминает - это делает процесс, принявший вебхук
+    assert CommandStore().get('client:2') is None
+    client.remember_reply(menu('client:2', 'categories:0:c0ffee'))
+    commands = {text: json.loads(command) for text, command in (CommandStore().get('client:2') or {}).items()}
+    assert commands == {f'Категория {i}': {'id': i, 'type': 'category'} for i in range(3)}
@@ -0,0 +1,95 @@
+import pytest
+
+import json
+import threading
+import time
+from typing import Any, List
+
+from bot.live import MessageBroadcaster
+from bot.models import Bot, Message
+from common.constants import BotType, ChatType, MessageContentType, MessageDirection
+from patterns.singleton import Singleton
+
+
+@pytest.fixture
+def broadcaster(monkeypatch: Any) -> MessageBroadcaster:
+    monkeypatch.delitem(Singleton._instances, MessageBroadcaster, raising=False)
+    return MessageBroadcaster(poll_interval=0.01, stream_ttl=0.1, batch_size=2)
+
+
+def store(bot_id: int, chat: str, text: str) -> Message:
+    return Message.objects.save_message(bot_id, chat, ChatType.PRIVATE, MessageDirection.RECEIVED,
+                                        MessageContentType.TEXT, f'user:{chat}', 'Tester', text, '')
+
+
+def test_publish_wakes_waiting_stream(monkeypatch: Any) -> None:
+    monkeypatch.delitem(Singleton._instances, MessageBroadcaster, raising=False)
+    broadcaster = MessageBroadcaster(poll_interval=5)
+    woken: List[bool] = []
+    waiter = threading.Thread(target=lambda: woken.append(broadcaster._wait(broadcaster._published())))
+    waiter.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    broadcaster.publish(11)
+    waiter.join(1)
+    assert woken == [True] and time.monotonic() - started < 1
+
+
+@pytest.mark.django_db
+def test_stream_sends_messages_after_cursor(broadcaster: MessageBroadcaster) -> None:
+    bot = Bot.objects.create(name='live', bot_type=BotType.TYPE_OK.value)
+    cursor = broadcaster.latest_id()
+    messages = [store(bot.pk, 'chat:live', f'text {number}') for number in range(3)]
+
+    batches = list(broadcaster.stream(cursor))
+    received = [message.pk for batch in batches for message in batch]
+    assert received == [message.pk for message in messages]
+    # пачки ограничены batch_size, пустые пачки - keep-alive
+    assert [len(batch) for batch in batches[:2]] == [2, 1]
+    assert broadcaster.stats()['subscribers'] == 0
+
+
+@pytest.mark.django_db
+def test_stream_sends_late_committed_message_once(broadcaster: MessageBroadcaster) -> None:
+    bot = Bot.objects.create(name='live', bot_type=BotType.TYPE_OK.value)
+    early = store(bot.pk, 'chat:live', 'early')
+    late = store(bot.pk, 'chat:live', 'late')
+    cursor = broadcaster.latest_id()
+    first = store(bot.pk, 'chat:live', 'first')
+    # сообщение late ещё не зафиксировано, когда поток отправил first: курсор уже за ним
+    late_id = late.pk
+    Message.objects.filter(pk=late_id).delete()
+    stream = broadcaster.stream(cursor)
+    assert [message.pk for message in next(stream)] == [first.pk]
+
+    # транзакция с меньшим id зафиксирована позже - поток всё равно отдаёт сообщение, и только один раз
+    Message.objects.bulk_create([Message(pk=late_id, bot=bot, chat_id=first.chat_id, text='late',
+                                         direction=MessageDirection.RECEIVED.value,
+                                         content_type=MessageContentType.TEXT.value)])
+    received = [message.pk for batch in stream for message in batch]
+    assert received == [late_id]
+    assert early.pk not in received
+    assert broadcaster.stats()['late'] == 1
+
+
+@pytest.mark.django_db
+def test_chat_events_endpoint_streams_selected_chat(broadcaster: MessageBroadcaster, admin_client: Any,
+                                                    client: Any) -> None:
+    bot = Bot.objects.create(name='live', bot_type=BotType.TYPE_OK.value)
+    cursor = broadcaster.latest_id()
+    selected = store(bot.pk, 'chat:selected', 'hello')
+    other = store(bot.pk, 'chat:other', 'bye')
+
+    response = admin_client.get(f'/api/chats/events/?after_id={cursor}&chat={selected.chat_id}')
+    assert response['Content-Type'] == 'text/event-stream'
+    events = [chunk.decode('utf-8') for chunk in response.streaming_content]
+    response.close()
+
+    assert events[0].startswith('retry:')
+    data = [json.loads(event.split('data: ')[1]) for event in events if event.startswith('event: ')]
+    kinds = [event.split('\n')[0] for event in events if event.startswith('event: ')]
+    assert kinds == ['event: message', 'event: chat', 'event: chat']
+    assert data[0]['content'] == 'hello' and data[0]['chat'] == selected.chat_id
+    assert {entry['number'] for entry in data[1:]} == {selected.chat_id, other.chat_id}
+    assert admin_client.get('/api/chats/events/?after_id=x').status_code == 400
+    assert client.get('/api/chats/events/').status_code == 302
@@ -0,0 +1,65 @@
+import pytest
+
+import json
+from typing import Any
+
+from django.test import RequestFactory
+
+from bot.registry import BotRegistry
+from clients.jivosite.jivosite import JivositeClient
+from clients.ok.ok import OkClient
+from shop.catalog import Catalog
+from util.loadgen import LoadStats, SyntheticChat, catalog_paths
+
+
+@pytest.mark.django_db
+def test_chat_follows_catalog_and_payloads_parse(dialog_data: None) -> None:
+    BotRegistry().load()
+    snapshot = Catalog().get()
+    catalog = catalog_paths(snapshot)
+    chat = SyntheticChat(7, 'ok', catalog, seed=1, payments=True)
+    factory = RequestFactory()
+
+    kinds = []
+    category_id = None
+    for _ in range(12):
+        path, kind, body = chat.next_request()
+        assert path == '/ok_webhook/'
+        kinds.append(kind)
+        event = OkClient().parse_webhook(factory.post(path, body, content_type='application/json'))
+        assert event.chat_id_in_messenger == 'chat:load7'
+        if kind == 'text':
+            assert event.payload.command is None and event.payload.text
+            continue
+        command = json.loads(event.payload.command)
+        if kind == 'category':
+            # переход в подкатегорию идёт только по дереву каталога
+            assert category_id is None or command['id'] in snapshot.categories[category_id].child_ids
+            category_id = command['id']
+        elif kind == 'product':
+            assert category_id is not None and command['id'] in snapshot.categories[category_id].product_ids
+            category_id = None
+    assert kinds[:2] == ['text', 'greeting'] and 'order' in kinds and 'payment' in kinds
+    # путь повторяется с начала после выбора оплаты
+    assert kinds[kinds.index('payment') + 1] == 'text'
+
+    jivo = SyntheticChat(3, 'jivo', catalog, seed=1, payments=False)
+    for _ in range(3):
+        path, kind, body = jivo.next_request()
+        event = JivositeClient().parse_webhook(factory.post(path, body, content_type='application/json'))
+        assert path == '/jivo_webhook/test' and event.chat_id_in_messenger == 'client:load3'
+        assert event.message_id_in_messenger.startswith('load3.')
+
+
+def test_load_stats_report() -> None:
+    stats = LoadStats()
+    for latency in (3.0, 4.0, 40.0, 900.0):
+        stats.record('ok:text', 200, latency)
+    stats.record('jivo:text', None, 10000.5, 'ConnectionError')
+    report: Any = stats.report(elapsed=2.0)
+    assert report['requests'] == 5 and report['throughput_rps'] == 2.5
+    assert report['error_rate'] == 0.2 and report['failures'] == {'ConnectionError': 1}
+    assert report['latency_ms']['p50'] == 40.0 and report['latency_ms']['max'] == 10000.5
+    assert dict((bound, count) for bound, count in report['histogram_ms'] if count) == {
+        5: 2, 50: 1, 1000: 1, None: 1,
+    }
@@ -0,0 +1,138 @@
+import pytest
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from bot.identity import IdentityCache
+from bot.managers import ChatUserConflictError
+from bot.models import Bot, BotUser, Chat, Message
+from bot.registry import BotRegistry
+from common.constants import BotType, ChatType, MessageDirection, MessageContentType, MessageStatus
+
+
+def store(bot_id: int, text: str, direction: MessageDirection = MessageDirection.RECEIVED) -> Message:
+    return Message.objects.save_message(
+        bot_id,
+        'chat:test',
+        ChatType.PRIVATE,
+        direction,
+        MessageContentType.COMMAND,
+        'user:test',
+        'Tester',
+        text,
+        'mid:test',
+    )
+
+
+def data_queries(context: CaptureQueriesContext) -> int:
+    return len([q for q in context.captured_queries
+                if not q['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))])
+
+
+@pytest.mark.django_db
+def test_store_message_creates_user_and_chat() -> None:
+    bot = Bot.objects.create(name='test', bot_type=BotType.TYPE_OK.value)
+
+    message = store(bot.pk, 'x' * 150)
+
+    user = BotUser.objects.get(bot=bot, messenger_user_id='user:test')
+    chat = Chat.objects.get(bot=bot, id_in_messenger='chat:test')
+    assert user.name == 'Tester'
+    assert chat.bot_user_id == user.pk
+    assert message.chat_id == chat.pk
+    assert message.status == MessageStatus.DELIVERED.value
+    assert chat.last_message_time == message.created_at
+    assert chat.last_message_text == 'x' * 100
+
+
+@pytest.mark.django_db
+def test_store_message_known_chat_queries() -> None:
+    bot = Bot.objects.create(name='test', bot_type=BotType.TYPE_OK.value)
+    store(bot.pk, 'first')
+    IdentityCache().clear()
+
+    with CaptureQueriesContext(connection) as context:
+        message = store(bot.pk, 'second', MessageDirection.SENT)
+
+    assert data_queries(context) == 3
+    assert message.status == MessageStatus.NEW.value
+    assert Chat.objects.get(pk=message.chat_id).last_message_text == 'second'
+    assert BotUser.objects.filter(bot=bot).count() == 1
+    assert Chat.objects.filter(bot=bot).count() == 1
+
+
+@pytest.mark.django_db
+def test_identity_cache() -> None:
+    bot = Bot.objects.create(name='test', bot_type=BotType.TYPE_OK.value)
+    first = store(bot.pk, 'first')
+    hits = IdentityCache().chats.hits
+
+    with CaptureQueriesContext(connection) as context:
+        second = store(bot.pk, 'second')
+
+    assert data_queries(context) == 2
+    assert IdentityCache().chats.hits == hits + 1
+    assert second.chat_id == first.chat_id
+
+    Chat.objects.get(pk=first.chat_id).save()
+    assert IdentityCache().chats.get((bot.pk, 'chat:test')) is None
+
+
+@pytest.mark.django_db
+def test_store_message_stale_cached_chat() -> None:
+    bot = Bot.objects.create(name='test', bot_type=BotType.TYPE_OK.value)
+    first = store(bot.pk, 'first')
+    stale = IdentityCache().chats.get((bot.pk, 'chat:test'))
+    assert stale is not None
+    # чат удалён другим процессом: сигналы этого процесса запись кэша не сбросили
+    Chat.objects.filter(pk=first.chat_id).delete()
+    IdentityCache().chats.set((bot.pk, 'chat:test'), stale)
+
+    with transaction.atomic():
+        second = store(bot.pk, 'second')
+
+    assert second.chat_id != first.chat_id
+    assert Chat.objects.filter(pk=second.chat_id).exists()
+    assert IdentityCache().chats.get((bot.pk, 'chat:test')) == (second.chat_id, second.bot_user_id)
+    connection.check_constraints()
+
+
+@pytest.mark.django_db
+def test_bot_registry() -> None:
+    registry = BotRegistry()
+    registry.load()
+    bot = Bot.objects.create(name='registry', bot_type=BotType.TYPE_JIVOSITE.value)
+
+    # промах читает только недостающего бота
+    with CaptureQueriesContext(connection) as context:
+        assert registry.get(bot.pk).name == 'registry'
+    assert data_queries(context) == 1
+    with CaptureQueriesContext(connection) as context:
+        assert registry.get_bot_type(bot.pk) == BotType.TYPE_JIVOSITE.value
+    assert data_queries(context) == 0
+    assert Bot.objects.get_bot_type_by_id(bot.pk) == BotType.TYPE_JIVOSITE.value
+    with pytest.raises(Bot.DoesNotExist):
+        registry.get(bot.pk + 1000)
+
+    # изменение строки сбрасывает её записи, и они перечитываются при следующем обращении
+    Bot.objects.filter(pk=bot.pk).update(name='renamed')
+    registry.forget(bot.pk, bot.bot_type)
+    assert registry.get(bot.pk).name == 'renamed'
+
+
+@pytest.mark.django_db
+def test_user_of_another_chat_is_reported() -> None:
+    bot = Bot.objects.create(name='test', bot_type=BotType.TYPE_OK.value)
+    store(bot.pk, 'first')
+    orphan = Chat.objects.create(bot=bot, id_in_messenger='chat:orphan', type=ChatType.PRIVATE.value)
+
+    # тот же пользователь пишет из другого чата: у пользователя может быть только один чат
+    for chat_id_in_messenger in ('chat:other', 'chat:orphan'):
+        with pytest.raises(ChatUserConflictError, match="'chat:test'"):
+            Message.objects.save_message(bot.pk, chat_id_in_messenger, ChatType.PRIVATE, MessageDirection.RECEIVED,
+                                         MessageContentType.COMMAND, 'user:test', 'Tester', 'second', 'mid:other')
+
+    assert not Chat.objects.filter(id_in_messenger='chat:other').exists()
+    orphan.refresh_from_db()
+    assert orphan.bot_user_id is None
+    assert IdentityCache().chats.get((bot.pk, 'chat:other')) is None
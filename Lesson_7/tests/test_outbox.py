@@ -0,0 +1,83 @@
+import pytest
+
+from datetime import timedelta
+from typing import Any, List
+
+from django.db import transaction
+from django.utils import timezone
+
+from bot.models import Bot, Message, OutboxMessage
+from bot.outbox import OutboxDrainer
+from bot.registry import BotRegistry
+from clients.delivery import DeliveryDispatcher, DeliveryTask, mark_sent
+from clients.ok.ok import OkClient
+from common.builders import MessageDirector
+from common.constants import BotType, ChatType, MessageStatus
+from patterns.singleton import Singleton
+
+
+def reply(bot_id: int, text: str) -> Message:
+    command = MessageDirector().create_ects(bot_id=bot_id, chat_id_in_messenger='chat:outbox', text=text)
+    return Message.objects.store_outgoing(command, ChatType.PRIVATE, 'user:outbox', 'Tester')
+
+
+@pytest.fixture
+def bot() -> Bot:
+    bot = Bot.objects.create(name='outbox', bot_type=BotType.TYPE_OK.value)
+    # реестр перечитывается по сигналу только после фиксации транзакции
+    BotRegistry().load()
+    return bot
+
+
+@pytest.mark.django_db
+def test_outbox_row_shares_message_transaction(bot: Bot) -> None:
+    message = reply(bot.pk, 'first')
+    assert OutboxMessage.objects.get(message=message).bot_id == bot.pk
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            reply(bot.pk, 'second')
+            raise RuntimeError
+    assert not Message.objects.filter(text='second').exists()
+    assert OutboxMessage.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_claim_is_exclusive_until_lease_expires(bot: Bot) -> None:
+    for number in range(3):
+        reply(bot.pk, f'message {number}')
+
+    first = OutboxMessage.objects.claim('first', 2, lease=60)
+    second = OutboxMessage.objects.claim('second', 10, lease=60)
+    assert len(first) == 2
+    assert len(second) == 1
+    assert not OutboxMessage.objects.claim('third', 10, lease=60)
+
+    # процесс first упал: после истечения захвата его строки забирает другой процесс
+    OutboxMessage.objects.filter(claimed_by='first').update(claimed_until=timezone.now() - timedelta(seconds=1))
+    resumed = OutboxMessage.objects.claim('third', 10, lease=60)
+    assert [row.pk for row in resumed] == [row.pk for row in first]
+
+
+@pytest.mark.django_db
+def test_drainer_sends_and_clears_outbox(bot: Bot, monkeypatch: Any) -> None:
+    posted: List[str] = []
+    finished: List[DeliveryTask] = []
+    monkeypatch.setattr(OkClient, '_post_to_platform', lambda self, link, data: posted.append(data))
+    monkeypatch.delitem(Singleton._instances, DeliveryDispatcher, raising=False)
+    monkeypatch.delitem(Singleton._instances, OutboxDrainer, raising=False)
+    # отметка статуса выполняется в потоке теста: потоки отправки не видят его незафиксированную транзакцию
+    dispatcher = DeliveryDispatcher(on_sent=finished.append, on_failed=finished.append)
+    message = reply(bot.pk, 'hello')
+
+    drainer = OutboxDrainer(batch_size=10)
+    assert drainer.drain() == 1
+    assert dispatcher.join(timeout=5)
+    assert len(posted) == 1 and '"hello"' in posted[0]
+
+    mark_sent(finished[0])
+    assert drainer.drain() == 0
+    message.refresh_from_db()
+    assert message.status == MessageStatus.SENT.value
+    assert not OutboxMessage.objects.exists()
+    assert drainer.stats()['in_flight'] == 0
@@ -0,0 +1,83 @@
+import pytest
+
+from datetime import timedelta
+from typing import Any, List, Optional
+
+from django.test import Client
+from django.utils import timezone
+
+from bot.models import Bot, BotUser, Chat, Message
+from bot.pagination import decode_cursor
+from common.constants import BotType, ChatType, MessageContentType, MessageDirection
+
+
+def create_chat(bot: Bot, number: int, minutes: Optional[int]) -> Chat:
+    user = BotUser.objects.create(bot=bot, messenger_user_id=f'user:page{number}', name=f'User {number}')
+    moment = timezone.now() - timedelta(minutes=minutes) if minutes is not None else None
+    return Chat.objects.create(bot=bot, type=ChatType.PRIVATE.value, bot_user=user,
+                               id_in_messenger=f'chat:page{number}', last_message_time=moment)
+
+
+@pytest.mark.django_db
+def test_chat_pages_cover_every_chat_once(django_assert_num_queries: Any) -> None:
+    bot = Bot.objects.create(name='pages', bot_type=BotType.TYPE_OK.value)
+    # одинаковое время у нескольких чатов и чаты без сообщений
+    for number, minutes in enumerate([1, 5, 5, 5, 10, None, None]):
+        create_chat(bot, number, minutes)
+
+    seen: List[int] = []
+    cursor = None
+    while True:
+        with django_assert_num_queries(1):
+            page = Chat.objects.page(decode_cursor(cursor) if cursor else None, limit=2)
+            names = [chat.bot_user.name for chat in page.items]
+        assert len(names) == len(page.items)
+        seen.extend(chat.pk for chat in page.items)
+        cursor = page.next
+        if cursor is None:
+            break
+
+    def position(chat: Chat) -> Any:
+        return chat.last_message_time is not None, chat.last_message_time, chat.pk
+
+    expected = sorted(Chat.objects.all(), key=position, reverse=True)
+    assert seen == [chat.pk for chat in expected]
+
+
+@pytest.mark.django_db
+def test_chat_messages_api_pages_back_in_time(admin_client: Any, client: Any) -> None:
+    bot = Bot.objects.create(name='pages', bot_type=BotType.TYPE_OK.value)
+    chat = create_chat(bot, 0, 0)
+    # bulk_create проставляет всем сообщениям почти одинаковое created_at, порядок держится на id
+    messages = Message.objects.bulk_create([
+        Message(bot=bot, chat=chat, direction=MessageDirection.RECEIVED.value,
+                content_type=MessageContentType.TEXT.value, text=f'text {number}')
+        for number in range(5)
+    ])
+    assert len(messages) == 5
+
+    texts: List[str] = []
+    url = f'/api/chats/{chat.pk}/messages/?limit=2'
+    while True:
+        data = admin_client.get(url).json()
+        texts.extend(entry['content'] for entry in data['results'])
+        if data['next'] is None:
+            break
+        url = f'/api/chats/{chat.pk}/messages/?limit=2&before={data["next"]}'
+
+    assert texts == [f'text {number}' for number in reversed(range(5))]
+    assert admin_client.get(f'/api/chats/{chat.pk}/messages/?before=garbage').status_code == 400
+
+    # история чатов доступна только персоналу
+    assert client.get(f'/api/chats/{chat.pk}/messages/').status_code == 302
+    assert client.get('/api/chats/').status_code == 302
+
+
+@pytest.mark.django_db
+def test_chat_view_renders_a_single_page() -> None:
+    bot = Bot.objects.create(name='pages', bot_type=BotType.TYPE_OK.value)
+    chat = create_chat(bot, 0, 0)
+
+    response = Client().get(f'/chats/{chat.pk}/')
+    assert response.status_code == 200
+    assert len(response.context['chat_list']) <= 50
@@ -0,0 +1,163 @@
+import pytest
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from django.test import Client
+
+from billing.models import Checkout
+from billing.paypal.client import PaypalClient
+from billing.paypal.signature import CertificateVerifier
+from billing.stripe.client import StripeClient
+from bot.models import Chat, Message
+from common.constants import OrderStatus
+from patterns.singleton import Singleton
+from shop.models import Order, Product
+from util.payment_simulator import PaymentSimulator, SimulatorConfig
+
+
+Webhook = Tuple[str, Dict[str, str], bytes]
+
+
+class Recorder:
+    """Сервер, принимающий вебхуки симулятора вместо сервера бота: тест передаёт их во вью сам."""
+
+    def __init__(self) -> None:
+        self.webhooks: List[Webhook] = []
+        recorder = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                recorder.webhooks.append((self.path, dict(self.headers), body))
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def wait(self, count: int) -> List[Webhook]:
+        deadline = time.monotonic() + 5
+        while len(self.webhooks) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert len(self.webhooks) >= count
+        return self.webhooks
+
+
+@pytest.fixture
+def recorder() -> Iterator[Recorder]:
+    recorder = Recorder()
+    yield recorder
+    recorder.server.shutdown()
+    recorder.server.server_close()
+
+
+@pytest.fixture
+def simulator(recorder: Recorder, monkeypatch: Any, tmp_path: Path, dialog_data: None) -> Iterator[PaymentSimulator]:
+    config = SimulatorConfig(approve_after=0, capture_after=0, paypal_webhook_id='WH-TEST', stripe_secret='whsec_test')
+    simulator = PaymentSimulator(f'http://127.0.0.1:{recorder.server.server_port}', config=config).start()
+    ca_file = tmp_path / 'ca.pem'
+    simulator.write_ca(str(ca_file))
+    for name, value in {'PAYPAL_API_URL': simulator.url, 'PAYPAL_WEBHOOK_SIMULATOR': True,
+                        'PAYPAL_WEBHOOK_ID': 'WH-TEST', 'PAYPAL_CLIENT_ID': 'id',
+                        'PAYPAL_CLIENT_SECRET': 'secret'}.items():
+        monkeypatch.setattr(f'billing.paypal.client.{name}', value)
+    for name, value in {'STRIPE_API_BASE': simulator.url, 'STRIPE_WHSEC_KEY': 'whsec_test',
+                        'STRIPE_SECRET_KEY': 'sk_test', 'SITE_HTTPS_URL': 'https://shop.example.com'}.items():
+        monkeypatch.setattr(f'billing.stripe.client.{name}', value)
+    # клиент Stripe меняет настройки модуля stripe - они восстанавливаются после теста
+    monkeypatch.setattr('stripe.api_base', 'https://api.stripe.com')
+    monkeypatch.setattr('stripe.api_key', None)
+    monkeypatch.delitem(Singleton._instances, CertificateVerifier, raising=False)
+    CertificateVerifier(str(ca_file), simulator.url)
+    yield simulator
+    simulator.stop()
+
+
+def new_order() -> Order:
+    chat = Chat.objects.filter(bot_user__isnull=False).first()
+    product = Product.objects.filter(is_active=True).first()
+    return Order.objects.create_order(chat.pk, product.pk)
+
+
+def post_webhook(webhook: Webhook) -> int:
+    path, headers, body = webhook
+    meta = {f'HTTP_{name.upper().replace("-", "_")}': value for name, value in headers.items()
+            if name.lower().startswith(('paypal-', 'stripe-'))}
+    response = Client().post(path, body, content_type='application/json', **meta)
+    return int(response.status_code)
+
+
+@pytest.mark.django_db
+def test_paypal_order_to_notification(simulator: PaymentSimulator, recorder: Recorder, monkeypatch: Any) -> None:
+    order = new_order()
+    link = PaypalClient().check_out(order.pk, order.product_id)
+    checkout = Checkout.objects.get(order=order)
+    assert link.endswith(checkout.tracking_id)
+    assert simulator.payment(checkout.tracking_id).data['purchase_units'][0]['reference_id'] == str(order.pk)
+    messages = Message.objects.count()
+
+    assert simulator.approve(checkout.tracking_id)
+    path, _, body = recorder.wait(1)[0]
+    assert path == '/billing/pp_webhook/' and json.loads(body)['event_type'] == 'CHECKOUT.ORDER.APPROVED'
+    # без PAYPAL_WEBHOOK_SIMULATOR подпись проверяется цепочкой PayPal, а сертификат с адреса симулятора
+    # не загружается
+    monkeypatch.setattr('billing.paypal.client.PAYPAL_WEBHOOK_SIMULATOR', False)
+    assert post_webhook(recorder.webhooks[0]) == 200
+    checkout.refresh_from_db()
+    assert checkout.status != 'APPROVED' and not checkout.capture_id
+    monkeypatch.setattr('billing.paypal.client.PAYPAL_WEBHOOK_SIMULATOR', True)
+    # вью проверяет подпись и захватывает средства, симулятор присылает вебхук о завершении платежа
+    assert post_webhook(recorder.webhooks[0]) == 200
+    checkout.refresh_from_db()
+    assert checkout.status == 'APPROVED' and checkout.capture_id
+
+    completed = recorder.wait(2)[1]
+    assert json.loads(completed[2])['event_type'] == 'PAYMENT.CAPTURE.COMPLETED'
+    # вебхук о захвате пришёл раньше, чем сохранён capture_id: 404, и PayPal пришлёт его повторно
+    Checkout.objects.filter(pk=checkout.pk).update(capture_id=None)
+    assert post_webhook(completed) == 404
+    Checkout.objects.filter(pk=checkout.pk).update(capture_id=checkout.capture_id)
+    assert post_webhook(completed) == 200
+    order.refresh_from_db()
+    assert order.status == OrderStatus.COMPLETE.value
+    assert Message.objects.count() == messages + 1
+
+    # изменённое тело не проходит проверку подписи
+    path, headers, body = completed
+    assert not CertificateVerifier().verify(headers['Paypal-Transmission-Id'], headers['Paypal-Transmission-Time'],
+                                            'WH-TEST', body + b' ', headers['Paypal-Cert-Url'],
+                                            headers['Paypal-Transmission-Sig'], headers['Paypal-Auth-Algo'])
+    # сертификат с другого адреса не загружается, даже если его выпустил УЦ симулятора
+    assert CertificateVerifier().certificate(headers['Paypal-Cert-Url'].replace('127.0.0.1', 'localhost')) is None
+    stats = simulator.stats()
+    assert (stats['paypal_orders'], stats['paypal_captures'], stats['pending']) == (1, 1, 0)
+    assert stats['order_to_notification_ms']['p50'] > 0
+
+
+@pytest.mark.django_db
+def test_stripe_session_to_notification(simulator: PaymentSimulator, recorder: Recorder) -> None:
+    order = new_order()
+    link = StripeClient().check_out(order.pk, order.product_id)
+    session_id = Checkout.objects.get(order=order).tracking_id
+    assert session_id.startswith('cs_test_') and link.endswith(session_id)
+    assert simulator.payment(session_id).data['amount_total'] == int(order.total.amount * 100)
+
+    assert simulator.approve(session_id) and not simulator.approve(session_id)
+    webhook = recorder.wait(1)[0]
+    assert post_webhook(webhook) == 200
+    order.refresh_from_db()
+    assert order.status == OrderStatus.COMPLETE.value
+
+    path, headers, body = webhook
+    assert post_webhook((path, headers, body.replace(b'"paid"', b'"unpaid"'))) == 400
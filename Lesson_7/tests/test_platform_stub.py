@@ -0,0 +1,95 @@
+import pytest
+
+import json
+from typing import Any, Dict, Iterator, List
+
+import requests
+
+from clients.delivery import DeliveryDispatcher, DeliveryTask
+from clients.exceptions import JivoServerError, OkServerError, PlatformUnavailableError
+from clients.jivosite.jivosite import JivositeClient
+from clients.ok.ok import OkClient
+from clients.transport import HttpTransport
+from patterns.singleton import Singleton
+from util.platform_stub import PlatformStub, StubConfig
+
+
+@pytest.fixture
+def stub(monkeypatch: Any) -> Iterator[PlatformStub]:
+    monkeypatch.delitem(Singleton._instances, HttpTransport, raising=False)
+    HttpTransport(connect_timeout=1, read_timeout=2)
+    stub = PlatformStub(config=StubConfig(seed=1)).start()
+    yield stub
+    stub.stop()
+    HttpTransport().close()
+
+
+def test_platform_responses_and_errors(stub: PlatformStub) -> None:
+    ok_link = stub.ok_link.format(chat_id='chat:stub', token='token')
+    jivo_link = stub.jivo_link.format(key='key', token='token')
+
+    OkClient()._post_to_platform(ok_link, '{"message": {"text": "привет"}}')
+    JivositeClient()._post_to_platform(jivo_link, '{"event": "BOT_MESSAGE"}')
+
+    stub.script('error', 'error', 'unavailable', 'throttled', 'reset')
+    with pytest.raises(OkServerError):
+        OkClient()._post_to_platform(ok_link, '{}')
+    with pytest.raises(JivoServerError):
+        JivositeClient()._post_to_platform(jivo_link, '{}')
+    for status in (503, 429):
+        with pytest.raises(PlatformUnavailableError) as error:
+            OkClient()._post_to_platform(ok_link, '{}')
+        assert error.value.status_code == status
+    with pytest.raises(requests.ConnectionError):
+        JivositeClient()._post_to_platform(jivo_link, '{}')
+
+    recorded = stub.requests()
+    assert [request.outcome for request in recorded] == ['ok', 'ok', 'error', 'error', 'unavailable', 'throttled',
+                                                         'reset']
+    assert recorded[0].body == {'message': {'text': 'привет'}} and recorded[0].query == {'access_token': ['token']}
+    assert stub.stats()['platforms'] == {'ok': {'ok': 1, 'error': 1, 'unavailable': 1, 'throttled': 1},
+                                         'jivo': {'ok': 1, 'error': 1, 'reset': 1}}
+
+    # записи доступны и другому процессу
+    assert len(requests.get(f'{stub.url}/_stub/requests?platform=jivo').json()) == 3
+    requests.post(f'{stub.url}/_stub/reset')
+    assert requests.get(f'{stub.url}/_stub/stats').json()['requests'] == 0
+
+
+def test_non_json_error_body(monkeypatch: Any) -> None:
+    def response(status: int, headers: Dict[str, str]) -> requests.Response:
+        r = requests.Response()
+        r.status_code = status
+        r.headers.update(headers)
+        r._content = b'<html>Bad Gateway</html>'
+        return r
+
+    monkeypatch.setattr(OkClient, '_post', lambda self, url, data: response(200, {'invocation-error': '102'}))
+    with pytest.raises(OkServerError, match='Bad Gateway'):
+        OkClient()._post_to_platform('http://ok', '{}')
+
+    monkeypatch.setattr(JivositeClient, '_post', lambda self, url, data: response(400, {}))
+    with pytest.raises(JivoServerError, match='Bad Gateway'):
+        JivositeClient()._post_to_platform('http://jivo', '{}')
+
+
+def test_dispatcher_retries_through_stub(stub: PlatformStub, monkeypatch: Any) -> None:
+    monkeypatch.delitem(Singleton._instances, DeliveryDispatcher, raising=False)
+    monkeypatch.setattr('clients.delivery.backoff_delay', lambda attempt: 0.01)
+    sent: List[str] = []
+    failed: List[str] = []
+    dispatcher = DeliveryDispatcher(workers=2, on_sent=lambda task: sent.append(task.key),
+                                    on_failed=lambda task: failed.append(task.key))
+    stub.config.rates = {'reset': 0.2, 'unavailable': 0.2}
+    link = stub.ok_link.format(chat_id='chat:stub', token='token')
+
+    for number in range(20):
+        data = json.dumps({'message': {'text': str(number)}})
+        dispatcher.submit(DeliveryTask(f'ok_{number}', lambda data=data: OkClient()._post_to_platform(link, data)))
+    assert dispatcher.join(timeout=10)
+
+    # временные ошибки повторяются, пока сообщение не будет принято
+    assert len(sent) == 20 and not failed
+    outcomes = stub.stats()['platforms']['ok']
+    assert outcomes['ok'] == 20
+    assert dispatcher.stats()['retried'] == outcomes.get('reset', 0) + outcomes.get('unavailable', 0)
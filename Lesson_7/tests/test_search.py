@@ -0,0 +1,91 @@
+import pytest
+
+from io import StringIO
+from typing import Any, List
+
+from django.core.management import call_command
+from django.core.management.sql import emit_post_migrate_signal
+from django.db import connection
+
+from bot.models import Bot, Message
+from bot.search import SQLITE_DROP_SQL, fts_query, search_messages
+from common.constants import BotType, ChatType, MessageContentType, MessageDirection
+
+
+INDEX_TRIGGERS = ['bot_message_fts_delete', 'bot_message_fts_insert', 'bot_message_fts_update']
+
+
+def index_triggers() -> List[str]:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'bot_message' "
+                       "ORDER BY name")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def store(bot_id: int, chat: str, text: str) -> Message:
+    return Message.objects.save_message(bot_id, chat, ChatType.PRIVATE, MessageDirection.RECEIVED,
+                                        MessageContentType.TEXT, f'user:{chat}', 'Tester', text, '')
+
+
+def test_fts_query_quotes_operator_input() -> None:
+    assert fts_query('видеокарта NEAR(gigabyte*') == '"видеокарта" "NEAR" "gigabyte"*'
+    assert fts_query(' * - ') is None
+
+
+@pytest.mark.django_db
+def test_search_is_ranked_and_follows_updates() -> None:
+    bot = Bot.objects.create(name='search', bot_type=BotType.TYPE_OK.value)
+    weak = store(bot.pk, 'chat:search1', 'Посмотрите видеокарту в каталоге, там много товаров и категорий')
+    strong = store(bot.pk, 'chat:search2', 'Видеокарта GIGABYTE, видеокарта MSI')
+    store(bot.pk, 'chat:search3', 'Процессоры')
+
+    # в общей базе тестов могут быть и другие сообщения о видеокартах
+    hits = [hit for hit in search_messages('видеокар', size=100)[0] if hit.message.bot_id == bot.pk]
+    assert [hit.message.pk for hit in hits] == [strong.pk, weak.pk]
+    assert '[Видеокарта]' in hits[0].snippet
+
+    # индекс обновляется триггерами, в том числе при update() и delete()
+    Message.objects.filter(pk=weak.pk).update(text='Материнские платы')
+    Message.objects.filter(pk=strong.pk).delete()
+    assert [hit.message.pk for hit in search_messages('видеокар', chat_id=strong.chat_id)[0]] == []
+    assert [hit.message.pk for hit in search_messages('материнск', chat_id=weak.chat_id)[0]] == [weak.pk]
+
+    call_command('rebuild_message_index', stdout=StringIO())
+    assert [hit.message.pk for hit in search_messages('материнск', chat_id=weak.chat_id)[0]] == [weak.pk]
+
+
+@pytest.mark.django_db
+def test_search_api_pages_results(admin_client: Any, client: Any) -> None:
+    bot = Bot.objects.create(name='search', bot_type=BotType.TYPE_OK.value)
+    for number in range(3):
+        store(bot.pk, f'chat:api{number}', f'Оперативная память Kingston {number}')
+
+    first = admin_client.get('/api/messages/search/?q=память kingston&limit=2').json()
+    second = admin_client.get(f'/api/messages/search/?q=память kingston&limit=2&page={first["next"]}').json()
+    assert len(first['results']) == 2 and second['next'] is None
+    assert len({entry['number'] for entry in first['results'] + second['results']}) == 3
+    assert admin_client.get('/chats/?q=kingston').context['found']
+    assert client.get('/api/messages/search/?q=kingston').status_code == 302
+    # поиск на странице чатов тоже только для персонала, сама страница открыта
+    assert client.get('/chats/?q=kingston').status_code == 302
+    assert client.get('/chats/').status_code == 200
+
+
+@pytest.mark.django_db
+def test_index_triggers_exist_after_migrations() -> None:
+    # тестовая база создана полным migrate, в том числе миграциями после 0006
+    assert index_triggers() == INDEX_TRIGGERS
+
+
+@pytest.mark.django_db
+def test_migrate_restores_dropped_index() -> None:
+    bot = Bot.objects.create(name='search', bot_type=BotType.TYPE_OK.value)
+    # так индекс выглядит после миграции, пересоздавшей таблицу bot_message
+    with connection.cursor() as cursor:
+        for statement in SQLITE_DROP_SQL:
+            cursor.execute(statement)
+    message = store(bot.pk, 'chat:search4', 'Блок питания Chieftec')
+
+    emit_post_migrate_signal(verbosity=0, interactive=False, db=connection.alias)
+    assert index_triggers() == INDEX_TRIGGERS
+    assert [hit.message.pk for hit in search_messages('chieftec')[0]] == [message.pk]
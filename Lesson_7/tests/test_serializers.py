@@ -0,0 +1,150 @@
+import pytest
+
+import json
+from typing import Any, Dict, List, Tuple
+
+from marshmallow import ValidationError
+
+from billing.paypal.paypal_entities import PaypalCheckout
+from billing.stripe.stripe_entities import StripeCheckout
+from billing.constants import (Currency, PaypalIntent, PaypalGoodsCategory, PaypalShippingPreference,
+                               PaypalUserAction, StripeCurrency, StripeMode, StripePaymentMethod)
+from clients.jivosite.jivo_entities import JivoEvent, JivoIncomingWebhook
+from clients.ok.ok_entities import OkIncomingWebhook, OkOutgoingMessage
+from common.entities import Callback, EventCommandReceived, EventCommandToSend
+from common.serializers import ENTITY_MODULES, SerializerRegistry
+from patterns.singleton import Singleton
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    lines = json.loads(f.readline())
+
+
+def dialog_cases() -> List[Tuple[type, Dict[str, Any]]]:
+    cases: List[Tuple[type, Dict[str, Any]]] = []
+    for key, value in lines.items():
+        clazz = EventCommandReceived if key.endswith('_input') else EventCommandToSend
+        data = json.loads(value)
+        cases.append((clazz, data))
+        if data['payload'].get('command'):
+            cases.append((Callback, json.loads(data['payload']['command'])))
+        for button in data.get('inline_buttons') or ():
+            cases.append((Callback, json.loads(button['action']['payload'])))
+    return cases
+
+
+corpus: List[Tuple[type, Dict[str, Any]]] = dialog_cases() + [
+    (OkIncomingWebhook, {
+        'webhookType': 'MESSAGE_CALLBACK',
+        'sender': {'user_id': 'user:1', 'name': 'Тест'},
+        'recipient': {'chat_id': 'chat:1'},
+        'timestamp': 1607880904000,
+        'mid': None,
+        'callbackId': 'cb:1',
+        'payload': '{"type": "category", "id": 5}',
+    }),
+    (OkIncomingWebhook, {
+        'webhookType': 'MESSAGE_CREATED',
+        'sender': {'user_id': 'user:1'},
+        'recipient': {'chat_id': 'chat:1'},
+        'timestamp': 1607880904000,
+        'mid': 'mid:1',
+        'callbackId': None,
+        'message': {'text': 'Привет', 'seq': 1},
+    }),
+    (OkOutgoingMessage, {
+        'recipient': {'chat_id': 'chat:1'},
+        'message': {
+            'text': 'Выберите категорию товара:',
+            'attachment': {'type': 'INLINE_KEYBOARD', 'payload': {'keyboard': {'buttons': [[
+                {'type': 'CALLBACK', 'text': 'Процессоры', 'intent': 'POSITIVE', 'payload': '{"id": 4}'},
+            ]]}}},
+        },
+    }),
+    (JivoIncomingWebhook, {
+        'id': 'e1',
+        'client_id': 'client:1',
+        'chat_id': '100',
+        'site_id': None,
+        'sender': {'id': 7, 'url': 'https://example.com/'},
+        'message': {'type': 'TEXT', 'text': 'Процессоры', 'timestamp': 1607880904},
+        'event': 'CLIENT_MESSAGE',
+    }),
+    (JivoEvent, {
+        'event': 'BOT_MESSAGE',
+        'id': '15',
+        'client_id': 'client:1',
+        'chat_id': None,
+        'message': {'type': 'BUTTONS', 'text': 'Меню', 'title': 'Меню', 'timestamp': 1607880904,
+                    'buttons': [{'text': 'Процессоры', 'id': 0}]},
+    }),
+    (StripeCheckout, {
+        'payment_method_types': [StripePaymentMethod.CARD.value],
+        'line_items': [{
+            'price_data': {'currency': StripeCurrency.RUB.value, 'unit_amount': 1000,
+                           'product_data': {'name': 'Товар', 'description': 'Описание'}},
+            'quantity': 1,
+        }],
+        'mode': StripeMode.PAYMENT,
+        'success_url': 'https://example.com/success',
+        'cancel_url': 'https://example.com/cancel',
+    }),
+    (PaypalCheckout, {
+        'intent': PaypalIntent.CAPTURE,
+        'purchase_units': [{
+            'reference_id': '1',
+            'description': 'Описание',
+            'amount': {'currency_code': Currency.RUB, 'value': '10.00',
+                       'breakdown': {'item_total': {'currency_code': Currency.RUB, 'value': '10.00'}}},
+            'items': [{'name': 'Товар', 'description': 'Описание', 'quantity': 1,
+                       'unit_amount': {'currency_code': Currency.RUB, 'value': '10.00'},
+                       'category': PaypalGoodsCategory.PHYSICAL_GOODS}],
+        }],
+        'application_context': {'shipping_preference': PaypalShippingPreference.GET_FROM_FILE,
+                                'user_action': PaypalUserAction.PAY_NOW},
+    }),
+]
+
+malformed: List[Tuple[type, Dict[str, Any]]] = [
+    (Callback, {'type': 'category'}),
+    (Callback, {'type': 'unknown', 'id': 1}),
+    (Callback, {'type': 'category', 'id': 'x'}),
+    (Callback, {'type': 'category', 'id': 1, 'extra': True}),
+    (OkIncomingWebhook, {'webhookType': 'MESSAGE_CREATED', 'sender': None, 'recipient': {'chat_id': 'c'},
+                         'timestamp': 1, 'mid': None, 'callbackId': None}),
+    (JivoEvent, {'event': 'BOT_MESSAGE', 'id': 1, 'client_id': 'c', 'chat_id': None, 'message': None}),
+]
+
+
+@pytest.fixture
+def fast(monkeypatch: Any) -> SerializerRegistry:
+    # отдельный экземпляр реестра с кодогенерацией на время теста
+    monkeypatch.delitem(Singleton._instances, SerializerRegistry, raising=False)
+    return SerializerRegistry(codegen=True)
+
+
+def test_codecs_cover_all_entities(fast: SerializerRegistry) -> None:
+    count = fast.warm_up(ENTITY_MODULES)
+    assert count == fast.stats()['codecs']
+
+
+@pytest.mark.parametrize(['clazz', 'data'], corpus)
+def test_codegen_matches_marshmallow(fast: SerializerRegistry, clazz: type, data: Dict[str, Any]) -> None:
+    schema = getattr(clazz, 'Schema')()
+    expected = schema.load(data)
+
+    loaded = fast.load(clazz, data)
+    assert fast.fallbacks == 0
+    assert loaded == expected
+    assert fast.dumps(loaded) == schema.dumps(expected)
+    assert fast.validate(loaded) == schema.validate(schema.dump(expected))
+
+
+@pytest.mark.parametrize(['clazz', 'data'], malformed)
+def test_codegen_errors_match_marshmallow(fast: SerializerRegistry, clazz: type, data: Dict[str, Any]) -> None:
+    with pytest.raises(ValidationError) as expected:
+        getattr(clazz, 'Schema')().load(data)
+    with pytest.raises(ValidationError) as result:
+        fast.load(clazz, data)
+    assert result.value.messages == expected.value.messages
+    assert fast.fallbacks == 1
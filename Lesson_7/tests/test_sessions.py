@@ -0,0 +1,112 @@
+import pytest
+
+import itertools
+import json
+from typing import Any, Dict
+
+from django.db import connection
+
+from bot.dialog import Dialog
+from bot.handlers import message_handler
+from bot.models import Bot, Chat, DialogSession, OutboxMessage
+from bot.registry import BotRegistry
+from bot.sessions import SessionData, SessionStore
+from common.constants import BotType, CallbackType, DialogStates
+from common.entities import Callback, EventCommandReceived
+from shop.catalog import Catalog
+from shop.models import Category, Order, Product
+
+
+with open('tests/dialog_content.json', 'r') as f:
+    template: Dict[str, Any] = json.loads(json.loads(f.readline())['product_input'])
+message_ids = itertools.count()
+
+
+def event(bot_id: int, callback_type: CallbackType, entity_id: int) -> EventCommandReceived:
+    data = dict(template, bot_id=bot_id, chat_id_in_messenger='chat:session',
+                message_id_in_messenger=f'mid:session.{next(message_ids)}')
+    data['payload'] = dict(template['payload'], command=Callback.Schema().dumps(Callback(callback_type, entity_id)))
+    return EventCommandReceived.Schema().load(data)
+
+
+class FakePaymentClient:
+    def check_out(self, order_id: int, product_id: int) -> str:
+        return f'https://pay.example.com/{order_id}'
+
+
+@pytest.mark.django_db
+def test_dialog_session_survives_restart(django_assert_num_queries: Any, monkeypatch: Any) -> None:
+    bot = Bot.objects.create(name='sessions', bot_type=BotType.TYPE_OK.value)
+    BotRegistry().load()
+    category = Category.objects.create(name='category')
+    product = Product.objects.create(name='product', price=100)
+    product.categories.add(category)
+    Catalog().get()
+
+    message_handler(event(bot.pk, CallbackType.CATEGORY, category.pk))
+    message_handler(event(bot.pk, CallbackType.ORDER, product.pk))
+    row = DialogSession.objects.get()
+    assert row.state == DialogStates.ORDER.value
+    assert (row.category_id, row.product_id, row.order_id) == (category.pk, product.pk, None)
+
+    # перезапуск процесса: горячий слой пуст, сессия читается из БД одним запросом
+    SessionStore().clear()
+    with django_assert_num_queries(1):
+        session = SessionStore().load(bot.pk, 'chat:session')
+    assert session.chat_id == row.chat_id and session.state == DialogStates.ORDER
+
+    # чат берётся из сессии, цена - из строки товара, даже если снимок каталога ещё не перестроен
+    Product.objects.filter(pk=product.pk).update(price=120)
+    monkeypatch.setattr('bot.dialog.PaymentClientFactory.create', lambda payment_type: FakePaymentClient())
+    with django_assert_num_queries(2):
+        result = Dialog().reply(event(bot.pk, CallbackType.STRIPE, product.pk), session)
+    order = Order.objects.get(chat_id=row.chat_id)
+    assert order.total.amount == 120
+    assert result is not None and result.payload.text.find(f'/{order.pk}') >= 0
+    assert session.state == DialogStates.STRIPE and session.order_id == order.pk
+
+
+@pytest.mark.django_db
+def test_order_requires_stored_chat(dialog_data: None, monkeypatch: Any) -> None:
+    bot = Bot.objects.create(name='sessions', bot_type=BotType.TYPE_OK.value)
+    BotRegistry().load()
+    product = Product.objects.filter(is_active=True).first()
+    monkeypatch.setattr('bot.dialog.PaymentClientFactory.create', lambda payment_type: FakePaymentClient())
+
+    with pytest.raises(Chat.DoesNotExist):
+        Dialog().reply(event(bot.pk, CallbackType.PAYPAL, product.pk), SessionData())
+    assert not Order.objects.filter(chat__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_expired_sessions_are_ignored_and_purged() -> None:
+    bot = Bot.objects.create(name='sessions', bot_type=BotType.TYPE_OK.value)
+    BotRegistry().load()
+    message_handler(event(bot.pk, CallbackType.GREETING, 0))
+    chat_id = DialogSession.objects.get().chat_id
+
+    DialogSession.objects.store(chat_id, -1, state=DialogStates.CATEGORY.value)
+    assert DialogSession.objects.get_active(bot.pk, 'chat:session') is None
+    assert DialogSession.objects.delete_expired() == 1
+
+
+@pytest.mark.django_db
+def test_checkout_runs_outside_handler_transaction(monkeypatch: Any) -> None:
+    bot = Bot.objects.create(name='sessions', bot_type=BotType.TYPE_OK.value)
+    BotRegistry().load()
+    product = Product.objects.create(name='product', price=100)
+    message_handler(event(bot.pk, CallbackType.ORDER, product.pk))
+    # тест сам выполняется в транзакции: считаются только точки сохранения, открытые обработчиком
+    depth = len(connection.savepoint_ids)
+    depths = []
+
+    class RecordingPaymentClient(FakePaymentClient):
+        def check_out(self, order_id: int, product_id: int) -> str:
+            depths.append(len(connection.savepoint_ids))
+            return super().check_out(order_id, product_id)
+
+    monkeypatch.setattr('bot.dialog.PaymentClientFactory.create', lambda payment_type: RecordingPaymentClient())
+    message_handler(event(bot.pk, CallbackType.PAYPAL, product.pk))
+    assert depths == [depth]
+    order = Order.objects.get(chat__bot=bot)
+    assert OutboxMessage.objects.filter(bot=bot, payload__contains=f'/{order.pk}').exists()
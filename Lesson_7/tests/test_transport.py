@@ -0,0 +1,67 @@
+import pytest
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+import requests
+
+from clients.ok.ok import OkClient
+from clients.transport import HttpTransport
+from patterns.singleton import Singleton
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers['Content-Length']))
+        if self.path == '/slow':
+            threading.Event().wait(0.5)
+        body = b'{}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except BrokenPipeError:
+            # клиент уже закрыл соединение по таймауту
+            pass
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def server() -> Iterator[str]:
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def transport(monkeypatch: Any) -> Iterator[HttpTransport]:
+    monkeypatch.delitem(Singleton._instances, HttpTransport, raising=False)
+    transport = HttpTransport(connect_timeout=1, read_timeout=0.2)
+    yield transport
+    transport.close()
+
+
+def test_connections_are_reused(transport: HttpTransport, server: str) -> None:
+    client = OkClient()
+    for _ in range(3):
+        assert client._post(f'{server}/send', '{}').status_code == 200
+
+    stats = transport.stats()['hosts'][server]
+    assert stats['requests'] == 3
+    assert stats['connections'] == 1
+    assert stats['reused'] == 2
+
+
+def test_read_timeout(transport: HttpTransport, server: str) -> None:
+    with pytest.raises(requests.Timeout):
+        transport.post(f'{server}/slow', data='{}')
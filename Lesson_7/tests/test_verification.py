@@ -0,0 +1,72 @@
+import pytest
+
+from typing import Any
+
+from django.http import HttpRequest, HttpResponse
+from django.test import Client
+
+from billing.paypal.signature import cert_url_allowed
+from common.allowlist import IpAllowlist, client_ip
+from common.middleware import WebhookVerifier
+
+
+def test_allowlist_merges_networks_and_checks_bounds() -> None:
+    allowlist = IpAllowlist.parse('217.20.145.192/28, 217.20.145.208/28, 10.0.0.1, 2001:db8::/32')
+
+    assert len(allowlist) == 3
+    assert '217.20.145.192' in allowlist and '217.20.145.223' in allowlist
+    assert '217.20.145.191' not in allowlist and '217.20.145.224' not in allowlist
+    assert '10.0.0.1' in allowlist and '10.0.0.2' not in allowlist
+    assert '2001:db8::1' in allowlist and '::ffff:10.0.0.1' in allowlist
+    assert 'not an address' not in allowlist and None not in allowlist
+
+
+@pytest.mark.django_db
+def test_ok_webhook_from_unknown_address_is_rejected_before_parsing(monkeypatch: Any) -> None:
+    def ingest(request: HttpRequest, bot_type: int, platform: str) -> HttpResponse:
+        return HttpResponse('OK')
+
+    monkeypatch.setattr('bot.views._ingest_webhook', ingest)
+    rejected = WebhookVerifier().stats()['ok']['rejected']
+
+    # тело не разбирается: некорректный JSON не приводит к ошибке
+    response = Client().post('/ok_webhook/', 'not json', content_type='application/json',
+                             HTTP_X_FORWARDED_FOR='8.8.8.8')
+    assert response.status_code == 403
+    assert Client().post('/ok_webhook/', '{}', content_type='application/json').status_code == 403
+
+    # адрес OK в начале X-Forwarded-For задаёт сам клиент, без доверенных прокси заголовок не учитывается
+    response = Client().post('/ok_webhook/', '{}', content_type='application/json',
+                             HTTP_X_FORWARDED_FOR='217.20.151.161')
+    assert response.status_code == 403
+    response = Client().post('/ok_webhook/', '{}', content_type='application/json', REMOTE_ADDR='217.20.151.161')
+    assert response.status_code == 200
+    assert WebhookVerifier().stats()['ok']['rejected'] == rejected + 3
+
+
+def test_client_ip_counts_trusted_proxies_from_the_right() -> None:
+    request = HttpRequest()
+    request.META = {'REMOTE_ADDR': '10.0.0.2', 'HTTP_X_FORWARDED_FOR': '217.20.151.161, 8.8.8.8, 10.0.0.1'}
+
+    assert client_ip(request, trusted_proxies=0) == '10.0.0.2'
+    assert client_ip(request, trusted_proxies=1) == '10.0.0.1'
+    assert client_ip(request, trusted_proxies=2) == '8.8.8.8'
+    assert client_ip(request, trusted_proxies=4) is None
+
+
+def test_payment_webhook_without_signature_is_rejected() -> None:
+    response = Client().post('/billing/stripe_webhook/', 'not json', content_type='application/json')
+    assert response.status_code == 403
+
+
+def test_paypal_cert_url_must_come_from_paypal_or_simulator() -> None:
+    assert cert_url_allowed('https://api.paypal.com/v1/notifications/certs/CERT-1')
+    assert cert_url_allowed('https://api.sandbox.paypal.com/v1/notifications/certs/CERT-1')
+    for url in ('http://api.paypal.com/v1/notifications/certs/CERT-1', 'https://api.paypal.com:8443/certs',
+                'https://paypal.com.example.org/certs', 'https://api.paypal.com@example.org/certs',
+                'http://169.254.169.254/latest/meta-data/', 'file:///etc/passwd'):
+        assert not cert_url_allowed(url)
+    # с симулятором сертификат загружается только с его адреса
+    assert cert_url_allowed('http://127.0.0.1:8901/v1/notifications/certs/CERT-1', 'http://127.0.0.1:8901')
+    assert not cert_url_allowed('http://127.0.0.1:8902/v1/notifications/certs/CERT-1', 'http://127.0.0.1:8901')
+    assert not cert_url_allowed('https://api.paypal.com/v1/notifications/certs/CERT-1', 'http://127.0.0.1:8901')
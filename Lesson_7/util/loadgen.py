@@ -0,0 +1,428 @@
+"""Генератор нагрузки вебхуками OK и Jivo для локального сервера бота.
+
+Каждый синтетический чат проходит настоящий путь диалога: текстовое сообщение, кнопка начала сессии,
+категория (с переходом в подкатегории), товар, заказ и, с --payments, выбор платёжной системы. Категории
+и товары берутся из снимка каталога той же БД, с которой работает сервер. OK получает вебхуки
+MESSAGE_CREATED и MESSAGE_CALLBACK с командой кнопки, Jivo - CLIENT_MESSAGE с текстом кнопки.
+
+Режимы:
+- замкнутый цикл (по умолчанию): --concurrency потоков по очереди продвигают --chats чатов,
+  следующий вебхук уходит через --think-time после ответа на предыдущий, --rate ограничивает общую частоту;
+- открытый цикл (--open-loop): вебхуки отправляются по расписанию с частотой --rate независимо от ответов,
+  задержка считается от запланированного времени, поэтому очередь перед сервером в неё входит.
+
+В конце выводятся пропускная способность, доля ошибок и гистограмма задержек.
+
+Сервер должен принимать вебхуки с локального адреса: OK_IP_POOL=127.0.0.1/32, JIVO_IP_POOL пуст.
+Ответы бота отправляются в платформы потоком OutboxMessage - для прогона без сети запустите сервер
+с BOT_OUTBOX_DRAINER=0 или с заглушками API платформ. Команды кнопок Jivo запоминаются при сохранении ответа
+процессом, принявшим вебхук, поэтому диалоги Jivo проходят дальше приветствия и без отправки ответов;
+с несколькими воркерами сервера нужен JIVO_COMMAND_BACKEND=sqlite.
+
+usage: python util/loadgen.py --url http://127.0.0.1:8000 --chats 100 --duration 60 [--rate 200] [--open-loop]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import requests
+
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OK_PATH = '/ok_webhook/'
+JIVO_PATH = '/jivo_webhook/test'
+# верхние границы корзин гистограммы задержек, мс
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, math.inf)
+GREETING_TEXTS = ('Привет', 'Здравствуйте', 'Добрый день', 'Что есть в магазине?')
+
+
+@dataclass(frozen=True)
+class Step:
+    """Шаг диалога: тип, команда кнопки (None для текстового сообщения) и текст сообщения или кнопки."""
+
+    kind: str
+    command: Optional[str]
+    text: str
+
+
+@dataclass(frozen=True)
+class CatalogPaths:
+    """Дерево каталога, по которому чаты выбирают путь диалога."""
+
+    root_ids: Tuple[int, ...]
+    children: Dict[int, Tuple[int, ...]]
+    products: Dict[int, Tuple[int, ...]]
+    names: Dict[Tuple[str, int], str]
+    buttons: Dict[str, str]
+
+
+def load_catalog() -> CatalogPaths:
+    """Читает снимок каталога из БД проекта.
+
+    Django настраивается без фоновых задач: этот процесс не должен отправлять сообщения из OutboxMessage."""
+
+    sys.path.insert(0, PROJECT_DIR)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecom_chatbot.settings')
+    os.environ['BOT_OUTBOX_DRAINER'] = '0'
+    import django
+    django.setup()
+    from shop.catalog import Catalog
+
+    return catalog_paths(Catalog().get())
+
+
+def catalog_paths(snapshot: Any) -> CatalogPaths:
+    """Собирает из снимка каталога (CatalogSnapshot) дерево для путей диалога и тексты кнопок."""
+
+    from common.strings import DialogButtons
+
+    names = {('category', category.id): category.name for category in snapshot.categories.values()}
+    names.update({('product', product.id): product.name for product in snapshot.products.values()})
+    return CatalogPaths(
+        root_ids=snapshot.root_ids,
+        children={category.id: category.child_ids for category in snapshot.categories.values()},
+        products={category.id: category.product_ids for category in snapshot.categories.values()},
+        names=names,
+        buttons={button.name: str(button.value) for button in DialogButtons},
+    )
+
+
+def callback(callback_type: str, entity_id: int) -> str:
+    """Команда кнопки в том виде, в котором её сериализует Callback.Schema."""
+
+    return json.dumps({'type': callback_type, 'id': entity_id})
+
+
+def leading_to_products(catalog: CatalogPaths, category_ids: Tuple[int, ...]) -> List[int]:
+    """Категории, из которых по первым десяти кнопкам подкатегорий можно дойти до товара."""
+
+    return [
+        category_id for category_id in category_ids
+        if catalog.products[category_id] or leading_to_products(catalog, catalog.children[category_id][:10])
+    ]
+
+
+def dialog_path(catalog: CatalogPaths, rng: random.Random, payments: bool) -> Iterator[Step]:
+    """Бесконечная последовательность шагов одного чата: путь от приветствия до заказа, затем снова."""
+
+    while True:
+        yield Step('text', None, rng.choice(GREETING_TEXTS))
+        yield Step('greeting', callback('greeting', 0), catalog.buttons['START_SESSION'])
+        # бот показывает не больше 10 кнопок, выбор идёт среди них по категориям, в которых есть товары
+        options = leading_to_products(catalog, catalog.root_ids[:10])
+        if not options:
+            continue
+        category_id = rng.choice(options)
+        yield Step('category', callback('category', category_id), catalog.names[('category', category_id)])
+        # категория без собственных товаров предлагает подкатегории
+        while not catalog.products[category_id]:
+            category_id = rng.choice(leading_to_products(catalog, catalog.children[category_id][:10]))
+            yield Step('category', callback('category', category_id), catalog.names[('category', category_id)])
+        product_id = rng.choice(catalog.products[category_id][:10])
+        yield Step('product', callback('product', product_id), catalog.names[('product', product_id)])
+        yield Step('order', callback('order', product_id), catalog.buttons['ORDER_PRODUCT'])
+        if payments:
+            option = rng.choice(('paypal', 'stripe'))
+            yield Step('payment', callback(option, product_id), catalog.buttons[f'{option.upper()}_OPTION'])
+
+
+def ok_payload(chat: int, number: int, step: Step) -> Dict[str, Any]:
+    """Вебхук OkIncomingWebhook: сообщение пользователя или нажатие кнопки."""
+
+    data: Dict[str, Any] = {
+        'sender': {'user_id': f'user:load{chat}', 'name': f'Load {chat}'},
+        'recipient': {'chat_id': f'chat:load{chat}'},
+        'timestamp': int(time.time() * 1000),
+        'mid': None,
+        'callbackId': None,
+    }
+    if step.command is None:
+        data['webhookType'] = 'MESSAGE_CREATED'
+        data['mid'] = f'mid:load{chat}.{number}'
+        data['message'] = {'text': step.text, 'seq': number}
+    else:
+        data['webhookType'] = 'MESSAGE_CALLBACK'
+        data['callbackId'] = f'cb:load{chat}.{number}'
+        data['payload'] = step.command
+    return data
+
+
+def jivo_payload(chat: int, number: int, step: Step) -> Dict[str, Any]:
+    """Вебхук JivoIncomingWebhook: Jivo присылает нажатие кнопки как сообщение с её текстом."""
+
+    return {
+        'id': f'load{chat}.{number}',
+        'client_id': f'client:load{chat}',
+        'chat_id': f'load{chat}',
+        'site_id': None,
+        'sender': {'id': chat, 'url': 'http://localhost/'},
+        'message': {'type': 'TEXT', 'text': step.text, 'timestamp': int(time.time())},
+        'event': 'CLIENT_MESSAGE',
+    }
+
+
+class SyntheticChat:
+    """Синтетический чат одной платформы со своим путём диалога и счётчиком сообщений."""
+
+    def __init__(self, number: int, platform: str, catalog: CatalogPaths, seed: int, payments: bool) -> None:
+        self.number = number
+        self.platform = platform
+        self._steps = dialog_path(catalog, random.Random(seed + number), payments)
+        self._messages = itertools.count()
+
+    def next_request(self) -> Tuple[str, str, bytes]:
+        """Возвращает (путь, тип шага, тело) следующего вебхука чата."""
+
+        step = next(self._steps)
+        number = next(self._messages)
+        if self.platform == 'ok':
+            body = ok_payload(self.number, number, step)
+            path = OK_PATH
+        else:
+            body = jivo_payload(self.number, number, step)
+            path = JIVO_PATH
+        return path, step.kind, json.dumps(body, ensure_ascii=False).encode('utf-8')
+
+
+@dataclass
+class LoadStats:
+    """Результаты прогона: задержки (мс), ответы по кодам и ошибки соединения."""
+
+    latencies: 'array[float]' = field(default_factory=lambda: array('d'))
+    statuses: 'Counter[int]' = field(default_factory=Counter)
+    kinds: 'Counter[str]' = field(default_factory=Counter)
+    failures: 'Counter[str]' = field(default_factory=Counter)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record(self, key: str, status: Optional[int], latency: float, error: Optional[str] = None) -> None:
+        with self.lock:
+            self.latencies.append(latency)
+            self.kinds[key] += 1
+            if status is not None:
+                self.statuses[status] += 1
+            if error is not None or status is None or status >= 400:
+                self.failures[error or str(status)] += 1
+
+    @property
+    def total(self) -> int:
+        return len(self.latencies)
+
+    def percentile(self, fraction: float) -> float:
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))] if ordered else 0.0
+
+    def histogram(self) -> List[Tuple[float, int]]:
+        counts = Counter(next(bound for bound in BUCKETS if latency <= bound) for latency in self.latencies)
+        return [(bound, counts[bound]) for bound in BUCKETS]
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        errors = sum(self.failures.values())
+        return {
+            'requests': self.total,
+            'elapsed_s': round(elapsed, 2),
+            'throughput_rps': round(self.total / elapsed, 1) if elapsed else 0.0,
+            'error_rate': round(errors / self.total, 4) if self.total else 0.0,
+            'statuses': dict(self.statuses),
+            'failures': dict(self.failures),
+            'kinds': dict(self.kinds),
+            'latency_ms': {
+                'p50': round(self.percentile(0.5), 2),
+                'p90': round(self.percentile(0.9), 2),
+                'p99': round(self.percentile(0.99), 2),
+                'max': round(max(self.latencies, default=0.0), 2),
+            },
+            'histogram_ms': [[None if math.isinf(bound) else bound, count] for bound, count in self.histogram()],
+        }
+
+
+class LoadGenerator:
+    """Отправляет вебхуки чатов на сервер в замкнутом или открытом цикле."""
+
+    def __init__(self, url: str, chats: List[SyntheticChat], concurrency: int,
+                 rate: Optional[float], timeout: float, think_time: float = 0.0) -> None:
+        self.url = url.rstrip('/')
+        self.think_time = think_time
+        self.chats = chats
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.stats = LoadStats()
+        self._local = threading.local()
+        self._pace_lock = threading.Lock()
+        self._next_send = 0.0
+
+    def _session(self) -> requests.Session:
+        # соединение на поток переиспользуется между запросами (keep-alive)
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+            self._local.session.headers['Content-Type'] = 'application/json'
+        session: requests.Session = self._local.session
+        return session
+
+    def _send(self, chat: SyntheticChat, started: float) -> None:
+        path, kind, body = chat.next_request()
+        key = f'{chat.platform}:{kind}'
+        try:
+            response = self._session().post(self.url + path, data=body, timeout=self.timeout)
+            self.stats.record(key, response.status_code, (time.monotonic() - started) * 1000)
+        except requests.RequestException as e:
+            self.stats.record(key, None, (time.monotonic() - started) * 1000, type(e).__name__)
+
+    def _pace(self) -> None:
+        if not self.rate:
+            return
+        with self._pace_lock:
+            now = time.monotonic()
+            self._next_send = max(self._next_send + 1 / self.rate, now)
+            delay = self._next_send - now
+        if delay > 0:
+            time.sleep(delay)
+
+    def run_closed(self, deadline: float, limit: Optional[int]) -> None:
+        """Замкнутый цикл: чат получает следующий вебхук через think_time после ответа на предыдущий."""
+
+        ready: 'queue.Queue[Tuple[SyntheticChat, float]]' = queue.Queue()
+        for chat in self.chats:
+            ready.put((chat, 0.0))
+        sent = itertools.count(1)
+
+        def worker() -> None:
+            while time.monotonic() < deadline:
+                try:
+                    chat, not_before = ready.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                pause = not_before - time.monotonic()
+                if pause > 0:
+                    time.sleep(pause)
+                if limit is not None and next(sent) > limit:
+                    return
+                self._pace()
+                self._send(chat, time.monotonic())
+                ready.put((chat, time.monotonic() + self.think_time))
+
+        self._run_workers(worker)
+
+    def run_open(self, deadline: float, limit: Optional[int], poisson: bool, seed: int) -> None:
+        """Открытый цикл: вебхуки планируются с частотой rate, задержка считается от запланированного времени."""
+
+        assert self.rate, 'open loop requires --rate'
+        arrivals: 'queue.Queue[Optional[Tuple[SyntheticChat, float]]]' = queue.Queue()
+
+        def worker() -> None:
+            while True:
+                item = arrivals.get()
+                if item is None:
+                    return
+                chat, scheduled = item
+                self._send(chat, scheduled)
+
+        threads = self._start_workers(worker)
+        rng = random.Random(seed)
+        scheduled = time.monotonic()
+        for number, chat in enumerate(itertools.cycle(self.chats)):
+            if scheduled >= deadline or (limit is not None and number >= limit):
+                break
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            arrivals.put((chat, scheduled))
+            scheduled += rng.expovariate(self.rate) if poisson else 1 / self.rate
+        for _ in threads:
+            arrivals.put(None)
+        for thread in threads:
+            thread.join()
+
+    def _start_workers(self, target: Any) -> List[threading.Thread]:
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _run_workers(self, target: Any) -> None:
+        for thread in self._start_workers(target):
+            thread.join()
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f'Requests: {report["requests"]} in {report["elapsed_s"]} s, throughput {report["throughput_rps"]} rps')
+    print(f'Error rate: {report["error_rate"]:.2%}  statuses: {report["statuses"]}  failures: {report["failures"]}')
+    print('By step: ' + ', '.join(f'{key} {count}' for key, count in sorted(report['kinds'].items())))
+    latency = report['latency_ms']
+    print(f'Latency, ms: p50 {latency["p50"]}  p90 {latency["p90"]}  p99 {latency["p99"]}  max {latency["max"]}')
+    peak = max((count for _, count in report['histogram_ms']), default=0) or 1
+    for bound, count in report['histogram_ms']:
+        label = f'<= {bound} ms' if bound is not None else '> 10000 ms'
+        print(f'{label:>12} {count:>8} {"#" * round(40 * count / peak)}')
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Генератор нагрузки вебхуками OK и Jivo')
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес сервера бота')
+    parser.add_argument('--platform', choices=('ok', 'jivo', 'mixed'), default='mixed')
+    parser.add_argument('--jivo-share', type=float, default=0.5, help='Доля чатов Jivo в режиме mixed')
+    parser.add_argument('--chats', type=int, default=50, help='Количество одновременных чатов')
+    parser.add_argument('--concurrency', type=int, default=0,
+                        help='Количество потоков отправки (по умолчанию min(чаты, 64))')
+    parser.add_argument('--rate', type=float, default=0, help='Целевая частота, вебхуков в секунду')
+    parser.add_argument('--think-time', type=float, default=0,
+                        help='Пауза чата перед следующим вебхуком в замкнутом цикле, секунды')
+    parser.add_argument('--open-loop', action='store_true', help='Отправлять по расписанию, не дожидаясь ответов')
+    parser.add_argument('--poisson', action='store_true', help='Интервалы открытого цикла по Пуассону')
+    parser.add_argument('--duration', type=float, default=30, help='Длительность прогона, секунды')
+    parser.add_argument('--requests', type=int, default=None, help='Остановиться после указанного числа вебхуков')
+    parser.add_argument('--payments', action='store_true',
+                        help='Доходить до выбора платёжной системы (сервер обращается к PayPal/Stripe)')
+    parser.add_argument('--timeout', type=float, default=10, help='Таймаут запроса, секунды')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='Файл для результатов в JSON')
+    args = parser.parse_args(argv)
+    if args.open_loop and not args.rate:
+        parser.error('--open-loop requires --rate')
+    return args
+
+
+def make_chats(args: argparse.Namespace, catalog: CatalogPaths) -> List[SyntheticChat]:
+    rng = random.Random(args.seed)
+    chats = []
+    for number in range(args.chats):
+        platform = args.platform
+        if platform == 'mixed':
+            platform = 'jivo' if rng.random() < args.jivo_share else 'ok'
+        chats.append(SyntheticChat(number, platform, catalog, args.seed, args.payments))
+    return chats
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    catalog = load_catalog()
+    generator = LoadGenerator(args.url, make_chats(args, catalog), args.concurrency or min(args.chats, 64),
+                              args.rate or None, args.timeout, args.think_time)
+    started = time.monotonic()
+    deadline = started + args.duration
+    if args.open_loop:
+        generator.run_open(deadline, args.requests, args.poisson, args.seed)
+    else:
+        generator.run_closed(deadline, args.requests)
+    report = generator.stats.report(time.monotonic() - started)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(report, output, indent=2)
+    return report
+
+
+if __name__ == '__main__':
+    main()
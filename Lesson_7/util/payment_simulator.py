@@ -0,0 +1,578 @@
+"""Локальный симулятор АПИ PayPal Orders/Capture и Stripe Checkout Session.
+
+Отвечает на запросы клиентов PaypalClient и StripeClient так же, как платёжные системы, и от имени
+покупателя оплачивает созданные заказы, отправляя подписанные вебхуки на billing/pp_webhook/
+и billing/stripe_webhook/:
+- PayPal: POST /v1/oauth2/token, POST /v2/checkout/orders, GET /v2/checkout/orders/{id},
+  POST /v2/checkout/orders/{id}/capture. Через --approve-after секунд после создания заказа приходит
+  вебхук CHECKOUT.ORDER.APPROVED, после захвата средств - PAYMENT.CAPTURE.COMPLETED. Вебхуки подписаны
+  сертификатом, который выпускает УЦ симулятора; сертификат УЦ записывается в --ca-file.
+- Stripe: POST /v1/checkout/sessions. Через --approve-after секунд приходит вебхук checkout.session.completed
+  с заголовком Stripe-Signature, подписанным STRIPE_WHSEC_KEY.
+
+С --approve-after 0 заказы оплачиваются только запросом POST /_sim/approve/{id}. Неуспешная доставка вебхука
+повторяется, как это делают платёжные системы. GET /_sim/stats возвращает счётчики, задержки доставки вебхуков
+и время от создания заказа до принятого сервером вебхука об оплате.
+
+Сервер направляется на симулятор переменными окружения (симулятор печатает их при запуске):
+PAYPAL_API_URL=http://127.0.0.1:8901 PAYPAL_CERT_CA_FILE=/tmp/payment_simulator_ca.pem PAYPAL_WEBHOOK_SIMULATOR=1
+STRIPE_API_BASE=http://127.0.0.1:8901 и те же PAYPAL_WEBHOOK_ID и STRIPE_WHSEC_KEY, что у симулятора.
+
+usage: python util/payment_simulator.py --site http://127.0.0.1:8000 [--port 8901] [--latency 0.2] [--approve-after 1]
+"""
+
+import argparse
+import base64
+import binascii
+import hashlib
+import heapq
+import hmac
+import itertools
+import json
+import math
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import requests
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.x509.oid import NameOID
+
+
+PAYPAL_WEBHOOK_PATH = '/billing/pp_webhook/'
+STRIPE_WEBHOOK_PATH = '/billing/stripe_webhook/'
+CERT_PATH = '/v1/notifications/certs/CERT-360caa42-fca2a594-simulator'
+ORDER_PATH = re.compile(r'^/v2/checkout/orders/(?P<id>[A-Z0-9]+)(?P<capture>/capture)?$')
+APPROVE_PATH = re.compile(r'^/_sim/approve/(?P<id>[\w-]+)$')
+ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    return {
+        f'p{int(fraction * 100)}': round(ordered[min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1)], 2)
+        for fraction in (0.5, 0.9, 0.99)
+    }
+
+
+class PaypalSigner:
+    """УЦ и сертификат симулятора, которыми подписываются вебхуки PayPal."""
+
+    def __init__(self, webhook_id: str) -> None:
+        self.webhook_id = webhook_id
+        start = datetime.utcnow() - timedelta(days=1)
+        ca_key = rsa.generate_private_key(65537, 2048, default_backend())
+        ca_name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'Payment simulator CA')])
+        self.ca = (x509.CertificateBuilder()
+                   .subject_name(ca_name).issuer_name(ca_name).public_key(ca_key.public_key())
+                   .serial_number(x509.random_serial_number())
+                   .not_valid_before(start).not_valid_after(start + timedelta(days=365))
+                   .add_extension(x509.BasicConstraints(ca=True, path_length=0), critical=True)
+                   .sign(ca_key, hashes.SHA256(), default_backend()))
+        self._key = rsa.generate_private_key(65537, 2048, default_backend())
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'messageverificationcerts.sandbox.paypal.com')])
+        self.certificate = (x509.CertificateBuilder()
+                            .subject_name(name).issuer_name(ca_name).public_key(self._key.public_key())
+                            .serial_number(x509.random_serial_number())
+                            .not_valid_before(start).not_valid_after(start + timedelta(days=365))
+                            .sign(ca_key, hashes.SHA256(), default_backend()))
+
+    def pem(self, certificate: x509.Certificate) -> bytes:
+        return certificate.public_bytes(serialization.Encoding.PEM)
+
+    def headers(self, body: bytes, cert_url: str) -> Dict[str, str]:
+        """Заголовки подписи: RSA-SHA256 строки transmission_id|time|webhook_id|crc32(тела)."""
+
+        transmission_id = str(uuid.uuid4())
+        timestamp = now_iso()
+        message = f'{transmission_id}|{timestamp}|{self.webhook_id}|{binascii.crc32(body) & 0xffffffff}'
+        signature = self._key.sign(message.encode('utf-8'), padding.PKCS1v15(), hashes.SHA256())
+        return {
+            'Paypal-Transmission-Id': transmission_id,
+            'Paypal-Transmission-Time': timestamp,
+            'Paypal-Transmission-Sig': base64.b64encode(signature).decode('ascii'),
+            'Paypal-Cert-Url': cert_url,
+            'Paypal-Auth-Algo': 'SHA256withRSA',
+        }
+
+
+def stripe_signature(body: bytes, secret: str) -> str:
+    """Заголовок Stripe-Signature: HMAC-SHA256 строки "время.тело" секретом вебхука."""
+
+    timestamp = int(time.time())
+    signed = hmac.new(secret.encode('utf-8'), f'{timestamp}.'.encode('utf-8') + body, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signed}'
+
+
+@dataclass
+class SimulatorConfig:
+    """Поведение симулятора.
+
+    latency и jitter - задержка ответа АПИ (секунды), error_rate - доля ответов HTTP 500,
+    approve_after - через сколько секунд покупатель оплачивает заказ (0 - только по /_sim/approve),
+    capture_after - задержка вебхука о захвате средств PayPal после запроса capture."""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    approve_after: float = 0.5
+    capture_after: float = 0.1
+    paypal_webhook_id: str = ''
+    stripe_secret: str = ''
+    webhook_retries: int = 3
+    webhook_workers: int = 8
+    webhook_timeout: float = 10.0
+    seed: Optional[int] = None
+
+
+@dataclass
+class Payment:
+    """Заказ PayPal или сессия Stripe и отметки времени его оплаты."""
+
+    id: str
+    system: str
+    data: Dict[str, Any]
+    created_at: float = field(default_factory=time.monotonic)
+    status: str = 'CREATED'
+    capture_id: Optional[str] = None
+    notified_at: Optional[float] = None
+
+
+class Scheduler:
+    """Отложенные вызовы: куча по времени запуска и ограниченный пул потоков."""
+
+    def __init__(self, workers: int) -> None:
+        self._delayed: List[Tuple[float, int, Callable[[], None]]] = []
+        self._ready: 'queue.Queue[Callable[[], None]]' = queue.Queue()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        threading.Thread(target=self._timer, name='simulator-timer', daemon=True).start()
+        for number in range(max(workers, 1)):
+            threading.Thread(target=self._work, name=f'simulator-{number}', daemon=True).start()
+
+    def call_later(self, delay: float, call: Callable[[], None]) -> None:
+        with self._condition:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), call))
+            self._condition.notify()
+
+    def _timer(self) -> None:
+        while True:
+            with self._condition:
+                while not self._delayed or self._delayed[0][0] > time.monotonic():
+                    timeout = self._delayed[0][0] - time.monotonic() if self._delayed else None
+                    self._condition.wait(timeout)
+                _, _, call = heapq.heappop(self._delayed)
+            self._ready.put(call)
+
+    def _work(self) -> None:
+        while True:
+            self._ready.get()()
+
+
+class PaymentSimulator:
+    """HTTP-сервер симулятора с хранилищем заказов и отправкой вебхуков."""
+
+    def __init__(self, site_url: str, host: str = '127.0.0.1', port: int = 0,
+                 config: Optional[SimulatorConfig] = None) -> None:
+        self.site_url = site_url.rstrip('/')
+        self.config = config or SimulatorConfig()
+        self.signer = PaypalSigner(self.config.paypal_webhook_id)
+        self._host = host
+        self._rng = random.Random(self.config.seed)
+        self._payments: Dict[str, Payment] = {}
+        self._captures: Dict[str, str] = {}
+        self._counters: Dict[str, int] = {name: 0 for name in (
+            'paypal_orders', 'paypal_captures', 'stripe_sessions', 'approved', 'webhooks_sent', 'webhook_retries',
+            'webhook_failures', 'api_errors')}
+        self._webhook_ms: List[float] = []
+        self._notification_ms: List[float] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._scheduler = Scheduler(self.config.webhook_workers)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f'http://{self._host}:{self._server.server_port}'
+
+    def write_ca(self, path: str) -> None:
+        """Записывает сертификат УЦ для PAYPAL_CERT_CA_FILE сервера."""
+
+        with open(path, 'wb') as f:
+            f.write(self.signer.pem(self.signer.ca))
+
+    def start(self) -> 'PaymentSimulator':
+        threading.Thread(target=self._server.serve_forever, name='payment-simulator', daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self.close()
+
+    def close(self) -> None:
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def payment(self, payment_id: str) -> Optional[Payment]:
+        with self._lock:
+            return self._payments.get(payment_id)
+
+    def approve(self, payment_id: str) -> bool:
+        """Оплата покупателем: заказ PayPal одобряется, сессия Stripe завершается, сервер получает вебхук."""
+
+        with self._lock:
+            payment = self._payments.get(payment_id)
+            if payment is None or payment.status != 'CREATED':
+                return False
+            payment.status = 'APPROVED'
+            self._counters['approved'] += 1
+        if payment.system == 'paypal':
+            order = dict(payment.data, status='APPROVED', payer=self._payer(payment.id))
+            self._emit_paypal('CHECKOUT.ORDER.APPROVED', 'checkout-order', order, 'An order has been approved by buyer')
+        else:
+            session = dict(payment.data, payment_status='paid', customer=f'cus_{payment.id[-14:]}')
+            self._emit_stripe(payment, session)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._counters,
+                'pending': sum(1 for payment in self._payments.values() if payment.notified_at is None),
+                'webhook_ms': percentiles(self._webhook_ms),
+                'order_to_notification_ms': percentiles(self._notification_ms),
+            }
+
+    def _new_id(self, length: int = 17) -> str:
+        with self._lock:
+            return ''.join(self._rng.choice(ALPHABET) for _ in range(length))
+
+    def _store(self, payment: Payment, counter: str) -> None:
+        with self._lock:
+            self._payments[payment.id] = payment
+            self._counters[counter] += 1
+        if self.config.approve_after > 0:
+            self._scheduler.call_later(self.config.approve_after, lambda: self._approve_quietly(payment.id))
+
+    def _approve_quietly(self, payment_id: str) -> None:
+        self.approve(payment_id)
+
+    def _payer(self, payment_id: str) -> Dict[str, Any]:
+        return {
+            'name': {'given_name': 'Load', 'surname': 'Tester'},
+            'email_address': f'buyer-{payment_id.lower()}@example.com',
+            'payer_id': payment_id[:13],
+            'address': {'country_code': 'RU'},
+        }
+
+    def _paypal_links(self, order_id: str) -> List[Dict[str, str]]:
+        return [
+            {'href': f'{self.url}/v2/checkout/orders/{order_id}', 'rel': 'self', 'method': 'GET'},
+            {'href': f'https://www.sandbox.paypal.com/checkoutnow?token={order_id}', 'rel': 'approve',
+             'method': 'GET'},
+            {'href': f'{self.url}/v2/checkout/orders/{order_id}', 'rel': 'update', 'method': 'PATCH'},
+            {'href': f'{self.url}/v2/checkout/orders/{order_id}/capture', 'rel': 'capture', 'method': 'POST'},
+        ]
+
+    def create_order(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        order_id = self._new_id()
+        units = [dict(unit, payee={'email_address': 'merchant@example.com', 'merchant_id': 'SIMULATORMERCH'})
+                 for unit in request.get('purchase_units', [])]
+        order = {
+            'id': order_id,
+            'intent': request.get('intent', 'CAPTURE'),
+            'status': 'CREATED',
+            'purchase_units': units,
+            'create_time': now_iso(),
+            'links': self._paypal_links(order_id),
+        }
+        self._store(Payment(order_id, 'paypal', order), 'paypal_orders')
+        return order
+
+    def capture_order(self, order_id: str) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            payment = self._payments.get(order_id)
+            if payment is None:
+                return 404, {'name': 'RESOURCE_NOT_FOUND', 'details': [{'issue': 'INVALID_RESOURCE_ID'}]}
+            if payment.status != 'APPROVED':
+                issue = 'ORDER_ALREADY_CAPTURED' if payment.status == 'COMPLETED' else 'ORDER_NOT_APPROVED'
+                return 422, {'name': 'UNPROCESSABLE_ENTITY', 'details': [{'issue': issue}]}
+            payment.status = 'COMPLETED'
+            payment.capture_id = ''.join(self._rng.choice(ALPHABET) for _ in range(17))
+            self._captures[payment.capture_id] = order_id
+            self._counters['paypal_captures'] += 1
+        unit = payment.data['purchase_units'][0]
+        amount = {'currency_code': unit['amount']['currency_code'], 'value': unit['amount']['value']}
+        capture: Dict[str, Any] = {
+            'id': payment.capture_id,
+            'status': 'COMPLETED',
+            'amount': amount,
+            'final_capture': True,
+            'seller_protection': {'status': 'ELIGIBLE'},
+            'create_time': now_iso(),
+            'update_time': now_iso(),
+            'supplementary_data': {'related_ids': {'order_id': order_id}},
+            'links': [],
+        }
+        self._scheduler.call_later(self.config.capture_after, lambda: self._emit_paypal(
+            'PAYMENT.CAPTURE.COMPLETED', 'capture', capture,
+            f'Payment completed for {amount["value"]} {amount["currency_code"]}'))
+        return 201, {
+            'id': order_id,
+            'status': 'COMPLETED',
+            'purchase_units': [{'reference_id': unit.get('reference_id'), 'payments': {'captures': [capture]}}],
+            'payer': self._payer(order_id),
+            'links': [{'href': f'{self.url}/v2/checkout/orders/{order_id}', 'rel': 'self', 'method': 'GET'}],
+        }
+
+    def create_session(self, form: Dict[str, str]) -> Dict[str, Any]:
+        session_id = 'cs_test_' + self._new_id(24).lower()
+        amount = 0
+        for key, value in form.items():
+            if key.startswith('line_items[') and key.endswith('[price_data][unit_amount]'):
+                quantity = int(form.get(key.split('[price_data]')[0] + '[quantity]', '1'))
+                amount += int(Decimal(value)) * quantity
+        session = {
+            'id': session_id,
+            'object': 'checkout.session',
+            'amount_subtotal': amount,
+            'amount_total': amount,
+            'cancel_url': form.get('cancel_url'),
+            'client_reference_id': None,
+            'currency': form.get('line_items[0][price_data][currency]', 'rub'),
+            'customer': None,
+            'livemode': False,
+            'metadata': {},
+            'mode': form.get('mode', 'payment'),
+            'payment_intent': 'pi_' + self._new_id(24).lower(),
+            'payment_method_types': [value for key, value in form.items() if key.startswith('payment_method_types')],
+            'payment_status': 'unpaid',
+            'success_url': form.get('success_url'),
+        }
+        self._store(Payment(session_id, 'stripe', session), 'stripe_sessions')
+        return session
+
+    def _emit_paypal(self, event_type: str, resource_type: str, resource: Dict[str, Any], summary: str) -> None:
+        event = {
+            'id': f'WH-{self._new_id(8)}-{self._new_id(17)}',
+            'event_version': '1.0',
+            'create_time': now_iso(),
+            'resource_type': resource_type,
+            'resource_version': '2.0',
+            'event_type': event_type,
+            'summary': summary,
+            'resource': resource,
+            'links': [],
+        }
+        body = json.dumps(event).encode('utf-8')
+        if resource_type == 'capture':
+            order_id = resource['supplementary_data']['related_ids']['order_id']
+        else:
+            order_id = resource['id']
+        final = event_type == 'PAYMENT.CAPTURE.COMPLETED'
+        self._deliver(PAYPAL_WEBHOOK_PATH, body, lambda: self.signer.headers(body, self.url + CERT_PATH),
+                      order_id if final else None)
+
+    def _emit_stripe(self, payment: Payment, session: Dict[str, Any]) -> None:
+        event = {
+            'id': 'evt_' + self._new_id(24).lower(),
+            'object': 'event',
+            'api_version': '2020-08-27',
+            'created': int(time.time()),
+            'data': {'object': session},
+            'livemode': False,
+            'pending_webhooks': 1,
+            'request': {'id': None, 'idempotency_key': None},
+            'type': 'checkout.session.completed',
+        }
+        body = json.dumps(event).encode('utf-8')
+        self._deliver(STRIPE_WEBHOOK_PATH, body,
+                      lambda: {'Stripe-Signature': stripe_signature(body, self.config.stripe_secret)}, payment.id)
+
+    def _deliver(self, path: str, body: bytes, sign: Callable[[], Dict[str, str]], completes: Optional[str],
+                 attempt: int = 1) -> None:
+        """Отправляет вебхук на сервер; completes - заказ, оплату которого вебхук завершает."""
+
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        started = time.monotonic()
+        # подпись формируется при каждой попытке, как у платёжных систем: время подписи Stripe ограничено
+        headers = {'Content-Type': 'application/json', **sign()}
+        try:
+            response = self._local.session.post(self.site_url + path, data=body, headers=headers,
+                                                timeout=self.config.webhook_timeout)
+            delivered = 200 <= response.status_code < 300
+        except requests.RequestException:
+            delivered = False
+        finished = time.monotonic()
+        with self._lock:
+            self._counters['webhooks_sent'] += 1
+            self._webhook_ms.append((finished - started) * 1000)
+            payment = self._payments.get(completes) if completes is not None else None
+            if delivered and payment is not None and payment.notified_at is None:
+                payment.notified_at = finished
+                self._notification_ms.append((finished - payment.created_at) * 1000)
+            if not delivered:
+                retry = attempt <= self.config.webhook_retries
+                self._counters['webhook_retries' if retry else 'webhook_failures'] += 1
+        if not delivered and attempt <= self.config.webhook_retries:
+            self._scheduler.call_later(2 ** (attempt - 1),
+                                       lambda: self._deliver(path, body, sign, completes, attempt + 1))
+
+    def _api_delay(self) -> Tuple[float, bool]:
+        with self._lock:
+            spread = self._rng.uniform(-self.config.jitter, self.config.jitter) if self.config.jitter else 0.0
+            failed = self._rng.random() < self.config.error_rate
+            if failed:
+                self._counters['api_errors'] += 1
+        return max(self.config.latency + spread, 0.0), failed
+
+    def _handler_class(self) -> type:
+        simulator = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self) -> None:
+                path = urlsplit(self.path).path
+                order = ORDER_PATH.match(path)
+                if path == CERT_PATH:
+                    self._send(200, simulator.signer.pem(simulator.signer.certificate), 'application/x-pem-file')
+                elif path == '/_sim/stats':
+                    self._send_json(200, simulator.stats())
+                elif order and not order.group('capture'):
+                    payment = simulator.payment(order.group('id'))
+                    if payment is None or payment.system != 'paypal':
+                        self._send_json(404, {'name': 'RESOURCE_NOT_FOUND'})
+                    else:
+                        self._send_json(200, dict(payment.data, status=payment.status))
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def do_POST(self) -> None:
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                path = urlsplit(self.path).path
+                approve = APPROVE_PATH.match(path)
+                if approve:
+                    self._send_json(200 if simulator.approve(approve.group('id')) else 404, {})
+                    return
+
+                delay, failed = simulator._api_delay()
+                if delay:
+                    time.sleep(delay)
+                authorization = self.headers.get('Authorization', '')
+                if path == '/v1/oauth2/token':
+                    if not authorization.startswith('Basic '):
+                        self._send_json(401, {'error': 'invalid_client'})
+                        return
+                    self._send_json(200, {
+                        'scope': 'https://uri.paypal.com/services/payments/payment',
+                        'access_token': 'A21AA' + simulator._new_id(40),
+                        'token_type': 'Bearer',
+                        'app_id': 'APP-SIMULATOR',
+                        'expires_in': 32400,
+                        'nonce': f'{now_iso()}{simulator._new_id(12)}',
+                    })
+                    return
+                if not authorization.startswith('Bearer '):
+                    self._send_json(401, {'error': 'invalid_token'})
+                    return
+                if failed:
+                    self._send_json(500, {'name': 'INTERNAL_SERVER_ERROR', 'error': {'type': 'api_error'}})
+                    return
+                order = ORDER_PATH.match(path)
+                if path == '/v2/checkout/orders':
+                    self._send_json(201, simulator.create_order(json.loads(raw or b'{}')))
+                elif order and order.group('capture'):
+                    self._send_json(*simulator.capture_order(order.group('id')))
+                elif path == '/v1/checkout/sessions':
+                    self._send_json(200, simulator.create_session(dict(parse_qsl(raw.decode('utf-8')))))
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def _send_json(self, status: int, data: Any) -> None:
+                self._send(status, json.dumps(data).encode('utf-8'), 'application/json')
+
+            def _send(self, status: int, body: bytes, content_type: str) -> None:
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Симулятор АПИ PayPal и Stripe')
+    parser.add_argument('--site', default='http://127.0.0.1:8000', help='Адрес сервера бота для вебхуков')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8901)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа АПИ, секунды')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Разброс задержки, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов АПИ HTTP 500')
+    parser.add_argument('--approve-after', type=float, default=0.5,
+                        help='Через сколько секунд покупатель оплачивает заказ (0 - только /_sim/approve)')
+    parser.add_argument('--capture-after', type=float, default=0.1,
+                        help='Задержка вебхука PAYMENT.CAPTURE.COMPLETED после захвата средств, секунды')
+    parser.add_argument('--paypal-webhook-id', default=os.getenv('PAYPAL_WEBHOOK_ID', 'WH-SIMULATOR'))
+    parser.add_argument('--stripe-secret', default=os.getenv('STRIPE_WHSEC_KEY', 'whsec_simulator'))
+    parser.add_argument('--ca-file', default='/tmp/payment_simulator_ca.pem',
+                        help='Файл для сертификата УЦ (PAYPAL_CERT_CA_FILE сервера)')
+    parser.add_argument('--webhook-retries', type=int, default=3)
+    parser.add_argument('--webhook-workers', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    config = SimulatorConfig(
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, approve_after=args.approve_after,
+        capture_after=args.capture_after, paypal_webhook_id=args.paypal_webhook_id, stripe_secret=args.stripe_secret,
+        webhook_retries=args.webhook_retries, webhook_workers=args.webhook_workers, seed=args.seed,
+    )
+    simulator = PaymentSimulator(args.site, args.host, args.port, config)
+    simulator.write_ca(args.ca_file)
+    print(f'Payment simulator listening on {simulator.url}, webhooks to {simulator.site_url}')
+    print(f"PAYPAL_API_URL='{simulator.url}' PAYPAL_CERT_CA_FILE='{args.ca_file}' PAYPAL_WEBHOOK_SIMULATOR=1 "
+          f"PAYPAL_WEBHOOK_ID='{config.paypal_webhook_id}'")
+    print(f"STRIPE_API_BASE='{simulator.url}' STRIPE_WHSEC_KEY='{config.stripe_secret}'")
+    try:
+        simulator.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(simulator.stats(), indent=2))
+    finally:
+        simulator.close()
+
+
+if __name__ == '__main__':
+    main()
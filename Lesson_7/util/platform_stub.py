@@ -0,0 +1,300 @@
+"""Локальная заглушка АПИ отправки сообщений OK и Jivo.
+
+Принимает запросы по адресам OkStrings.API_LINK (/graph/me/messages/{chat_id}?access_token={token})
+и JivoStrings.API_LINK (/webhooks/{key}/{token}) и отвечает как платформы. Задержка ответа и доли ошибок
+настраиваются, поэтому скорость отправки, повторы и обработку отказов в DeliveryDispatcher можно измерить
+на одной машине без сети. Исходы ответа:
+- ok - успешный ответ;
+- error - ошибка платформы: заголовок invocation-error у OK, ключ error в теле у Jivo (не повторяется);
+- throttled и unavailable - HTTP 429 и 503 (повторяются);
+- reset - соединение сбрасывается без ответа (повторяется).
+
+Все запросы записываются. Служебные адреса: GET /_stub/stats - счётчики исходов, GET /_stub/requests -
+последние записанные запросы, POST /_stub/reset - очистка записей и счётчиков.
+
+Бот направляется на заглушку переменными окружения:
+OK_API_LINK=http://127.0.0.1:8900/graph/me/messages/{chat_id}?access_token={token}
+JIVO_API_LINK=http://127.0.0.1:8900/webhooks/{key}/{token}
+
+usage: python util/platform_stub.py --port 8900 [--latency 0.05] [--jitter 0.02] [--error-rate 0.01] [--reset-rate 0.01]
+"""
+
+import argparse
+import itertools
+import json
+import random
+import re
+import socket
+import struct
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+
+OK_PATH = re.compile(r'^/graph/me/messages/(?P<chat_id>[^/?]+)$')
+JIVO_PATH = re.compile(r'^/webhooks/(?P<key>[^/?]+)/(?P<token>[^/?]+)$')
+OUTCOMES = ('ok', 'error', 'throttled', 'unavailable', 'reset')
+# ошибки, которые возвращают платформы при неверных параметрах запроса
+OK_ERROR = ('102', {'error_code': 102, 'error_msg': 'PARAM_SESSION_EXPIRED : Session expired',
+                    'error_data': None})
+JIVO_ERROR = {'code': 'invalid_client', 'message': 'Client not found'}
+
+
+@dataclass
+class StubConfig:
+    """Поведение заглушки: задержка ответа (секунды) с равномерным разбросом и доли исходов с ошибкой."""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    rates: Dict[str, float] = field(default_factory=dict)
+    seed: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class RecordedRequest:
+    """Запрос к заглушке и исход, с которым на него ответили."""
+
+    number: int
+    platform: str
+    path: str
+    query: Dict[str, List[str]]
+    body: Any
+    outcome: str
+    received_at: float
+    duration: float
+
+
+class PlatformStub:
+    """HTTP-сервер заглушки в фоновом потоке.
+
+    Исход ответа выбирается случайно по долям из конфигурации; script задаёт исходы следующих запросов явно."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, config: Optional[StubConfig] = None,
+                 history: int = 10000) -> None:
+        self.config = config or StubConfig()
+        self._host = host
+        self._rng = random.Random(self.config.seed)
+        self._scripted: Deque[str] = deque()
+        self._recorded: Deque[RecordedRequest] = deque(maxlen=history)
+        self._counters: 'Counter[Tuple[str, str]]' = Counter()
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f'http://{self._host}:{self._server.server_port}'
+
+    @property
+    def ok_link(self) -> str:
+        """Шаблон адреса для OK_API_LINK."""
+
+        return self.url + '/graph/me/messages/{chat_id}?access_token={token}'
+
+    @property
+    def jivo_link(self) -> str:
+        """Шаблон адреса для JIVO_API_LINK."""
+
+        return self.url + '/webhooks/{key}/{token}'
+
+    def start(self) -> 'PlatformStub':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='platform-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self.close()
+
+    def close(self) -> None:
+        self._server.server_close()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def script(self, *outcomes: str) -> None:
+        """Задаёт исходы следующих запросов по порядку, затем снова действуют доли из конфигурации."""
+
+        unknown = set(outcomes) - set(OUTCOMES)
+        if unknown:
+            raise ValueError(f'Unknown outcomes: {sorted(unknown)}')
+        with self._lock:
+            self._scripted.extend(outcomes)
+
+    def requests(self, platform: Optional[str] = None) -> List[RecordedRequest]:
+        with self._lock:
+            return [request for request in self._recorded if platform is None or request.platform == platform]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            platforms: Dict[str, Dict[str, int]] = {}
+            for (platform, outcome), count in self._counters.items():
+                platforms.setdefault(platform, {})[outcome] = count
+            return {
+                'requests': sum(self._counters.values()),
+                'platforms': platforms,
+                'latency': self.config.latency,
+                'jitter': self.config.jitter,
+                'rates': dict(self.config.rates),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._scripted.clear()
+            self._recorded.clear()
+            self._counters.clear()
+
+    def _choose_outcome(self) -> str:
+        with self._lock:
+            if self._scripted:
+                return self._scripted.popleft()
+            roll = self._rng.random()
+        for outcome in OUTCOMES[1:]:
+            roll -= self.config.rates.get(outcome, 0.0)
+            if roll < 0:
+                return outcome
+        return 'ok'
+
+    def _delay(self) -> float:
+        with self._lock:
+            spread = self._rng.uniform(-self.config.jitter, self.config.jitter) if self.config.jitter else 0.0
+        return max(self.config.latency + spread, 0.0)
+
+    def _record(self, platform: str, path: str, query: Dict[str, List[str]], body: Any, outcome: str,
+                received_at: float, duration: float) -> None:
+        with self._lock:
+            self._counters[(platform, outcome)] += 1
+            self._recorded.append(RecordedRequest(next(self._numbers), platform, path, query, body, outcome,
+                                                  received_at, duration))
+
+    def _handler_class(self) -> type:
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self) -> None:
+                if self.path == '/_stub/stats':
+                    self._send_json(200, stub.stats())
+                elif self.path.startswith('/_stub/requests'):
+                    platform = parse_qs(urlsplit(self.path).query).get('platform', [None])[0]
+                    self._send_json(200, [asdict(request) for request in stub.requests(platform)])
+                else:
+                    self._send_json(404, {'error': 'not found'})
+
+            def do_POST(self) -> None:
+                received_at = time.time()
+                started = time.monotonic()
+                raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                parts = urlsplit(self.path)
+                if parts.path == '/_stub/reset':
+                    stub.reset()
+                    self._send_json(200, {})
+                    return
+                if OK_PATH.match(parts.path):
+                    platform = 'ok'
+                elif JIVO_PATH.match(parts.path):
+                    platform = 'jivo'
+                else:
+                    self._send_json(404, {'error': 'not found'})
+                    return
+                try:
+                    body = json.loads(raw or b'null')
+                except ValueError:
+                    body = raw.decode('utf-8', 'replace')
+
+                outcome = stub._choose_outcome()
+                delay = stub._delay()
+                if delay:
+                    time.sleep(delay)
+                stub._record(platform, parts.path, parse_qs(parts.query), body, outcome, received_at,
+                             time.monotonic() - started)
+                if outcome == 'reset':
+                    self._reset()
+                elif outcome == 'throttled':
+                    self._send_json(429, {'error': 'too many requests'}, {'Retry-After': '1'})
+                elif outcome == 'unavailable':
+                    self._send_json(503, {'error': 'service unavailable'})
+                elif platform == 'ok':
+                    self._answer_ok(parts.path, outcome)
+                else:
+                    self._send_json(200, {'error': JIVO_ERROR} if outcome == 'error' else {})
+
+            def _answer_ok(self, path: str, outcome: str) -> None:
+                if outcome == 'error':
+                    code, error = OK_ERROR
+                    self._send_json(200, error, {'invocation-error': code})
+                    return
+                match = OK_PATH.match(path)
+                assert match is not None
+                chat_id = match.group('chat_id')
+                self._send_json(200, {'chat_id': chat_id, 'message_id': f'mid:stub{next(stub._numbers)}'})
+
+            def _send_json(self, status: int, data: Any, headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json;charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # клиент уже закрыл соединение по таймауту
+                    pass
+
+            def _reset(self) -> None:
+                # SO_LINGER с нулевым таймаутом: закрытие сокета отправляет RST вместо FIN
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                self.close_connection = True
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Заглушка АПИ отправки сообщений OK и Jivo')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, секунды')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Разброс задержки, секунды')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='Доля ошибок платформы (invocation-error у OK, error в теле у Jivo)')
+    parser.add_argument('--throttled-rate', type=float, default=0.0, help='Доля ответов HTTP 429')
+    parser.add_argument('--unavailable-rate', type=float, default=0.0, help='Доля ответов HTTP 503')
+    parser.add_argument('--reset-rate', type=float, default=0.0, help='Доля сброшенных соединений')
+    parser.add_argument('--history', type=int, default=10000, help='Сколько последних запросов хранить')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    if args.error_rate + args.throttled_rate + args.unavailable_rate + args.reset_rate > 1:
+        parser.error('sum of rates must not exceed 1')
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    rates = {'error': args.error_rate, 'throttled': args.throttled_rate,
+             'unavailable': args.unavailable_rate, 'reset': args.reset_rate}
+    stub = PlatformStub(args.host, args.port, StubConfig(args.latency, args.jitter, rates, args.seed), args.history)
+    print(f'Platform stub listening on {stub.url}')
+    print(f"OK_API_LINK='{stub.ok_link}'")
+    print(f"JIVO_API_LINK='{stub.jivo_link}'")
+    try:
+        stub.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(stub.stats(), indent=2))
+    finally:
+        stub.close()
+
+
+if __name__ == '__main__':
+    main()